@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+SPOOL_DIR_NAME = 'obd-speech-spool'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 3600.0
+TEMP_PREFIX = '.tmp-'
+# In-progress temp files older than this were left by crashed writers
+STALE_TEMP_AGE = 600.0
+
+
+def _mount_type(path):
+    """Return the filesystem type of the mount containing path (Linux only)."""
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, best_type = '', None
+    for mount_point, fs_type in mounts:
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                and len(mount_point) > len(best):
+            best, best_type = mount_point, fs_type
+    return best_type
+
+
+def default_spool_root():
+    """
+    Pick the spool directory: SPEECH_SPOOL_DIR if set, otherwise a tmpfs
+    (/dev/shm or the runtime dir) when available, otherwise the temp dir.
+    """
+    configured = os.environ.get('SPEECH_SPOOL_DIR')
+    if configured:
+        return configured
+
+    for base in ('/dev/shm', os.environ.get('XDG_RUNTIME_DIR')):
+        if base and os.path.isdir(base) and os.access(base, os.W_OK) \
+                and _mount_type(base) == 'tmpfs':
+            return os.path.join(base, SPOOL_DIR_NAME)
+
+    return os.path.join(tempfile.gettempdir(), SPOOL_DIR_NAME)
+
+
+class AtomicOutput:
+    """
+    Write a file through a temp file in the same directory.
+
+    Writers produce temp_path and call commit() to rename it to path;
+    leaving the context without committing removes the temp file, so
+    readers never see a partial output. The temp name keeps the original
+    extension so tools that infer the format from it still work.
+    """
+
+    def __init__(self, path, on_commit=None):
+        self.path = os.path.abspath(path)
+        directory, name = os.path.split(self.path)
+        self.temp_path = os.path.join(directory, f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}-{name}")
+        self.committed = False
+        self._on_commit = on_commit
+
+    def commit(self):
+        os.replace(self.temp_path, self.path)
+        self.committed = True
+        if self._on_commit is not None:
+            self._on_commit(self.path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed and os.path.exists(self.temp_path):
+            try:
+                os.unlink(self.temp_path)
+            except OSError:
+                pass
+
+
+def atomic_output(path):
+    """Return an AtomicOutput for an explicit destination path."""
+    return AtomicOutput(path)
+
+
+class AudioSpool:
+    """
+    Directory for synthesized and converted audio with a byte and age budget.
+
+    Files are named collision-free, written atomically and evicted least
+    recently used first (by mtime; touch() marks a file as used) once the
+    spool exceeds max_bytes, or when older than max_age seconds.
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_age=None):
+        self.root = root or default_spool_root()
+        self.max_bytes = int(max_bytes if max_bytes is not None else
+                             os.environ.get('SPEECH_SPOOL_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.max_age = float(max_age if max_age is not None else
+                             os.environ.get('SPEECH_SPOOL_MAX_AGE', DEFAULT_MAX_AGE))
+        os.makedirs(self.root, exist_ok=True)
+
+    def new_path(self, prefix='audio', suffix='.wav'):
+        """Return a unique path in the spool (the file is not created)."""
+        name = f"{prefix}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:12]}{suffix}"
+        return os.path.join(self.root, name)
+
+    def output(self, prefix='audio', suffix='.wav'):
+        """
+        Reserve a new spool file as an AtomicOutput; the budget is enforced
+        once it is committed.
+        """
+        return AtomicOutput(self.new_path(prefix, suffix),
+                            on_commit=lambda path: self.enforce(keep=path))
+
+    def owns(self, path):
+        """True when path lies inside the spool directory."""
+        root = os.path.realpath(self.root)
+        return os.path.realpath(path).startswith(root + os.sep)
+
+    def touch(self, path):
+        """Mark a spool file as recently used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def release(self, path):
+        """Delete a spool file that is no longer needed."""
+        if self.owns(path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        entries = []
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.is_file(follow_symlinks=False) or entry.name.endswith('.lock'):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    entries.append((entry.path, entry.name, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    @contextmanager
+    def _locked(self):
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(os.path.join(self.root, '.spool.lock'), 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def enforce(self, keep=None):
+        """
+        Apply the age and byte budget.
+        :param keep: Path that must not be evicted (e.g. the file just written)
+        :return: Dictionary with the number of files and bytes evicted
+        """
+        now = time.time()
+        evicted_files = 0
+        evicted_bytes = 0
+        keep = os.path.abspath(keep) if keep else None
+
+        with self._locked():
+            live = []
+            for path, name, size, mtime in self._entries():
+                age = now - mtime
+                if name.startswith(TEMP_PREFIX):
+                    expired = age > STALE_TEMP_AGE
+                else:
+                    expired = age > self.max_age and os.path.abspath(path) != keep
+                if expired:
+                    if self._remove(path):
+                        evicted_files += 1
+                        evicted_bytes += size
+                elif not name.startswith(TEMP_PREFIX):
+                    live.append((mtime, path, size))
+
+            total = sum(size for _, _, size in live)
+            for mtime, path, size in sorted(live):
+                if total <= self.max_bytes:
+                    break
+                if os.path.abspath(path) == keep:
+                    continue
+                if self._remove(path):
+                    total -= size
+                    evicted_files += 1
+                    evicted_bytes += size
+
+        return {"evicted_files": evicted_files, "evicted_bytes": evicted_bytes}
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+            return True
+        except OSError:
+            return False
+
+    def stats(self):
+        """Return spool usage statistics."""
+        now = time.time()
+        entries = [e for e in self._entries() if not e[1].startswith(TEMP_PREFIX)]
+        total = sum(size for _, _, size, _ in entries)
+        oldest = min((mtime for _, _, _, mtime in entries), default=None)
+        return {
+            "root": self.root,
+            "filesystem": _mount_type(self.root),
+            "files": len(entries),
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "usage": round(total / self.max_bytes, 4) if self.max_bytes else None,
+            "oldest_age_s": round(now - oldest, 1) if oldest is not None else None,
+            "max_age_s": self.max_age,
+            "in_progress": sum(1 for e in self._entries() if e[1].startswith(TEMP_PREFIX))
+        }
+
+
+_default_spool = None
+
+
+def get_spool():
+    """Return the process-wide spool configured from the environment."""
+    global _default_spool
+    if _default_spool is None:
+        _default_spool = AudioSpool()
+    return _default_spool
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Inspect or clean the speech audio spool')
+    parser.add_argument('--stats', action='store_true', help='Print spool usage statistics')
+    parser.add_argument('--clean', action='store_true', help='Apply the byte and age budget now')
+    parser.add_argument('--dir', help='Spool directory (default: SPEECH_SPOOL_DIR or tmpfs)')
+    args = parser.parse_args()
+
+    spool = AudioSpool(args.dir)
+    result = {}
+    if args.clean:
+        result["clean"] = spool.enforce()
+    if args.stats or not args.clean:
+        result["stats"] = spool.stats()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
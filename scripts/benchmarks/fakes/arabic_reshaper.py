@@ -0,0 +1,5 @@
+"""Stand-in for arabic_reshaper used by the benchmark suite."""
+
+
+def reshape(text):
+    return text
@@ -0,0 +1,5 @@
+"""Stand-in for python-bidi used by the benchmark suite."""
+
+
+def get_display(text):
+    return text[::-1]
@@ -0,0 +1,25 @@
+"""Helpers shared by the fake piper, espeak-ng and ffmpeg executables."""
+import math
+import wave
+from array import array
+
+
+def tone_pcm(duration, sample_rate=22050):
+    """Return a deterministic 16-bit mono tone of the given duration as bytes."""
+    frames = int(duration * sample_rate)
+    step = 2 * math.pi * 220 / sample_rate
+    return array('h', (int(8000 * math.sin(i * step)) for i in range(frames))).tobytes()
+
+
+def write_tone(path, duration, sample_rate=22050):
+    """Write a deterministic 16-bit mono tone of the given duration."""
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(tone_pcm(duration, sample_rate))
+
+
+def speech_duration(text, chars_per_second=15.0):
+    """Approximate spoken duration of text."""
+    return max(0.2, len(text) / chars_per_second)
@@ -0,0 +1,93 @@
+"""
+Stand-in for the vosk module used by the benchmark suite.
+
+Decoding cost is simulated as a fixed amount of work per audio chunk so
+that the surrounding I/O, chunking and JSON handling can be measured
+without models.
+"""
+import json
+import hashlib
+
+WORDS = ["check", "engine", "light", "coolant", "temperature", "speed",
+         "rpm", "battery", "voltage", "oil", "pressure", "fuel"]
+
+# Bytes of audio after which a partial result is finalized (~1 s at 16 kHz)
+FINALIZE_BYTES = 32000
+
+
+class Model:
+    def __init__(self, model_path=None, lang=None):
+        self.model_path = model_path or lang
+
+
+class KaldiRecognizer:
+    def __init__(self, model, sample_rate, grammar=None):
+        self.model = model
+        self.sample_rate = sample_rate
+        self._pending = 0
+        self._words = []
+        self._max_alternatives = 0
+        self._emit_words = False
+        # Like Vosk, word times count from the first audio fed to the recognizer
+        self._fed = 0
+        self._utterance_start = 0
+        # A grammar-restricted recognizer hears its first phrase
+        phrases = [p for p in json.loads(grammar) if p != "[unk]"] if grammar else []
+        self._grammar_text = phrases[0] if phrases else None
+
+    def _confidence(self):
+        # Small models are less sure of themselves, so re-decoding can be exercised
+        return 0.5 if 'small' in str(self.model.model_path) else 0.9
+
+    def SetWords(self, enabled):
+        self._emit_words = bool(enabled)
+
+    def SetMaxAlternatives(self, count):
+        self._max_alternatives = count
+
+    def AcceptWaveform(self, data):
+        # Deterministic busy work proportional to the chunk size
+        digest = hashlib.sha1(bytes(data)).digest()
+        self._words.append(WORDS[digest[0] % len(WORDS)])
+        self._pending += len(data)
+        self._fed += len(data)
+        if self._pending >= FINALIZE_BYTES:
+            self._pending = 0
+            return True
+        return False
+
+    def _result(self):
+        words, self._words = self._words, []
+        text = self._grammar_text if self._grammar_text and words else " ".join(words[:3])
+        result = {"text": text}
+        if self._emit_words:
+            result["result"] = []
+            start = self._utterance_start / (2.0 * self.sample_rate)
+            for word in text.split():
+                result["result"].append({
+                    "word": word, "start": start,
+                    "end": start + 0.3, "conf": self._confidence()
+                })
+                start += 0.3
+        self._utterance_start = self._fed
+        if self._max_alternatives:
+            return json.dumps({"alternatives": [
+                {"text": text, "confidence": 200.0}]})
+        return json.dumps(result)
+
+    def Result(self):
+        return self._result()
+
+    def PartialResult(self):
+        return json.dumps({"partial": " ".join(self._words[:3])})
+
+    def FinalResult(self):
+        return self._result()
+
+    def Reset(self):
+        self._pending = 0
+        self._words = []
+
+
+def SetLogLevel(level):
+    pass
@@ -0,0 +1,103 @@
+"""Synthetic audio fixtures and helpers shared by the benchmark tools."""
+import os
+import sys
+import math
+import wave
+import random
+import shutil
+import platform
+from array import array
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, 'fakes')
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def use_fakes():
+    """
+    Make the stand-in fakes shadow the real vosk/arabic_reshaper/bidi
+    modules and binaries, in this process and in child processes.
+    """
+    sys.path.insert(0, FAKES_DIR)
+    os.environ['PATH'] = FAKES_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        p for p in (FAKES_DIR, os.environ.get('PYTHONPATH')) if p)
+
+
+def write_synthetic_speech(path, duration, sample_rate=16000, channels=1, seed=0):
+    """
+    Write a deterministic speech-like WAV: syllable-rate amplitude-modulated
+    tones with background noise.
+    """
+    rng = random.Random(seed)
+    frames = int(duration * sample_rate)
+    samples = array('h')
+    for i in range(frames):
+        t = i / sample_rate
+        envelope = 0.5 * (1 + math.sin(2 * math.pi * 4 * t))
+        voiced = math.sin(2 * math.pi * 180 * t) + 0.5 * math.sin(2 * math.pi * 720 * t)
+        value = int(6000 * envelope * voiced + rng.gauss(0, 300))
+        value = max(-32768, min(32767, value))
+        for _ in range(channels):
+            samples.append(value)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.tobytes())
+
+
+def wav_duration(path):
+    with wave.open(path, 'rb') as wf:
+        return wf.getnframes() / float(wf.getframerate())
+
+
+def install_fake_piper(root):
+    """Create a piper install with the fake executable and empty voices under root."""
+    piper_dir = os.path.join(root, 'piper')
+    os.makedirs(os.path.join(piper_dir, 'voices'), exist_ok=True)
+    shutil.copy(os.path.join(FAKES_DIR, 'piper'), os.path.join(piper_dir, 'piper'))
+    shutil.copy(os.path.join(FAKES_DIR, 'fake_audio.py'), piper_dir)
+    os.chmod(os.path.join(piper_dir, 'piper'), 0o755)
+    for voice in ('en_US-ryan-high.onnx', 'ar_JO-kareem-medium.onnx'):
+        open(os.path.join(piper_dir, 'voices', voice), 'wb').close()
+    return piper_dir
+
+
+def prepare_fixtures(root):
+    """Create audio fixtures and a fake piper install under root."""
+    fixtures = {}
+    for seconds in (2, 10, 30):
+        path = os.path.join(root, f'speech_{seconds}s.wav')
+        write_synthetic_speech(path, seconds, seed=seconds)
+        fixtures[f'speech_{seconds}s'] = path
+
+    path = os.path.join(root, 'speech_10s_44k_stereo.wav')
+    write_synthetic_speech(path, 10, sample_rate=44100, channels=2, seed=44)
+    fixtures['speech_10s_44k_stereo'] = path
+
+    fixtures['piper_dir'] = install_fake_piper(root)
+    fixtures['output_dir'] = os.path.join(root, 'out')
+    os.makedirs(fixtures['output_dir'], exist_ok=True)
+    return fixtures
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count()
+    }
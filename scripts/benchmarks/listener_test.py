@@ -0,0 +1,82 @@
+"""
+Check the wake phrase listener on back-to-back wake phrases.
+
+Feeds a PCM stream with several bursts of speech separated by silence
+through KeywordListener. Each burst is a wake phrase with a command spoken
+in the same breath, so every burst must produce a wake event followed by
+a transcript of the command; a burst that only wakes the listener means
+the command audio after the keyword was lost. The report lists the events
+and the listener's stats.
+
+Usage:
+    python scripts/benchmarks/listener_test.py --fakes
+    python scripts/benchmarks/listener_test.py --fakes --bursts 5
+"""
+import io
+import os
+import sys
+import json
+import wave
+import argparse
+import tempfile
+
+from fixtures import machine_info, use_fakes, write_synthetic_speech
+
+SAMPLE_RATE = 16000
+
+
+def burst_stream(bursts, burst_seconds, gap_seconds):
+    """Raw s16le PCM: silence, then bursts of synthetic speech each followed by silence."""
+    with tempfile.TemporaryDirectory(prefix='speech_listener_') as root:
+        stream = bytearray(b'\0' * int(gap_seconds * SAMPLE_RATE) * 2)
+        for index in range(bursts):
+            path = os.path.join(root, f'burst_{index}.wav')
+            write_synthetic_speech(path, burst_seconds, seed=index)
+            with wave.open(path, 'rb') as wf:
+                stream.extend(wf.readframes(wf.getnframes()))
+            stream.extend(b'\0' * int(gap_seconds * SAMPLE_RATE) * 2)
+    return bytes(stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that commands spoken with the wake phrase are transcribed')
+    parser.add_argument('--bursts', type=int, default=2,
+                        help='Wake phrase + command bursts in a row (default 2)')
+    parser.add_argument('--burst-seconds', type=float, default=2.0,
+                        help='Length of each burst in seconds (default 2)')
+    parser.add_argument('--gap-seconds', type=float, default=1.5,
+                        help='Silence between bursts in seconds (default 1.5)')
+    parser.add_argument('--keyword', default='hey car', help='Wake phrase (default "hey car")')
+    parser.add_argument('--fakes', action='store_true',
+                        help='Use the benchmark fakes instead of real models')
+    args = parser.parse_args()
+
+    if args.fakes:
+        use_fakes()
+    from voice_to_text import KeywordListener
+
+    out = io.StringIO()
+    listener = KeywordListener('en', [args.keyword], out=out)
+    stats = listener.run(io.BytesIO(burst_stream(args.bursts, args.burst_seconds,
+                                                 args.gap_seconds)))
+    events = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    wakes = [e for e in events if e["event"] == "wake"]
+    commands = [e for e in events if e["event"] == "transcript" and e["text"]]
+    ok = len(wakes) == args.bursts and len(commands) == args.bursts
+    report = {
+        "machine": machine_info(),
+        "bursts": args.bursts,
+        "wakes": len(wakes),
+        "commands": len(commands),
+        "passed": ok,
+        "events": [e for e in events if e["event"] not in ("listening", "stats")],
+        "stats": stats
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
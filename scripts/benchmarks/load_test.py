@@ -0,0 +1,525 @@
+"""
+Load generator for the speech scripts: simulates concurrent voice chat turns.
+
+Each turn transcribes a driver's utterance and then synthesizes a reply,
+the way the NestJS backend does. Turns arrive open-loop (Poisson) at each
+of the offered rates in turn, with a configurable mix of audio lengths,
+languages and reply lengths. For every rate step the report has latency
+percentiles (including queueing), throughput, error rate and CPU/memory
+samples, and the saturation point is the last rate that met the latency
+objective without errors or falling behind.
+
+Usage:
+    python scripts/benchmarks/load_test.py --fakes --rates 1 2 4 8
+    python scripts/benchmarks/load_test.py --rates 0.2 0.5 1 --step-duration 120 \\
+        --audio-mix 3:0.6,10:0.4 --language-mix en:0.5,ar:0.5 --slo 6
+
+By default the real scripts, models and binaries are used; --fakes runs
+against the stand-ins in benchmarks/fakes to check the harness itself.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import (SCRIPTS_DIR, install_fake_piper, machine_info, percentile,
+                      use_fakes, write_synthetic_speech)
+
+REPLY_SENTENCES = {
+    'en': [
+        "Your coolant temperature is ninety two degrees.",
+        "Engine speed is three thousand RPM.",
+        "Battery voltage is normal.",
+        "The code P0301 indicates a misfire in cylinder one.",
+        "Please pull over safely and let the engine cool down.",
+    ],
+    'ar': [
+        "درجة حرارة سائل التبريد اثنان وتسعون درجة.",
+        "سرعة المحرك ثلاثة آلاف دورة في الدقيقة.",
+        "جهد البطارية طبيعي.",
+        "الرمز P0301 يشير إلى خلل في الأسطوانة الأولى.",
+        "يرجى التوقف بأمان وترك المحرك ليبرد.",
+    ],
+}
+
+
+def parse_mix(spec, cast=str):
+    """Parse 'value:weight,value:weight' into [(value, weight)]."""
+    mix = []
+    for item in spec.split(','):
+        value, _, weight = item.partition(':')
+        mix.append((cast(value), float(weight or 1.0)))
+    return mix
+
+
+def pick(rng, mix):
+    values, weights = zip(*mix)
+    return rng.choices(values, weights)[0]
+
+
+def reply_text(language, length):
+    """Build a reply of about length characters from the sentence corpus."""
+    sentences = REPLY_SENTENCES.get(language, REPLY_SENTENCES['en'])
+    parts = []
+    i = 0
+    while sum(len(p) + 1 for p in parts) < length:
+        parts.append(sentences[i % len(sentences)])
+        i += 1
+    return " ".join(parts)
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "p99_s": round(percentile(values, 99), 4),
+        "max_s": round(max(values), 4),
+        "mean_s": round(sum(values) / len(values), 4)
+    }
+
+
+class SubprocessDriver:
+    """Run each stage as its own script process, as the backend does."""
+
+    def __init__(self, tts_script, piper_dir=None):
+        self.stt_cmd = [sys.executable, os.path.join(SCRIPTS_DIR, 'voice_to_text.py')]
+        self.tts_cmd = [sys.executable, os.path.join(SCRIPTS_DIR, f'{tts_script}.py')]
+        if piper_dir and tts_script == 'piper_tts':
+            self.tts_cmd += ['--script-dir', piper_dir]
+
+    def _run(self, cmd, text=None):
+        completed = subprocess.run(cmd, input=text, capture_output=True,
+                                   text=True, encoding='utf-8')
+        try:
+            result = json.loads(completed.stdout)
+        except ValueError:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1]
+                               if completed.stderr.strip() else
+                               f"exit status {completed.returncode}")
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'failed'))
+        return result
+
+    def transcribe(self, path, language):
+        return self._run(self.stt_cmd + [path, '--language', language, '--output', 'json'])
+
+    def synthesize(self, text, language):
+        return self._run(self.tts_cmd + ['--file', '-', '--language', language,
+                                         '--format', 'json'], text)
+
+
+class LibraryDriver:
+    """Call the library functions in this process from worker threads."""
+
+    def __init__(self, tts_script, piper_dir=None):
+        from voice_to_text import process_audio_file
+        self.process_audio_file = process_audio_file
+        if tts_script == 'piper_tts':
+            from piper_tts import PiperTTS
+            tts = PiperTTS(piper_dir)
+            self._synthesize = lambda text, language: tts.text_to_speech_file(text, language)
+        else:
+            from tts_router import TTSRouter
+            router = TTSRouter()
+            self._synthesize = lambda text, language: router.synthesize(text, language)
+
+    @staticmethod
+    def _check(result):
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'failed'))
+        return result
+
+    def transcribe(self, path, language):
+        return self._check(self.process_audio_file(path, language))
+
+    def synthesize(self, text, language):
+        return self._check(self._synthesize(text, language))
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Sample host CPU, host memory and RSS periodically.
+
+    rss_bytes is the RSS of the load generator and every live process below
+    it, so in subprocess mode it covers the speech scripts (and the piper or
+    ffmpeg processes they start), not just the generator.
+    """
+
+    def __init__(self, interval, in_flight):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.in_flight = in_flight
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._start = time.perf_counter()
+
+    @staticmethod
+    def _cpu_times():
+        try:
+            with open('/proc/stat', 'r') as f:
+                fields = [int(v) for v in f.readline().split()[1:]]
+            idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+            return sum(fields), idle
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _process_rss(pid):
+        """RSS of one process in bytes, or None once it has exited."""
+        try:
+            with open(f'/proc/{pid}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def _descendants(root):
+        """PIDs of the live processes below root."""
+        children = {}
+        try:
+            pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+        except OSError:
+            return []
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/stat', 'r') as f:
+                    # The command name may contain spaces; fields resume after ')'
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(pid)
+        found = []
+        pending = [root]
+        while pending:
+            for child in children.get(pending.pop(), []):
+                found.append(child)
+                pending.append(child)
+        return found
+
+    @classmethod
+    def _memory(cls):
+        """
+        Return (host memory in use, own RSS, RSS of own process tree, live
+        descendant processes), in bytes where available.
+        """
+        used = None
+        try:
+            with open('/proc/meminfo', 'r') as f:
+                info = {line.split(':')[0]: int(line.split()[1]) * 1024 for line in f}
+            used = info['MemTotal'] - info.get('MemAvailable', info.get('MemFree', 0))
+        except (OSError, ValueError, KeyError):
+            pass
+        own = cls._process_rss(os.getpid())
+        descendants = cls._descendants(os.getpid())
+        tree = own
+        if own is not None:
+            tree += sum(rss for rss in map(cls._process_rss, descendants) if rss)
+        return used, own, tree, len(descendants)
+
+    def run(self):
+        previous = self._cpu_times()
+        while not self._stop_event.wait(self.interval):
+            current = self._cpu_times()
+            cpu = None
+            if previous and current and current[0] > previous[0]:
+                total = current[0] - previous[0]
+                cpu = round(1.0 - (current[1] - previous[1]) / float(total), 4)
+            previous = current
+            used, own_rss, rss, processes = self._memory()
+            self.samples.append({
+                "t": round(time.perf_counter() - self._start, 2),
+                "cpu": cpu,
+                "mem_used_bytes": used,
+                "rss_bytes": rss,
+                "own_rss_bytes": own_rss,
+                "child_processes": processes,
+                "in_flight": self.in_flight()
+            })
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def window(self, start, end):
+        """Summarize the samples taken between two sampler-relative times."""
+        samples = [s for s in self.samples if start <= s["t"] <= end]
+        cpu = [s["cpu"] for s in samples if s["cpu"] is not None]
+        mem = [s["mem_used_bytes"] for s in samples if s["mem_used_bytes"] is not None]
+        rss = [s["rss_bytes"] for s in samples if s["rss_bytes"] is not None]
+        own_rss = [s["own_rss_bytes"] for s in samples if s["own_rss_bytes"] is not None]
+        return {
+            "samples": len(samples),
+            "cpu_avg": round(sum(cpu) / len(cpu), 4) if cpu else None,
+            "cpu_max": max(cpu) if cpu else None,
+            "mem_used_max_bytes": max(mem) if mem else None,
+            "rss_max_bytes": max(rss) if rss else None,
+            "own_rss_max_bytes": max(own_rss) if own_rss else None,
+            "child_processes_max": max((s["child_processes"] for s in samples), default=0),
+            "in_flight_max": max((s["in_flight"] for s in samples), default=0)
+        }
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+
+class LoadTest:
+    """Drive open-loop voice chat turns at a series of arrival rates."""
+
+    def __init__(self, driver, audio, args):
+        self.driver = driver
+        self.audio = audio
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.audio_mix = parse_mix(args.audio_mix, float)
+        self.language_mix = parse_mix(args.language_mix)
+        self.reply_mix = parse_mix(args.reply_mix, int)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def in_flight(self):
+        return self._in_flight
+
+    def turn(self, scheduled, audio_seconds, language, reply_chars):
+        """One voice chat turn; latency counts from the scheduled arrival."""
+        with self._lock:
+            self._in_flight += 1
+        record = {"language": language, "audio_s": audio_seconds,
+                  "queue_wait_s": time.perf_counter() - scheduled}
+        try:
+            start = time.perf_counter()
+            self.driver.transcribe(self.audio[audio_seconds], language)
+            record["stt_s"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = self.driver.synthesize(reply_text(language, reply_chars), language)
+            record["tts_s"] = time.perf_counter() - start
+            if result.get('file_path') and not self.args.keep_audio:
+                try:
+                    os.unlink(result['file_path'])
+                except OSError:
+                    pass
+            record["ok"] = True
+        except Exception as e:
+            record["ok"] = False
+            record["error"] = str(e)[:200]
+        finally:
+            record["turn_s"] = time.perf_counter() - scheduled
+            with self._lock:
+                self._in_flight -= 1
+        return record
+
+    def step(self, rate, pool, sampler):
+        """Offer turns at rate for step_duration seconds and wait for them."""
+        window_start = sampler.elapsed()
+        start = time.perf_counter()
+        end = start + self.args.step_duration
+        futures = []
+        next_arrival = start
+        while True:
+            next_arrival += self.rng.expovariate(rate)
+            if next_arrival >= end:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(
+                self.turn, next_arrival, pick(self.rng, self.audio_mix),
+                pick(self.rng, self.language_mix), pick(self.rng, self.reply_mix)))
+
+        records = []
+        deadline = end + self.args.drain_timeout
+        for future in futures:
+            try:
+                records.append(future.result(timeout=max(0.0, deadline - time.perf_counter())))
+            except Exception:
+                records.append({"ok": False, "error": "not finished before drain timeout"})
+        elapsed = time.perf_counter() - start
+        return self.report(rate, records, elapsed, sampler.window(window_start, sampler.elapsed()))
+
+    def report(self, rate, records, elapsed, resources):
+        ok = [r for r in records if r.get("ok")]
+        errors = {}
+        for r in records:
+            if not r.get("ok"):
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        error_rate = (len(records) - len(ok)) / float(len(records)) if records else 0.0
+        turn_latency = summarize([r["turn_s"] for r in ok])
+        throughput = len(ok) / elapsed if elapsed else 0.0
+
+        reasons = []
+        if error_rate > self.args.max_error_rate:
+            reasons.append(f"error rate {error_rate:.1%}")
+        if turn_latency and turn_latency["p95_s"] > self.args.slo:
+            reasons.append(f"p95 {turn_latency['p95_s']}s over {self.args.slo}s")
+        if records and len(ok) < 0.9 * len(records):
+            reasons.append("completed under 90% of offered turns")
+
+        return {
+            "offered_rate": rate,
+            "duration_s": round(elapsed, 2),
+            "turns": len(records),
+            "completed": len(ok),
+            "error_rate": round(error_rate, 4),
+            "errors": errors,
+            "throughput_turns_s": round(throughput, 3),
+            "latency": {
+                "turn": turn_latency,
+                "queue_wait": summarize([r["queue_wait_s"] for r in ok]),
+                "stt": summarize([r["stt_s"] for r in ok]),
+                "tts": summarize([r["tts_s"] for r in ok])
+            },
+            "resources": resources,
+            "saturated": bool(reasons),
+            "saturation_reasons": reasons
+        }
+
+    def run(self):
+        sampler = ResourceSampler(self.args.sample_interval, self.in_flight)
+        sampler.start()
+        steps = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as pool:
+                for rate in self.args.rates:
+                    print(f"Offering {rate} turns/s for {self.args.step_duration}s...",
+                          file=sys.stderr)
+                    steps.append(self.step(rate, pool, sampler))
+                    if steps[-1]["saturated"] and not self.args.keep_going:
+                        break
+        finally:
+            sampler.stop()
+
+        sustainable = [s["offered_rate"] for s in steps if not s["saturated"]]
+        first_saturated = next((s for s in steps if s["saturated"]), None)
+        return {
+            "machine": machine_info(),
+            "config": {
+                "mode": self.args.mode,
+                "tts_script": self.args.tts_script,
+                "in_process": self.args.in_process,
+                "fakes": self.args.fakes,
+                "audio_mix": self.audio_mix,
+                "language_mix": self.language_mix,
+                "reply_mix": self.reply_mix,
+                "step_duration_s": self.args.step_duration,
+                "slo_p95_s": self.args.slo,
+                "max_in_flight": self.args.max_in_flight
+            },
+            "steps": steps,
+            "saturation": {
+                "max_sustainable_rate": max(sustainable) if sustainable else None,
+                "saturated_at": first_saturated["offered_rate"] if first_saturated else None,
+                "reasons": first_saturated["saturation_reasons"] if first_saturated else []
+            },
+            "timeline": sampler.samples
+        }
+
+
+def print_table(report):
+    header = (f"{'rate':>6}{'turns':>7}{'ok':>6}{'err%':>7}{'tput':>8}"
+              f"{'p50':>8}{'p95':>8}{'p99':>8}{'cpu':>7}{'sat':>5}")
+    print(header, file=sys.stderr)
+    print('-' * len(header), file=sys.stderr)
+    for s in report["steps"]:
+        lat = s["latency"]["turn"] or {}
+        cpu = s["resources"]["cpu_avg"]
+        print(f"{s['offered_rate']:>6}{s['turns']:>7}{s['completed']:>6}"
+              f"{s['error_rate'] * 100:>7.1f}{s['throughput_turns_s']:>8.2f}"
+              f"{lat.get('p50_s', 0):>8.2f}{lat.get('p95_s', 0):>8.2f}{lat.get('p99_s', 0):>8.2f}"
+              f"{(cpu or 0) * 100:>6.0f}%{'yes' if s['saturated'] else 'no':>5}",
+              file=sys.stderr)
+    saturation = report["saturation"]
+    print(f"Max sustainable rate: {saturation['max_sustainable_rate']} turns/s"
+          + (f" (saturated at {saturation['saturated_at']}: "
+             f"{'; '.join(saturation['reasons'])})" if saturation['saturated_at'] else ""),
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate concurrent voice chat turns (STT then TTS) to find saturation')
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.5, 1, 2, 4],
+                        help='Offered turn arrival rates (turns/s), run in order')
+    parser.add_argument('--step-duration', type=float, default=30.0,
+                        help='Seconds each rate is offered (default 30)')
+    parser.add_argument('--drain-timeout', type=float, default=60.0,
+                        help='Seconds to wait for in-flight turns after a step')
+    parser.add_argument('--audio-mix', default='2:0.5,5:0.3,10:0.2',
+                        help="Utterance lengths in seconds with weights (default '2:0.5,5:0.3,10:0.2')")
+    parser.add_argument('--language-mix', default='en:0.7,ar:0.3',
+                        help="Languages with weights (default 'en:0.7,ar:0.3')")
+    parser.add_argument('--reply-mix', default='60:0.5,250:0.4,600:0.1',
+                        help="Reply lengths in characters with weights")
+    parser.add_argument('--audio', nargs='+', metavar='SECONDS=PATH',
+                        help='Use recorded utterances instead of synthetic audio')
+    parser.add_argument('--mode', choices=['subprocess', 'library'], default='subprocess',
+                        help='Spawn the scripts per stage like the backend, or call '
+                             'the library functions in-process')
+    parser.add_argument('--tts-script', choices=['tts_router', 'piper_tts'],
+                        default='tts_router', help='TTS entry point (default tts_router)')
+    parser.add_argument('--piper-dir', help='Piper install for --tts-script piper_tts')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run Piper voices in-process with micro-batching '
+                             '(sets SPEECH_PIPER_IN_PROCESS for the scripts or library)')
+    parser.add_argument('--max-in-flight', type=int, default=64,
+                        help='Concurrent turns before arrivals queue (default 64)')
+    parser.add_argument('--slo', type=float, default=5.0,
+                        help='p95 turn latency objective in seconds (default 5)')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='Error rate above which a step counts as saturated')
+    parser.add_argument('--keep-going', action='store_true',
+                        help='Run all rates even after saturation')
+    parser.add_argument('--sample-interval', type=float, default=1.0,
+                        help='Seconds between CPU/memory samples')
+    parser.add_argument('--keep-audio', action='store_true',
+                        help='Keep synthesized replies instead of deleting them')
+    parser.add_argument('--fakes', action='store_true',
+                        help='Use the benchmark fakes instead of real models and binaries')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for arrivals and mixes')
+    parser.add_argument('--output', '-o', help='Also write the JSON report here')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='speech_load_') as root:
+        if args.fakes:
+            use_fakes()
+            if not args.piper_dir:
+                args.piper_dir = install_fake_piper(root)
+
+        audio = {}
+        for item in args.audio or []:
+            seconds, _, path = item.partition('=')
+            audio[float(seconds)] = path
+        if audio:
+            args.audio_mix = ','.join(f"{s}:1" for s in audio)
+        else:
+            for seconds, _ in parse_mix(args.audio_mix, float):
+                path = os.path.join(root, f'utterance_{seconds:g}s.wav')
+                write_synthetic_speech(path, seconds, seed=int(seconds * 10))
+                audio[seconds] = path
+
+        if args.in_process:
+            os.environ['SPEECH_PIPER_IN_PROCESS'] = '1'
+        driver_class = SubprocessDriver if args.mode == 'subprocess' else LibraryDriver
+        driver = driver_class(args.tts_script, args.piper_dir)
+        report = LoadTest(driver, audio, args).run()
+
+    print_table(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
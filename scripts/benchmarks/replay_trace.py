@@ -0,0 +1,380 @@
+"""
+Replay a recorded speech trace against the current code.
+
+Traces are recorded by the speech entry points when SPEECH_TRACE_FILE is
+set (see scripts/speech_trace.py): one NDJSON line per request with its
+options, input and per-stage timings, with input audio stored beside the
+trace unless SPEECH_TRACE_REDACT=1. The replayer re-runs every request
+as the backend does, one script process per request, at the original
+pacing (--speed 1), accelerated (--speed 4) or back to back (--speed 0).
+The replayed requests record themselves into a second trace, so both
+sides are measured at the same points. The report puts the two side by
+side: latency percentiles per kind and stage, throughput, and requests
+that succeeded originally but fail now.
+
+Recordings whose audio was not kept are replayed with synthetic speech
+of the recorded duration; redacted text keeps its length and script.
+Requests that played audio directly are replayed to a file; streamed
+speech (piper_tts.py --stream-text) is replayed as one stream with its
+audio discarded.
+
+Usage:
+    python scripts/benchmarks/replay_trace.py /var/lib/obd-speech/trace.ndjson
+    python scripts/benchmarks/replay_trace.py trace.ndjson --speed 4 --kind stt
+    python scripts/benchmarks/replay_trace.py trace.ndjson --against replay.ndjson
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import SCRIPTS_DIR, machine_info, percentile, use_fakes, write_synthetic_speech
+from speech_trace import blob_path, load_trace
+
+VOICE_TO_TEXT = os.path.join(SCRIPTS_DIR, 'voice_to_text.py')
+TTS_ROUTER = os.path.join(SCRIPTS_DIR, 'tts_router.py')
+PIPER_TTS = os.path.join(SCRIPTS_DIR, 'piper_tts.py')
+
+# Length of synthetic audio for recordings without a known duration
+DEFAULT_AUDIO_S = 3.0
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "max_s": round(max(values), 4),
+        "mean_s": round(sum(values) / len(values), 4)
+    }
+
+
+def change_pct(before, after):
+    if not before or after is None:
+        return None
+    return round((after - before) / before * 100.0, 1)
+
+
+def stt_command(record, audio_path):
+    request = record.get("request", {})
+    cmd = [sys.executable, VOICE_TO_TEXT, audio_path,
+           '--language', request.get("language", "en"), '--output', 'json', '--local']
+    if request.get("convert"):
+        cmd.append('--convert')
+    if request.get("tier"):
+        cmd += ['--tier', request["tier"]]
+    if request.get("redecode") is False:
+        cmd.append('--no-redecode')
+    if request.get("intents"):
+        cmd += ['--intents', '--alternatives', str(request.get("alternatives", 5))]
+    return cmd
+
+
+def stream_command(record):
+    """Streamed speech (piper_tts.py --stream-text), with the PCM on stdout discarded."""
+    request = record.get("request", {})
+    cmd = [sys.executable, PIPER_TTS, '--stream-text', '--file', '-',
+           '--language', request.get("language", "en"), '--format', 'json']
+    for option, key in (('--speed', "speed"), ('--noise-scale', "noise_scale"),
+                        ('--length-scale', "length_scale"), ('--speaker', "speaker")):
+        if request.get(key) is not None:
+            cmd += [option, str(request[key])]
+    return cmd
+
+
+def stream_result(stderr):
+    """The JSON result a text stream prints to stderr after any warnings."""
+    lines = stderr.splitlines()
+    start = next((i for i, line in enumerate(lines) if line == '{'), None)
+    if start is None:
+        raise ValueError("no result")
+    return json.loads('\n'.join(lines[start:]))
+
+
+def tts_command(record, output_path):
+    request = record.get("request", {})
+    cmd = [sys.executable, TTS_ROUTER, '--file', '-',
+           '--language', request.get("language", "en"), '--format', 'json',
+           '--output', output_path]
+    if request.get("engine"):
+        cmd += ['--engine', request["engine"]]
+    if request.get("urgent"):
+        cmd.append('--urgent')
+    if request.get("latency_target") is not None:
+        cmd += ['--latency-target', str(request["latency_target"])]
+    if request.get("rate"):
+        cmd += ['--length-scale', str(1.0 / request["rate"])]
+    if request.get("noise_scale") is not None:
+        cmd += ['--noise-scale', str(request["noise_scale"])]
+    if request.get("speaker") is not None:
+        cmd += ['--speaker', str(request["speaker"])]
+    return cmd
+
+
+class Replayer:
+    """Re-run trace records as script processes, paced like the original traffic."""
+
+    def __init__(self, trace_path, records, root, args):
+        self.trace_path = trace_path
+        self.records = records
+        self.root = root
+        self.args = args
+        self.replay_path = args.replay_trace or os.path.join(root, 'replay.ndjson')
+        self._synthetic = {}
+        self._lock = threading.Lock()
+        self.outcomes = {}
+
+    def audio_for(self, record):
+        """Stored input audio, or synthetic speech of the recorded duration."""
+        path = blob_path(self.trace_path, record)
+        if path:
+            return path
+        duration = round(record.get("result", {}).get("duration_s") or DEFAULT_AUDIO_S, 1)
+        with self._lock:
+            if duration not in self._synthetic:
+                path = os.path.join(self.root, f'synthetic_{duration:g}s.wav')
+                write_synthetic_speech(path, duration, seed=int(duration * 10))
+                self._synthetic[duration] = path
+            return self._synthetic[duration]
+
+    def run_one(self, index, record, scheduled):
+        started = time.perf_counter()
+        env = os.environ.copy()
+        env.update({
+            'SPEECH_TRACE_FILE': self.replay_path,
+            'SPEECH_TRACE_REPLAY_OF': record["id"],
+            'SPEECH_TRACE_REDACT': '1',
+            'SPEECH_TRACE_SAMPLE': '1'
+        })
+        output_path = None
+        text = None
+        stream = record.get("entry") == 'piper_tts_stream'
+        if record["kind"] == 'stt':
+            cmd = stt_command(record, self.audio_for(record))
+        elif stream:
+            cmd = stream_command(record)
+            text = record.get("input", {}).get("text", "")
+        else:
+            output_path = os.path.join(self.root, f'reply_{index}.wav')
+            cmd = tts_command(record, output_path)
+            text = record.get("input", {}).get("text", "")
+
+        if stream:
+            completed = subprocess.run(cmd, input=text, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, text=True, encoding='utf-8',
+                                       env=env)
+        else:
+            completed = subprocess.run(cmd, input=text, capture_output=True, text=True,
+                                       encoding='utf-8', env=env)
+        try:
+            result = stream_result(completed.stderr) if stream else json.loads(completed.stdout)
+            error = None if result.get("success") else result.get("error", "failed")
+        except ValueError:
+            lines = completed.stderr.strip().splitlines()
+            error = lines[-1] if lines else f"exit status {completed.returncode}"
+        if output_path and os.path.exists(output_path):
+            os.remove(output_path)
+
+        with self._lock:
+            self.outcomes[record["id"]] = {
+                "process_s": round(time.perf_counter() - started, 4),
+                "launch_lag_s": round(started - scheduled, 4),
+                "error": error
+            }
+
+    def run(self):
+        """Replay every record; returns the records of the replay trace."""
+        if os.path.exists(self.replay_path):
+            os.remove(self.replay_path)
+        first = self.records[0]["ts"]
+        speed = self.args.speed
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as pool:
+            for index, record in enumerate(self.records):
+                scheduled = start + ((record["ts"] - first) / speed if speed > 0 else 0.0)
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.run_one, index, record, scheduled)
+        return load_trace(self.replay_path) if os.path.exists(self.replay_path) else []
+
+
+def side(records):
+    """Latency and throughput of one side of the comparison, per request kind."""
+    kinds = {}
+    for kind in sorted({r["kind"] for r in records}):
+        subset = [r for r in records if r["kind"] == kind]
+        ok = [r for r in subset if r["result"]["success"]]
+        window = (max(r["ts"] + r["wall_s"] for r in subset) -
+                  min(r["ts"] for r in subset)) if subset else 0.0
+        stages = {}
+        for r in ok:
+            for name, wall in r["result"].get("stages", {}).items():
+                stages.setdefault(name, []).append(wall)
+        entry = {
+            "requests": len(subset),
+            "errors": len(subset) - len(ok),
+            "window_s": round(window, 3),
+            "throughput_rps": round(len(ok) / window, 3) if window > 0 else None,
+            "wall": summarize([r["wall_s"] for r in ok]),
+            "stages": {name: summarize(values) for name, values in sorted(stages.items())}
+        }
+        if kind == 'stt':
+            audio = sum(r["result"].get("duration_s") or 0.0 for r in ok)
+            entry["audio_s_per_s"] = round(audio / window, 3) if window > 0 else None
+        else:
+            chars = sum(r["input"].get("chars", 0) for r in ok)
+            entry["chars_per_s"] = round(chars / window, 1) if window > 0 else None
+        kinds[kind] = entry
+    return kinds
+
+
+def diff(original, replay):
+    """Relative change of the replay against the original, in percent."""
+    changes = {}
+    for kind, before in original.items():
+        after = replay.get(kind)
+        if not after:
+            continue
+        entry = {
+            "throughput_rps_pct": change_pct(before["throughput_rps"], after["throughput_rps"]),
+            "wall_p50_pct": change_pct((before["wall"] or {}).get("p50_s"),
+                                       (after["wall"] or {}).get("p50_s")),
+            "wall_p95_pct": change_pct((before["wall"] or {}).get("p95_s"),
+                                       (after["wall"] or {}).get("p95_s")),
+            "stages": {}
+        }
+        for name, stage in before["stages"].items():
+            new = after["stages"].get(name)
+            if stage and new:
+                entry["stages"][name] = {
+                    "p50_pct": change_pct(stage["p50_s"], new["p50_s"]),
+                    "p95_pct": change_pct(stage["p95_s"], new["p95_s"])
+                }
+        changes[kind] = entry
+    return changes
+
+
+def request_details(original, replay, outcomes):
+    replayed = {r.get("replay_of"): r for r in replay}
+    details = []
+    for record in original:
+        again = replayed.get(record["id"])
+        outcome = outcomes.get(record["id"], {})
+        details.append({
+            "id": record["id"],
+            "kind": record["kind"],
+            "entry": record.get("entry"),
+            "original_wall_s": record["wall_s"],
+            "replay_wall_s": again["wall_s"] if again else None,
+            "change_pct": change_pct(record["wall_s"], again["wall_s"]) if again else None,
+            "original_success": record["result"]["success"],
+            "replay_success": again["result"]["success"] if again else False,
+            "replay_error": (again["result"].get("error") if again else
+                             outcome.get("error", "not replayed")),
+            "process_s": outcome.get("process_s"),
+            "launch_lag_s": outcome.get("launch_lag_s")
+        })
+    return details
+
+
+def print_table(report):
+    header = f"{'kind/stage':<24}{'orig p50':>10}{'new p50':>10}{'Δ%':>8}{'orig p95':>10}{'new p95':>10}{'Δ%':>8}"
+    print(header, file=sys.stderr)
+    print('-' * len(header), file=sys.stderr)
+
+    def row(label, before, after):
+        before, after = before or {}, after or {}
+        print(f"{label:<24}{before.get('p50_s', 0):>10.3f}{after.get('p50_s', 0):>10.3f}"
+              f"{str(change_pct(before.get('p50_s'), after.get('p50_s'))):>8}"
+              f"{before.get('p95_s', 0):>10.3f}{after.get('p95_s', 0):>10.3f}"
+              f"{str(change_pct(before.get('p95_s'), after.get('p95_s'))):>8}",
+              file=sys.stderr)
+
+    for kind, before in report["original"].items():
+        after = report["replay"].get(kind, {"stages": {}})
+        row(kind, before["wall"], after.get("wall"))
+        for name, stage in before["stages"].items():
+            row(f"  {name}", stage, after["stages"].get(name))
+        print(f"  throughput {before['throughput_rps']} -> {after.get('throughput_rps')} req/s, "
+              f"errors {before['errors']} -> {after.get('errors')}", file=sys.stderr)
+    if report["regressions"]:
+        print(f"{len(report['regressions'])} requests failed that succeeded originally",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a recorded speech trace and compare latency with the original')
+    parser.add_argument('trace', help='Trace recorded with SPEECH_TRACE_FILE')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Pacing relative to the recording (default 1, 0 = back to back)')
+    parser.add_argument('--max-in-flight', type=int, default=16,
+                        help='Concurrent replayed requests (default 16)')
+    parser.add_argument('--kind', choices=['stt', 'tts'], help='Replay only one kind of request')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--replay-trace', help='Keep the replay trace at this path')
+    parser.add_argument('--against', metavar='TRACE',
+                        help='Compare with an existing replay trace instead of replaying')
+    parser.add_argument('--details', action='store_true',
+                        help='Add a per-request comparison to the report')
+    parser.add_argument('--fakes', action='store_true',
+                        help='Use the benchmark fakes instead of real models and binaries')
+    parser.add_argument('--output', '-o', help='Also write the JSON report here')
+    args = parser.parse_args()
+
+    records = [r for r in load_trace(args.trace) if not args.kind or r["kind"] == args.kind]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No requests to replay", file=sys.stderr)
+        return 1
+
+    outcomes = {}
+    with tempfile.TemporaryDirectory(prefix='speech_replay_') as root:
+        if args.against:
+            replay = load_trace(args.against)
+        else:
+            if args.fakes:
+                use_fakes()
+            replayer = Replayer(args.trace, records, root, args)
+            print(f"Replaying {len(records)} requests at speed {args.speed}...", file=sys.stderr)
+            replay = replayer.run()
+            outcomes = replayer.outcomes
+
+    original_side = side(records)
+    replay_side = side(replay)
+    details = request_details(records, replay, outcomes)
+    report = {
+        "machine": machine_info(),
+        "trace": args.trace,
+        "speed": None if args.against else args.speed,
+        "requests": len(records),
+        "replayed": len(replay),
+        "original": original_side,
+        "replay": replay_side,
+        "change": diff(original_side, replay_side),
+        "regressions": [d["id"] for d in details
+                        if d["original_success"] and not d["replay_success"]],
+        "max_launch_lag_s": max((d["launch_lag_s"] for d in details
+                                 if d["launch_lag_s"] is not None), default=None)
+    }
+    if args.details:
+        report["details"] = details
+
+    print_table(report)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""
+Offline benchmark suite for the speech scripts.
+
+Runs process_audio_file, long-form transcription, convert_audio_to_wav,
+PiperTTS.text_to_speech_file and ESpeakTTS.text_to_speech_file against synthetic audio fixtures and the
+stand-in fakes in benchmarks/fakes (vosk module, piper, espeak-ng and ffmpeg
+executables), so no models, binaries or network are needed.
+
+Usage:
+    python scripts/benchmarks/run_benchmarks.py
+    python scripts/benchmarks/run_benchmarks.py --save-baseline
+    python scripts/benchmarks/run_benchmarks.py --threshold 0.25 --cases stt_10s tts_piper_short
+
+Each case is measured in several rounds and compared by its median round.
+--save-baseline runs the suite several times (--baseline-runs) and stores
+the median run with the run-to-run spread as its noise: one quiet run
+underestimates how much process-spawning cases vary. Exits with status 1
+when a case regresses beyond the threshold relative to the stored baseline
+and beyond the noise, or when a case has no baseline. Baselines are machine
+specific; regenerate them with --save-baseline on the device being compared.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+from fixtures import machine_info, percentile, prepare_fixtures, use_fakes, wav_duration
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Fakes shadow the real vosk/arabic_reshaper/bidi modules and binaries
+use_fakes()
+
+SHORT_TEXT = "Check engine light is on."
+LONG_TEXT = ("Your coolant temperature is ninety two degrees and rising. "
+             "Engine speed is three thousand RPM. Battery voltage is normal. "
+             "The diagnostic trouble code P0301 indicates a misfire in cylinder one. "
+             "Please pull over safely and let the engine cool down before continuing.")
+
+# Metrics compared against the baseline (lower is better)
+COMPARED_METRICS = ('p50_s', 'p95_s', 'peak_memory_bytes')
+
+
+def build_cases(fixtures):
+    """
+    Return {name: setup}. setup() is called once per process and returns a
+    run() callable performing one operation; run() returns the seconds of
+    audio processed or produced, used for the real-time factor.
+    """
+    out = fixtures['output_dir']
+
+    def stt(fixture):
+        def setup():
+            from voice_to_text import process_audio_file
+            path = fixtures[fixture]
+            duration = wav_duration(path)
+
+            def run():
+                result = process_audio_file(path, 'en')
+                if not result['success']:
+                    raise RuntimeError(result['error'])
+                return duration
+            return run
+        return setup
+
+    def long_form(fixture):
+        def setup():
+            from speech_io import open_audio_stream
+            from voice_to_text import LongFormTranscriber, load_vosk_model
+            path = fixtures[fixture]
+            duration = wav_duration(path)
+            model = load_vosk_model('en')
+            sink = open(os.devnull, 'w')
+
+            def run():
+                with open_audio_stream(path) as stream:
+                    LongFormTranscriber(model, 'en', out=sink).run(stream)
+                return duration
+            return run
+        return setup
+
+    def convert():
+        from voice_to_text import convert_audio_to_wav
+        path = fixtures['speech_10s_44k_stereo']
+        target = os.path.join(out, 'converted.wav')
+
+        def run():
+            convert_audio_to_wav(path, target)
+            return wav_duration(target)
+        return run
+
+    def piper(text, language='en'):
+        def setup():
+            from piper_tts import PiperTTS
+            tts = PiperTTS(fixtures['piper_dir'])
+            target = os.path.join(out, f'piper_{language}.wav')
+
+            def run():
+                result = tts.text_to_speech_file(text, language, target)
+                if not result['success']:
+                    raise RuntimeError(result['error'])
+                return wav_duration(target)
+            return run
+        return setup
+
+    def espeak(text, language='en'):
+        def setup():
+            from espeak_ng_lib import ESpeakLibrary
+            from espeak_tts import ESpeakTTS
+            # Benchmark the executable path against the fake espeak-ng
+            ESpeakLibrary._instance = False
+            tts = ESpeakTTS()
+            target = os.path.join(out, f'espeak_{language}.wav')
+
+            def run():
+                result = tts.text_to_speech_file(text, language, target)
+                if not result['success']:
+                    raise RuntimeError(result['error'])
+                return wav_duration(target)
+            return run
+        return setup
+
+    return {
+        'stt_2s': stt('speech_2s'),
+        'stt_10s': stt('speech_10s'),
+        'stt_30s': stt('speech_30s'),
+        'stt_long_form_30s': long_form('speech_30s'),
+        'convert_10s': convert,
+        'tts_piper_short': piper(SHORT_TEXT),
+        'tts_piper_long': piper(LONG_TEXT),
+        'tts_piper_arabic': piper("مستوى الزيت منخفض، يرجى التحقق.", 'ar'),
+        'tts_espeak_short': espeak(SHORT_TEXT),
+        'tts_espeak_long': espeak(LONG_TEXT),
+        'tts_espeak_arabic': espeak("مستوى الزيت منخفض، يرجى التحقق.", 'ar'),
+    }
+
+
+def measure_cold(name, fixtures_root):
+    """Run one operation in a fresh interpreter, including imports and setup."""
+    cmd = [sys.executable, os.path.abspath(__file__),
+           '--cold-case', name, '--fixtures', fixtures_root]
+    completed = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])['latency_s']
+
+
+def run_cold_case(name, fixtures_root):
+    start = time.perf_counter()
+    fixtures = load_fixture_index(fixtures_root)
+    run = build_cases(fixtures)[name]()
+    run()
+    print(json.dumps({"latency_s": time.perf_counter() - start}))
+    return 0
+
+
+def load_fixture_index(root):
+    with open(os.path.join(root, 'index.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_case(name, setup, iterations, fixtures_root, repeats=5):
+    """
+    Benchmark one case and return its report.
+
+    The warm iterations are measured in `repeats` rounds; latency
+    percentiles are the median over the rounds and their spread (max - min
+    across rounds) is kept as the case's noise, so the comparison can tell
+    a slowdown from the jitter of process startup on the same machine.
+    """
+    cold = measure_cold(name, fixtures_root)
+
+    run = setup()
+    run()  # Warm-up
+
+    latencies = []
+    rounds = {"p50_s": [], "p95_s": [], "p99_s": []}
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        round_latencies = []
+        for _ in range(iterations):
+            op_start = time.perf_counter()
+            audio_seconds += run()
+            round_latencies.append(time.perf_counter() - op_start)
+        for metric, pct in (("p50_s", 50), ("p95_s", 95), ("p99_s", 99)):
+            rounds[metric].append(percentile(round_latencies, pct))
+        latencies.extend(round_latencies)
+    elapsed = time.perf_counter() - start
+
+    # Separate pass so tracemalloc overhead does not skew latency
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report = {
+        "iterations": iterations,
+        "repeats": repeats,
+        "cold_s": round(cold, 6),
+        "warm_mean_s": round(sum(latencies) / len(latencies), 6),
+        "real_time_factor": round(sum(latencies) / audio_seconds, 6) if audio_seconds else None,
+        "throughput_ops_s": round(len(latencies) / elapsed, 3),
+        "peak_memory_bytes": peak,
+        "noise_s": {}
+    }
+    for metric, values in rounds.items():
+        report[metric] = round(percentile(values, 50), 6)
+        report["noise_s"][metric] = round(max(values) - min(values), 6)
+    return report
+
+
+def merge_runs(reports):
+    """
+    Combine reports of separate runs of one case into a baseline entry: the
+    median of each metric, with the spread between runs as the noise when it
+    exceeds the rounds' own spread.
+    """
+    merged = dict(reports[len(reports) // 2])
+    merged["runs"] = len(reports)
+    merged["noise_s"] = {}
+    for metric in ("p50_s", "p95_s", "p99_s"):
+        values = [r[metric] for r in reports]
+        merged[metric] = round(percentile(values, 50), 6)
+        merged["noise_s"][metric] = round(max(
+            [max(values) - min(values)] + [r["noise_s"].get(metric, 0.0) for r in reports]), 6)
+    for metric in ("cold_s", "warm_mean_s", "real_time_factor", "throughput_ops_s",
+                   "peak_memory_bytes"):
+        values = [r[metric] for r in reports if r[metric] is not None]
+        if values:
+            merged[metric] = percentile(values, 50)
+    return merged
+
+
+def compare(results, baseline, threshold, min_delta, noise_factor, noise_floor):
+    """
+    Return a list of regressions relative to baseline.
+
+    A latency counts as regressed only when it is above the baseline by
+    more than `threshold` of it, more than min_delta seconds, and more than
+    noise_factor times the noise: the larger of the spread recorded in the
+    baseline, the current run's round-to-round spread and noise_floor times
+    the baseline value. Cases without a baseline entry are reported too, so
+    new cases cannot go ungated.
+    """
+    regressions = []
+    for name, report in results.items():
+        reference = baseline.get('cases', {}).get(name)
+        if not reference:
+            regressions.append({"case": name, "metric": None, "baseline": None,
+                                "current": None, "change": None})
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = reference.get(metric), report.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if metric.endswith('_s'):
+                noise = max(reference.get('noise_s', {}).get(metric, 0.0),
+                            report.get('noise_s', {}).get(metric, 0.0),
+                            noise_floor * old)
+                if new - old <= max(min_delta, noise_factor * noise):
+                    continue
+            if change > threshold:
+                regressions.append({
+                    "case": name,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 4)
+                })
+    return regressions
+
+
+def print_table(results):
+    header = f"{'case':<20}{'cold':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rtf':>9}{'ops/s':>9}{'peak KiB':>10}"
+    print(header, file=sys.stderr)
+    print('-' * len(header), file=sys.stderr)
+    for name, r in results.items():
+        rtf = f"{r['real_time_factor']:.4f}" if r['real_time_factor'] is not None else '-'
+        print(f"{name:<20}{r['cold_s']:>9.4f}{r['p50_s']:>9.4f}{r['p95_s']:>9.4f}"
+              f"{r['p99_s']:>9.4f}{rtf:>9}{r['throughput_ops_s']:>9.1f}"
+              f"{r['peak_memory_bytes'] / 1024:>10.1f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Offline STT/TTS benchmark suite with regression check')
+    parser.add_argument('--iterations', '-n', type=int, default=20,
+                        help='Warm iterations per round (default 20)')
+    parser.add_argument('--repeats', '-r', type=int, default=5,
+                        help='Rounds per case; percentiles are the median round (default 5)')
+    parser.add_argument('--cases', nargs='+', help='Only run these cases')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as the new baseline')
+    parser.add_argument('--baseline-runs', type=int, default=5,
+                        help='Separate runs of the suite a saved baseline is built from '
+                             '(default 5)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed relative slowdown before failing (default 0.25)')
+    parser.add_argument('--min-delta', type=float, default=0.02,
+                        help='Ignore latency changes below this many seconds, the order of '
+                             'process spawn jitter (default 0.02)')
+    parser.add_argument('--noise-factor', type=float, default=3.0,
+                        help='Ignore latency changes within this many times the '
+                             'noise (default 3)')
+    parser.add_argument('--noise-floor', type=float, default=0.1,
+                        help='Smallest noise assumed, as a share of the baseline value '
+                             '(default 0.1)')
+    parser.add_argument('--output', '-o', help='Also write the JSON report here')
+    parser.add_argument('--list', action='store_true', help='List cases and exit')
+    parser.add_argument('--cold-case', help=argparse.SUPPRESS)
+    parser.add_argument('--fixtures', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_case:
+        return run_cold_case(args.cold_case, args.fixtures)
+
+    with tempfile.TemporaryDirectory(prefix='speech_bench_') as root:
+        fixtures = prepare_fixtures(root)
+        with open(os.path.join(root, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(fixtures, f)
+
+        cases = build_cases(fixtures)
+        if args.list:
+            print("\n".join(cases))
+            return 0
+
+        selected = args.cases or list(cases)
+        unknown = [name for name in selected if name not in cases]
+        if unknown:
+            print(f"Unknown cases: {', '.join(unknown)}", file=sys.stderr)
+            return 2
+
+        # Runs are interleaved so a quiet or busy spell of the machine is
+        # spread over every case instead of landing on one
+        runs = args.baseline_runs if args.save_baseline else 1
+        reports = {name: [] for name in selected}
+        for index in range(max(1, runs)):
+            for name in selected:
+                print(f"Running {name}" + (f" ({index + 1}/{runs})" if runs > 1 else '') + "...",
+                      file=sys.stderr)
+                reports[name].append(
+                    run_case(name, cases[name], args.iterations, root, args.repeats))
+        results = {name: merge_runs(r) if len(r) > 1 else r[0] for name, r in reports.items()}
+
+    report = {"machine": machine_info(), "cases": results}
+    print_table(results)
+
+    if args.save_baseline:
+        saved = report
+        if args.cases and os.path.exists(args.baseline):
+            # Re-recording some cases keeps the others
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            saved["machine"] = report["machine"]
+            saved.setdefault("cases", {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != report['machine']:
+            print("Warning: baseline was recorded on a different machine", file=sys.stderr)
+        report["regressions"] = compare(
+            results, baseline, args.threshold, args.min_delta, args.noise_factor,
+            args.noise_floor)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if report.get("regressions"):
+        for r in report["regressions"]:
+            if r["metric"] is None:
+                print(f"NO BASELINE {r['case']}: record it with --save-baseline",
+                      file=sys.stderr)
+                continue
+            print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']} -> "
+                  f"{r['current']} (+{r['change'] * 100:.1f}%)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Exercise remote STT dispatch with local worker processes standing in for
+the other nodes of a depot LAN.
+
+Starts several `voice_to_text.py --serve` workers on loopback ports, then
+transcribes a batch of synthetic recordings through them and checks every
+transcript against a local-only run. Faults can be injected on the way:
+--stall freezes a worker (SIGSTOP) so it misses heartbeats, --kill drops
+one (SIGKILL) mid-batch. The report has the batch time against local
+decoding and the per-node throughput, stealing and failover counts.
+
+Usage:
+    python scripts/benchmarks/stt_cluster_test.py --fakes --workers 3 --files 24
+    python scripts/benchmarks/stt_cluster_test.py --fakes --stall 0 --kill 1 --fault-after 0.5
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from fixtures import SCRIPTS_DIR, machine_info, use_fakes, write_synthetic_speech
+
+VOICE_TO_TEXT = os.path.join(SCRIPTS_DIR, 'voice_to_text.py')
+
+
+def start_worker(slots, env):
+    """Start a worker on a free loopback port; returns (process, address)."""
+    process = subprocess.Popen(
+        [sys.executable, VOICE_TO_TEXT, '--serve', '127.0.0.1:0', '--slots', str(slots)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError(f"Worker exited with code {process.wait()}")
+    return process, json.loads(line)["address"]
+
+
+def transcribe(files, env, extra_args):
+    """Run one voice_to_text.py batch; returns (parsed output, seconds)."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, VOICE_TO_TEXT, *files, *extra_args],
+                            capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"voice_to_text.py failed: {result.stderr.strip()}")
+    return json.loads(result.stdout), elapsed
+
+
+def inject_fault(workers, index, sig, delay):
+    def fire():
+        time.sleep(delay)
+        workers[index].send_signal(sig)
+    thread = threading.Thread(target=fire, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check remote STT dispatch against local worker processes')
+    parser.add_argument('--workers', type=int, default=3, help='Worker processes (default 3)')
+    parser.add_argument('--slots', type=int, default=1, help='Slots per worker (default 1)')
+    parser.add_argument('--files', type=int, default=12, help='Recordings in the batch')
+    parser.add_argument('--durations', type=float, nargs='+', default=[2.0, 5.0, 10.0],
+                        help='Recording lengths in seconds, cycled over the batch')
+    parser.add_argument('--stall', type=int, metavar='INDEX',
+                        help='Freeze this worker during the batch (missed heartbeats)')
+    parser.add_argument('--kill', type=int, metavar='INDEX',
+                        help='Kill this worker during the batch (dropped connections)')
+    parser.add_argument('--fault-after', type=float, default=0.2,
+                        help='Seconds into the batch the faults are injected')
+    parser.add_argument('--heartbeat-timeout', type=float, default=2.0,
+                        help='Dispatcher heartbeat timeout in seconds (default 2)')
+    parser.add_argument('--fakes', action='store_true',
+                        help='Use the benchmark fakes instead of real models and binaries')
+    parser.add_argument('--output', '-o', help='Also write the JSON report here')
+    args = parser.parse_args()
+
+    if args.fakes:
+        use_fakes()
+    env = os.environ.copy()
+    env['SPEECH_STT_HEARTBEAT_TIMEOUT'] = str(args.heartbeat_timeout)
+    env.pop('SPEECH_STT_WORKERS', None)
+
+    with tempfile.TemporaryDirectory(prefix='speech_cluster_') as root:
+        files = []
+        for index in range(args.files):
+            path = os.path.join(root, f'upload_{index:03d}.wav')
+            write_synthetic_speech(path, args.durations[index % len(args.durations)], seed=index)
+            files.append(path)
+
+        local, local_s = transcribe(files, env, ['--local'])
+
+        workers = []
+        try:
+            addresses = []
+            for _ in range(args.workers):
+                process, address = start_worker(args.slots, env)
+                workers.append(process)
+                addresses.append(address)
+
+            faults = []
+            if args.stall is not None:
+                faults.append(inject_fault(workers, args.stall, signal.SIGSTOP, args.fault_after))
+            if args.kill is not None:
+                faults.append(inject_fault(workers, args.kill, signal.SIGKILL, args.fault_after))
+            remote, remote_s = transcribe(files, env, ['--workers', ','.join(addresses)])
+            for fault in faults:
+                fault.join()
+        finally:
+            for process in workers:
+                if process.poll() is None:
+                    process.send_signal(signal.SIGCONT)
+                    process.terminate()
+                    process.wait()
+
+    local_results = local["results"] if "results" in local else [local]
+    remote_results = remote["results"] if "results" in remote else [remote]
+    mismatches = [
+        remote_result["file_path"] for local_result, remote_result
+        in zip(local_results, remote_results)
+        if not remote_result["success"] or remote_result["text"] != local_result["text"]
+    ]
+    report = {
+        "machine": machine_info(),
+        "workers": args.workers,
+        "slots": args.slots,
+        "files": args.files,
+        "faults": {"stall": args.stall, "kill": args.kill, "after_s": args.fault_after},
+        "local_s": round(local_s, 3),
+        "remote_s": round(remote_s, 3),
+        "speedup": round(local_s / remote_s, 3) if remote_s else None,
+        "transcripts_match": not mismatches,
+        "mismatches": mismatches,
+        "served_by": {
+            node["node"]: node["jobs"] for node in remote["cluster"]["nodes"]
+        },
+        "cluster": remote["cluster"]
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0 if not mismatches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import os
+import sys
+import ctypes
+import ctypes.util
+import threading
+import platform
+
+
+# espeak_AUDIO_OUTPUT
+AUDIO_OUTPUT_SYNCHRONOUS = 2
+
+# espeak_POSITION_TYPE
+POS_CHARACTER = 1
+
+# Synth flags
+ESPEAK_CHARS_UTF8 = 1
+
+# espeak_TextToPhonemes phoneme mode
+ESPEAK_PHONEMES_IPA = 0x02
+
+# espeak_PARAMETER
+ESPEAK_RATE = 1
+ESPEAK_VOLUME = 2
+ESPEAK_PITCH = 3
+
+# espeak_ERROR
+EE_OK = 0
+
+# int (*t_espeak_callback)(short *wav, int numsamples, espeak_EVENT *events)
+SYNTH_CALLBACK = ctypes.CFUNCTYPE(
+    ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+
+
+def _candidate_library_paths():
+    """Return the library names/paths to try, most specific first."""
+    candidates = []
+
+    override = os.environ.get('ESPEAK_NG_LIBRARY')
+    if override:
+        candidates.append(override)
+
+    found = ctypes.util.find_library('espeak-ng')
+    if found:
+        candidates.append(found)
+
+    system = platform.system()
+    if system == "Windows":
+        candidates.extend([
+            'C:\\Program Files\\eSpeak NG\\libespeak-ng.dll',
+            'C:\\Program Files (x86)\\eSpeak NG\\libespeak-ng.dll',
+            'libespeak-ng.dll',
+        ])
+    elif system == "Darwin":
+        candidates.extend([
+            '/opt/homebrew/lib/libespeak-ng.dylib',
+            '/usr/local/lib/libespeak-ng.dylib',
+            'libespeak-ng.dylib',
+        ])
+    else:
+        candidates.extend(['libespeak-ng.so.1', 'libespeak-ng.so'])
+
+    return candidates
+
+
+class ESpeakLibrary:
+    """
+    In-process binding to libespeak-ng.
+
+    The library is initialized once per process in synchronous mode and all
+    audio is delivered through the synth callback, so there is no subprocess,
+    no temp file and the voice is only reloaded when the language changes.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, lib):
+        self._lib = lib
+        self._lock = threading.Lock()
+        self._sink = None
+        self._current_voice = None
+        self._current_params = {}
+
+        self._declare_prototypes()
+
+        data_path = os.environ.get('ESPEAK_NG_DATA')
+        self.sample_rate = self._lib.espeak_Initialize(
+            AUDIO_OUTPUT_SYNCHRONOUS, 0,
+            data_path.encode('utf-8') if data_path else None, 0)
+        if self.sample_rate <= 0:
+            raise OSError("espeak_Initialize failed")
+
+        # Keep a reference to the callback so it is not garbage collected
+        self._callback = SYNTH_CALLBACK(self._on_synth)
+        self._lib.espeak_SetSynthCallback(self._callback)
+
+    @classmethod
+    def get(cls):
+        """
+        Return the process-wide library instance.
+        :return: ESpeakLibrary or None if libespeak-ng cannot be loaded
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls._load()
+            return cls._instance or None
+
+    @classmethod
+    def _load(cls):
+        for candidate in _candidate_library_paths():
+            try:
+                lib = ctypes.CDLL(candidate)
+            except OSError:
+                continue
+            try:
+                return cls(lib)
+            except (OSError, AttributeError) as e:
+                # Another build (e.g. the versioned soname) may still work
+                print(
+                    f"Warning: Failed to initialize {candidate}: {e}", file=sys.stderr)
+        # Remember the failure so we do not probe again
+        return False
+
+    def _declare_prototypes(self):
+        lib = self._lib
+        lib.espeak_Initialize.argtypes = [
+            ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        lib.espeak_Initialize.restype = ctypes.c_int
+        lib.espeak_SetSynthCallback.argtypes = [SYNTH_CALLBACK]
+        lib.espeak_SetSynthCallback.restype = None
+        lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        lib.espeak_SetVoiceByName.restype = ctypes.c_int
+        lib.espeak_SetParameter.argtypes = [
+            ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.espeak_SetParameter.restype = ctypes.c_int
+        lib.espeak_Synth.argtypes = [
+            ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.POINTER(ctypes.c_uint),
+            ctypes.c_void_p]
+        lib.espeak_Synth.restype = ctypes.c_int
+        lib.espeak_Synchronize.argtypes = []
+        lib.espeak_Synchronize.restype = ctypes.c_int
+        # Older libraries lack espeak_TextToPhonemes; synthesis still works
+        if hasattr(lib, 'espeak_TextToPhonemes'):
+            lib.espeak_TextToPhonemes.argtypes = [
+                ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_int]
+            lib.espeak_TextToPhonemes.restype = ctypes.c_char_p
+
+    def _on_synth(self, wav, numsamples, events):
+        """Synth callback: hand each PCM block to the active sink."""
+        if numsamples > 0 and wav and self._sink is not None:
+            try:
+                self._sink(ctypes.string_at(wav, numsamples * 2))
+            except Exception as e:
+                print(f"Warning: PCM sink failed: {e}", file=sys.stderr)
+                return 1  # Abort synthesis
+        return 0
+
+    def _set_voice(self, voice):
+        if voice == self._current_voice:
+            return
+        if self._lib.espeak_SetVoiceByName(voice.encode('utf-8')) != EE_OK:
+            raise ValueError(f"Unknown eSpeak NG voice: {voice}")
+        self._current_voice = voice
+        # Loading a voice resets the rate/pitch/volume parameters
+        self._current_params = {}
+
+    def _set_parameter(self, parameter, value):
+        if self._current_params.get(parameter) == value:
+            return
+        self._lib.espeak_SetParameter(parameter, int(value), 0)
+        self._current_params[parameter] = value
+
+    def synthesize(self, text, voice="en", speed=175, pitch=50, amplitude=100, on_audio=None):
+        """
+        Synthesize text to 16-bit mono PCM.
+        :param text: Text to synthesize
+        :param voice: eSpeak NG voice name
+        :param speed: Words per minute (80-450)
+        :param pitch: Pitch (0-99)
+        :param amplitude: Volume (0-200)
+        :param on_audio: Optional callable receiving each PCM block as bytes.
+                         When given, audio is streamed and not accumulated.
+        :return: PCM bytes (empty when streaming through on_audio)
+        """
+        buffer = bytearray()
+        data = text.encode('utf-8') + b'\0'
+
+        with self._lock:
+            self._set_voice(voice)
+            self._set_parameter(ESPEAK_RATE, speed)
+            self._set_parameter(ESPEAK_PITCH, pitch)
+            self._set_parameter(ESPEAK_VOLUME, amplitude)
+
+            self._sink = on_audio if on_audio is not None else buffer.extend
+            try:
+                error = self._lib.espeak_Synth(
+                    data, len(data), 0, POS_CHARACTER, 0,
+                    ESPEAK_CHARS_UTF8, None, None)
+                if error != EE_OK:
+                    raise RuntimeError(f"espeak_Synth failed with code {error}")
+                self._lib.espeak_Synchronize()
+            finally:
+                self._sink = None
+
+        return bytes(buffer)
+
+    @property
+    def can_phonemize(self):
+        return hasattr(self._lib, 'espeak_TextToPhonemes')
+
+    def text_to_phonemes(self, text, voice="en"):
+        """
+        Convert text to IPA phonemes without synthesizing it.
+        :param text: Text to phonemize
+        :param voice: eSpeak NG voice name
+        :return: Phoneme string, with eSpeak's clauses joined by spaces
+        """
+        buffer = ctypes.create_string_buffer(text.encode('utf-8'))
+        pointer = ctypes.c_void_p(ctypes.addressof(buffer))
+        clauses = []
+
+        with self._lock:
+            self._set_voice(voice)
+            # Each call phonemizes one clause and advances the pointer,
+            # which becomes NULL at the end of the text
+            while pointer.value:
+                phonemes = self._lib.espeak_TextToPhonemes(
+                    ctypes.byref(pointer), ESPEAK_CHARS_UTF8, ESPEAK_PHONEMES_IPA)
+                if phonemes:
+                    clauses.append(phonemes.decode('utf-8', 'replace').strip())
+
+        return ' '.join(clause for clause in clauses if clause)
@@ -3,13 +3,24 @@ import sys
 import json
 import argparse
 import subprocess
-import tempfile
 import re
+import wave
+import shutil
+import platform
 from pathlib import Path
 
+from espeak_ng_lib import ESpeakLibrary
+from speech_metrics import SpeechMetrics, add_instrumentation_arguments, run_with_profile
+from speech_io import read_text_source
+from audio_spool import atomic_output, get_spool
+from resource_profile import add_resource_arguments, apply_profile
+
 
 class ESpeakTTS:
-    def __init__(self):
+    def __init__(self, metrics=None):
+        self.metrics = metrics or SpeechMetrics('espeak_tts')
+        self.spool = get_spool()
+
         self.supported_languages = {
             'en': 'en',
             'ar': 'ar',
@@ -22,51 +33,67 @@ class ESpeakTTS:
             'zh': 'zh'
         }
 
-        # Check if espeak-ng is installed
-        self.espeak_available = self._check_espeak_installation()
-        # self.espeak_available = True
+        with self.metrics.stage('probe'):
+            # Prefer the in-process library; the executable is the fallback
+            self.library = ESpeakLibrary.get()
+            self.espeak_executable = self._find_espeak_executable()
+
+            # Check if espeak-ng is installed
+            self.espeak_available = self.library is not None or self._check_espeak_installation()
+
+    def _find_espeak_executable(self):
+        """Locate the espeak-ng executable on PATH or in its default Windows location."""
+        found = shutil.which('espeak-ng')
+        if found:
+            return found
+        if platform.system() == "Windows":
+            return 'C:\\Program Files\\eSpeak NG\\espeak-ng.exe'
+        return 'espeak-ng'
 
     def _check_espeak_installation(self):
         """Check if espeak-ng is installed."""
         try:
-            subprocess.run(['C:\\Program Files\\eSpeak NG\\espeak-ng.exe', '--version'],
+            subprocess.run([self.espeak_executable, '--version'],
                            capture_output=True, check=True)
             return True
         except (subprocess.CalledProcessError, FileNotFoundError):
             return False
 
+    def _write_wav(self, output_file, pcm):
+        """Write 16-bit mono PCM from the library to a WAV file."""
+        with wave.open(output_file, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.library.sample_rate)
+            wf.writeframes(pcm)
+
+    def _play_pcm(self, pcm):
+        """Play raw 16-bit mono PCM by piping it to an audio player."""
+        rate = str(self.library.sample_rate)
+        players = [
+            ['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', rate, '-'],
+            ['paplay', '--raw', '--format=s16le', '--channels=1', f'--rate={rate}'],
+            ['play', '-q', '-t', 'raw', '-e', 'signed', '-b', '16', '-c', '1', '-r', rate, '-'],
+        ]
+        for cmd in players:
+            try:
+                subprocess.run(cmd, input=pcm, check=True, capture_output=True)
+                return True
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                continue
+        return False
+
     def _contains_arabic_text(self, text):
         """Check if text contains Arabic characters."""
         arabic_pattern = re.compile(r'[\u0600-\u06FF]')
         return bool(arabic_pattern.search(text))
 
-    def _create_temp_file_for_arabic(self, text):
-        """Create a temporary file with proper UTF-8 encoding for Arabic text."""
-        try:
-            # Create temp file with UTF-8 BOM for better encoding recognition
-            temp_file = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8-sig',
-                                                    suffix='.txt', delete=False)
-            temp_file.write(text)
-            temp_file.close()
-            return temp_file.name
-        except Exception as e:
-            raise Exception(f"Failed to create temporary file: {str(e)}")
-
-    def _cleanup_temp_file(self, file_path):
-        """Clean up temporary file."""
-        try:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-        except Exception as e:
-            print(
-                f"Warning: Failed to cleanup temp file {file_path}: {e}", file=sys.stderr)
-
-    def _build_espeak_command(self, text, language, speed, pitch, amplitude, output_file=None, use_file=False):
+    def _build_espeak_command(self, text, language, speed, pitch, amplitude, output_file=None, use_stdin=False):
         """Build espeak command with proper encoding handling."""
         lang = self.supported_languages.get(language, 'en')
 
         cmd = [
-            'C:\\Program Files\\eSpeak NG\\espeak-ng.exe',
+            self.espeak_executable,
             '-v', lang,
             '-s', str(speed),
             '-p', str(pitch),
@@ -76,8 +103,8 @@ class ESpeakTTS:
         if output_file:
             cmd.extend(['-w', output_file])
 
-        if use_file:
-            cmd.extend(['-f', text])  # text is actually file path in this case
+        if use_stdin:
+            cmd.append('--stdin')  # text is written to the process's stdin
         else:
             cmd.append(text)
 
@@ -113,7 +140,6 @@ class ESpeakTTS:
                 "installation": self.get_installation_instructions()
             }
 
-        temp_file_path = None
         try:
             if not text.strip():
                 return {
@@ -121,66 +147,86 @@ class ESpeakTTS:
                     "error": "Empty text provided"
                 }
 
-            # Generate output filename if not provided
+            # Write through a temp file; unnamed outputs go to the managed spool
             if output_file is None:
-                output_file = f"tts_output_{hash(text) % 10000}.wav"
-
-            # Handle Arabic text with file-based approach
-            use_file_input = False
-            processed_text = text
-
-            if language == 'ar' or self._contains_arabic_text(text):
-                temp_file_path = self._create_temp_file_for_arabic(text)
-                processed_text = temp_file_path
-                use_file_input = True
-
-            # Build espeak command
-            cmd = self._build_espeak_command(
-                processed_text, language, speed, pitch, amplitude,
-                output_file, use_file_input
-            )
-
-            # Set environment for proper UTF-8 handling
-            env = os.environ.copy()
-            env['PYTHONIOENCODING'] = 'utf-8'
-            if os.name != 'nt':  # Unix-like systems
-                env['LC_ALL'] = 'en_US.UTF-8'
-
-            # Execute espeak command
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, env=env)
-
-            if result.returncode == 0:
-                return {
-                    "success": True,
-                    "text": text,
-                    "language": language,
-                    "file_path": output_file,
-                    "file_size": os.path.getsize(output_file) if os.path.exists(output_file) else 0,
-                    "settings": {
-                        "speed": speed,
-                        "pitch": pitch,
-                        "amplitude": amplitude
-                    },
-                    "encoding_method": "file" if use_file_input else "direct"
-                }
+                output = self.spool.output('tts_output')
             else:
-                return {
-                    "success": False,
-                    "error": f"espeak-ng failed: {result.stderr}",
-                    "stdout": result.stdout,
-                    "command": " ".join(cmd)
-                }
+                output = atomic_output(output_file)
+
+            with output:
+                if self.library is not None:
+                    with self.metrics.stage('synth'):
+                        pcm = self.library.synthesize(
+                            text, self.supported_languages.get(language, 'en'),
+                            speed, pitch, amplitude)
+                    with self.metrics.stage('encode'):
+                        self._write_wav(output.temp_path, pcm)
+                    output_file = output.commit()
+                    return self.metrics.attach({
+                        "success": True,
+                        "text": text,
+                        "language": language,
+                        "file_path": output_file,
+                        "file_size": os.path.getsize(output_file),
+                        "settings": {
+                            "speed": speed,
+                            "pitch": pitch,
+                            "amplitude": amplitude
+                        },
+                        "encoding_method": "callback",
+                        "engine": "library"
+                    })
+
+                # Pass Arabic text through stdin to avoid argument encoding issues
+                use_stdin = language == 'ar' or self._contains_arabic_text(text)
+
+                # Build espeak command
+                cmd = self._build_espeak_command(
+                    text, language, speed, pitch, amplitude,
+                    output.temp_path, use_stdin
+                )
+
+                # Set environment for proper UTF-8 handling
+                env = os.environ.copy()
+                env['PYTHONIOENCODING'] = 'utf-8'
+                if os.name != 'nt':  # Unix-like systems
+                    env['LC_ALL'] = 'en_US.UTF-8'
+
+                # Execute espeak command
+                with self.metrics.stage('synth'):
+                    result = subprocess.run(
+                        cmd, input=text if use_stdin else None, capture_output=True,
+                        text=True, encoding='utf-8', env=env)
+
+                if result.returncode == 0:
+                    output_file = output.commit()
+                    return self.metrics.attach({
+                        "success": True,
+                        "text": text,
+                        "language": language,
+                        "file_path": output_file,
+                        "file_size": os.path.getsize(output_file),
+                        "settings": {
+                            "speed": speed,
+                            "pitch": pitch,
+                            "amplitude": amplitude
+                        },
+                        "encoding_method": "stdin" if use_stdin else "direct",
+                        "engine": "subprocess"
+                    })
+                else:
+                    return {
+                        "success": False,
+                        "error": f"espeak-ng failed: {result.stderr}",
+                        "stdout": result.stdout,
+                        "command": " ".join(cmd)
+                    }
 
         except Exception as e:
             return {
                 "success": False,
                 "error": f"TTS generation failed: {str(e)}"
             }
-        finally:
-            # Clean up temporary file
-            if temp_file_path:
-                self._cleanup_temp_file(temp_file_path)
 
     def text_to_speech_play(self, text, language="en", speed=175, pitch=50, amplitude=100):
         """
@@ -199,7 +245,6 @@ class ESpeakTTS:
                 "installation": self.get_installation_instructions()
             }
 
-        temp_file_path = None
         try:
             if not text.strip():
                 return {
@@ -207,19 +252,39 @@ class ESpeakTTS:
                     "error": "Empty text provided"
                 }
 
-            # Handle Arabic text with file-based approach
-            use_file_input = False
-            processed_text = text
+            if self.library is not None:
+                with self.metrics.stage('synth'):
+                    pcm = self.library.synthesize(
+                        text, self.supported_languages.get(language, 'en'),
+                        speed, pitch, amplitude)
+                with self.metrics.stage('playback'):
+                    played = self._play_pcm(pcm)
+                if not played:
+                    return {
+                        "success": False,
+                        "error": "No audio player found. Install aplay, paplay or sox."
+                    }
+                return self.metrics.attach({
+                    "success": True,
+                    "text": text,
+                    "language": language,
+                    "played": True,
+                    "settings": {
+                        "speed": speed,
+                        "pitch": pitch,
+                        "amplitude": amplitude
+                    },
+                    "encoding_method": "callback",
+                    "engine": "library"
+                })
 
-            if language == 'ar' or self._contains_arabic_text(text):
-                temp_file_path = self._create_temp_file_for_arabic(text)
-                processed_text = temp_file_path
-                use_file_input = True
+            # Pass Arabic text through stdin to avoid argument encoding issues
+            use_stdin = language == 'ar' or self._contains_arabic_text(text)
 
             # Build espeak command for direct playback
             cmd = self._build_espeak_command(
-                processed_text, language, speed, pitch, amplitude,
-                use_file=use_file_input
+                text, language, speed, pitch, amplitude,
+                use_stdin=use_stdin
             )
 
             # Set environment for proper UTF-8 handling
@@ -228,12 +293,14 @@ class ESpeakTTS:
             if os.name != 'nt':  # Unix-like systems
                 env['LC_ALL'] = 'en_US.UTF-8'
 
-            # Execute espeak command
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, env=env)
+            # Execute espeak command (synthesis and playback in one process)
+            with self.metrics.stage('playback'):
+                result = subprocess.run(
+                    cmd, input=text if use_stdin else None, capture_output=True,
+                    text=True, encoding='utf-8', env=env)
 
             if result.returncode == 0:
-                return {
+                return self.metrics.attach({
                     "success": True,
                     "text": text,
                     "language": language,
@@ -243,8 +310,9 @@ class ESpeakTTS:
                         "pitch": pitch,
                         "amplitude": amplitude
                     },
-                    "encoding_method": "file" if use_file_input else "direct"
-                }
+                    "encoding_method": "stdin" if use_stdin else "direct",
+                    "engine": "subprocess"
+                })
             else:
                 return {
                     "success": False,
@@ -258,10 +326,51 @@ class ESpeakTTS:
                 "success": False,
                 "error": f"TTS playback failed: {str(e)}"
             }
-        finally:
-            # Clean up temporary file
-            if temp_file_path:
-                self._cleanup_temp_file(temp_file_path)
+
+    def text_to_speech_stream(self, text, sink, language="en", speed=175, pitch=50, amplitude=100):
+        """
+        Convert text to speech and stream raw 16-bit mono PCM blocks to a sink.
+        Requires the in-process library.
+        :param text: Text to convert
+        :param sink: Callable receiving each PCM block as bytes
+        :param language: Language code
+        :param speed: Speech speed
+        :param pitch: Voice pitch
+        :param amplitude: Volume
+        :return: Result dictionary
+        """
+        if self.library is None:
+            return {
+                "success": False,
+                "error": "Streaming requires libespeak-ng",
+                "installation": self.get_installation_instructions()
+            }
+
+        if not text.strip():
+            return {
+                "success": False,
+                "error": "Empty text provided"
+            }
+
+        try:
+            with self.metrics.stage('synth'):
+                self.library.synthesize(
+                    text, self.supported_languages.get(language, 'en'),
+                    speed, pitch, amplitude, on_audio=sink)
+            return self.metrics.attach({
+                "success": True,
+                "text": text,
+                "language": language,
+                "sample_rate": self.library.sample_rate,
+                "sample_format": "s16le",
+                "channels": 1,
+                "engine": "library"
+            })
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"TTS streaming failed: {str(e)}"
+            }
 
     def list_voices(self):
         """List available voices."""
@@ -269,7 +378,7 @@ class ESpeakTTS:
             return {"error": "espeak-ng not installed"}
 
         try:
-            result = subprocess.run(['C:\\Program Files\\eSpeak NG\\espeak-ng.exe', '--voices'],
+            result = subprocess.run([self.espeak_executable, '--voices'],
                                     capture_output=True, text=True, check=True)
             return {
                 "success": True,
@@ -289,7 +398,8 @@ def main():
     # Support both direct text and file input
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('text', nargs='?', help='Text to convert to speech')
-    group.add_argument('--file', '-f', help='File containing text to convert')
+    group.add_argument('--file', '-f',
+                       help="File containing text to convert, '-' for stdin, 'fd:N' or 'shm:NAME'")
 
     parser.add_argument('--language', '-l', default='en',
                         help='Language code (en, ar, es, fr, etc.)')
@@ -302,14 +412,26 @@ def main():
                         help='Volume (0-200)')
     parser.add_argument('--play', action='store_true',
                         help='Play directly instead of saving to file')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write raw 16-bit PCM to stdout (result goes to stderr)')
     parser.add_argument('--list-voices', action='store_true',
                         help='List available voices')
     parser.add_argument('--format', choices=['json', 'text'], default='json',
                         help='Output format')
+    add_instrumentation_arguments(parser)
+    add_resource_arguments(parser)
 
     args = parser.parse_args()
 
-    tts = ESpeakTTS()
+    return run_with_profile(lambda: run(args), args.profile)
+
+
+def run(args):
+    """Run a synthesis for parsed command line arguments."""
+    metrics = SpeechMetrics(
+        'espeak_tts', enabled=(args.timings or bool(args.metrics_file)) or None)
+    profile = apply_profile(args.resource_profile)
+    tts = ESpeakTTS(metrics)
 
     if args.list_voices:
         result = tts.list_voices()
@@ -322,8 +444,7 @@ def main():
     # Get text from file or command line argument
     if args.file:
         try:
-            with open(args.file, 'r', encoding='utf-8-sig') as f:
-                text = f.read().strip()
+            text = read_text_source(args.file).strip()
         except Exception as e:
             print(json.dumps({
                 "success": False,
@@ -340,15 +461,41 @@ def main():
         }))
         return 1
 
-    if args.play:
-        result = tts.text_to_speech_play(
-            text, args.language, args.speed, args.pitch, args.amplitude
-        )
-    else:
-        result = tts.text_to_speech_file(
-            text, args.language, args.output,
-            args.speed, args.pitch, args.amplitude
-        )
+    if args.stream:
+        out = sys.stdout.buffer
+
+        def write_block(block):
+            out.write(block)
+            out.flush()
+
+        try:
+            with profile.job() as usage:
+                result = tts.text_to_speech_stream(
+                    text, write_block, args.language, args.speed, args.pitch, args.amplitude
+                )
+            result["resources"] = usage
+        except TimeoutError as e:
+            result = {"success": False, "error": str(e)}
+        metrics.dump_prometheus(args.metrics_file)
+        print(json.dumps(result), file=sys.stderr)
+        return 0 if result['success'] else 1
+
+    try:
+        with profile.job() as usage:
+            if args.play:
+                result = tts.text_to_speech_play(
+                    text, args.language, args.speed, args.pitch, args.amplitude
+                )
+            else:
+                result = tts.text_to_speech_file(
+                    text, args.language, args.output,
+                    args.speed, args.pitch, args.amplitude
+                )
+        result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e)}
+
+    metrics.dump_prometheus(args.metrics_file)
 
     if args.format == 'json':
         print(json.dumps(result, indent=2))
@@ -0,0 +1,256 @@
+import re
+import sys
+import threading
+
+from quality_tiers import load_tier_config
+from sensors_config import load_sensor_config
+
+
+# Intents at or above this confidence are answered without the LLM
+# (stt.intent_confidence in the tier configuration)
+DEFAULT_INTENT_CONFIDENCE = 0.75
+# Stricter thresholds for intents that change the vehicle's state. clear_dtcs
+# only asks for confirmation; the confirm turn is what clears the codes.
+INTENT_MIN_CONFIDENCE = {"clear_dtcs": 0.9, "confirm": 0.9}
+# n-best hypotheses decoded when intents are matched
+INTENT_ALTERNATIVES = 5
+# Recordings longer than this are dictation rather than commands: their best
+# transcript is matched alone, without a second n-best decoding pass
+INTENT_MAX_DURATION_S = 8.0
+
+# Spoken names of sensors besides their titles in sensors.config.ts
+SENSOR_ALIASES = {
+    'en': {
+        'VEHICLE_SPEED': ['speed', 'car speed', 'current speed'],
+        'ENGINE_RPM': ['rpm', 'r p m', 'rpms', 'revs', 'engine speed'],
+        'FUEL_TANK_LEVEL_INPUT': ['fuel', 'gas', 'fuel tank', 'gas level', 'fuel left'],
+        'CONTROL_MODULE_VOLTAGE': ['battery', 'voltage', 'battery level'],
+        'ENGINE_COOLANT_TEMPERATURE': ['coolant', 'coolant temp', 'engine temperature',
+                                       'engine temp'],
+        'ENGINE_OIL_TEMP': ['oil temperature', 'oil temp'],
+        'INTAKE_AIR_TEMPERATURE': ['intake temperature', 'intake air temperature'],
+        'AMBIENT_AIR_TEMPERATURE': ['outside temperature', 'temperature outside'],
+        'CALCULATED_ENGINE_LOAD': ['load'],
+        'THROTTLE_POSITION': ['throttle'],
+        'RUN_TIME_SINCE_ENGINE_START': ['run time', 'engine run time'],
+        'TIMING_ADVANCE': ['timing'],
+        'MAF_AIR_FLOW_RATE': ['air flow', 'mass air flow', 'maf'],
+    },
+    'ar': {
+        'VEHICLE_SPEED': ['السرعه', 'السرعة', 'سرعة السيارة', 'سرعه السياره'],
+        'ENGINE_RPM': ['دوران المحرك', 'عدد الدورات', 'الدورات'],
+        'FUEL_TANK_LEVEL_INPUT': ['الوقود', 'البنزين', 'مستوى الوقود', 'مستوي الوقود'],
+        'CONTROL_MODULE_VOLTAGE': ['البطارية', 'البطاريه', 'جهد البطارية'],
+        'ENGINE_COOLANT_TEMPERATURE': ['حرارة المحرك', 'حراره المحرك', 'درجة حرارة المحرك'],
+        'ENGINE_OIL_TEMP': ['حرارة الزيت', 'حراره الزيت'],
+    },
+}
+
+# Command patterns per language. {sensor} stands for any sensor name or
+# alias; slots are fixed values reported with the intent.
+INTENT_RULES = {
+    'en': [
+        {"intent": "read_sensor",
+         "pattern": r"(?:(?:whats|what is|hows|how is|check|read|tell me|show me|give me|get)\s+)?"
+                    r"(?:(?:the|my|current|engine)\s+)*{sensor}"
+                    r"(?:\s+(?:now|right now|reading|level|value))?"},
+        {"intent": "read_sensor",
+         "pattern": r"how fast (?:am i|are we|is (?:the|my) car) (?:going|driving)",
+         "slots": {"sensor": "VEHICLE_SPEED"}},
+        {"intent": "read_sensor",
+         "pattern": r"how much (?:fuel|gas) (?:is left|do i have|have i got|is in the tank)",
+         "slots": {"sensor": "FUEL_TANK_LEVEL_INPUT"}},
+        {"intent": "read_sensor",
+         "pattern": r"how hot is (?:the|my) (?:engine|coolant)",
+         "slots": {"sensor": "ENGINE_COOLANT_TEMPERATURE"}},
+        {"intent": "read_dtcs",
+         "pattern": r"(?:(?:whats|what is|what are|read|check|show me|show|list|tell me|get|"
+                    r"are there|do i have|do we have|any)\s+)*"
+                    r"(?:(?:the|my|any|active|current|stored)\s+)*{codes}",
+         "slots": {"kind": "active"}},
+        {"intent": "read_dtcs",
+         "pattern": r"(?:(?:whats|what is|what are|read|check|show me|show|list|tell me|get|"
+                    r"are there|do i have|any)\s+)*(?:(?:the|my|any)\s+)*pending {codes}",
+         "slots": {"kind": "pending"}},
+        {"intent": "read_dtcs",
+         "pattern": r"why is (?:the|my) check engine light on",
+         "slots": {"kind": "active"}},
+        {"intent": "clear_dtcs",
+         "pattern": r"(?:clear|reset|erase|delete|remove)\s+(?:(?:the|my|all|all the|engine)\s+)*"
+                    r"(?:{codes}|check engine light)"},
+        {"intent": "clear_dtcs",
+         "pattern": r"turn off (?:the )?check engine light"},
+        {"intent": "confirm",
+         "pattern": r"(?:yes|yeah|yep|sure|confirm|confirmed|do it|go ahead|clear them)"
+                    r"(?:\s+(?:yes|confirm|do it|go ahead|clear them))*"},
+        {"intent": "cancel",
+         "pattern": r"(?:no|nope|cancel|never mind|dont|dont clear them|stop|leave them)"},
+    ],
+    'ar': [
+        {"intent": "read_sensor",
+         "pattern": r"(?:(?:كم|ما|ما هي|ما هو|شو|اقرا|اعرض)\s+)?{sensor}"},
+        {"intent": "read_dtcs",
+         "pattern": r"(?:(?:ما|ما هي|اقرا|اعرض|هل يوجد|هل في|هل هناك|في)\s+)*{codes}",
+         "slots": {"kind": "active"}},
+        {"intent": "clear_dtcs",
+         "pattern": r"(?:امسح|احذف|مسح|حذف|ازاله|ازالة)\s+{codes}"},
+        {"intent": "confirm",
+         "pattern": r"(?:نعم|ايوه|ايوا|اكيد|موافق|اكد|تاكيد|امسحها)(?:\s+(?:نعم|اكد|امسحها))*"},
+        {"intent": "cancel",
+         "pattern": r"(?:لا|الغاء|الغي|لا تمسحها)"},
+    ],
+}
+
+CODE_PHRASES = {
+    'en': r"(?:(?:diagnostic |engine |fault |error )?(?:trouble )?codes?|dtcs?|d t cs?|faults)",
+    'ar': r"(?:(?:رموز|اكواد)\s+)?(?:الاعطال|الاخطاء)",
+}
+
+# Courtesy words dropped before matching, so they do not lower the coverage
+FILLERS = {
+    'en': r"\b(?:please|hey car|hey|okay|ok|um|uh|so|can you|could you|would you|quickly)\b",
+    'ar': r"(?:^|\s)(?:من فضلك|لو سمحت|يا)(?=\s|$)",
+}
+
+_ARABIC_MARKS = re.compile('[\u064b-\u0652\u0640]')
+_ARABIC_ALEFS = re.compile('[\u0622\u0623\u0625]')
+_NON_WORD = re.compile(r"[^\w\s]")
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def normalize_transcript(text, language="en"):
+    """Lower-case a transcript and strip punctuation, apostrophes and Arabic diacritics."""
+    text = text.lower()
+    if language == "ar":
+        text = _ARABIC_ALEFS.sub('ا', _ARABIC_MARKS.sub('', text))
+    return ' '.join(_NON_WORD.sub('', text).split())
+
+
+class IntentMatcher:
+    """
+    Match transcripts against a table of simple voice commands.
+
+    The command table is compiled once per language, with the sensor names
+    from sensors.config.ts and their aliases expanded into each pattern. A
+    hypothesis is scored by the share of its words the best command covers,
+    so "what's my speed" scores higher than "why does my speed drop on
+    hills". Over n-best hypotheses the score of an intent is the
+    posterior-weighted coverage of the hypotheses that agree on it.
+    """
+
+    def __init__(self, language="en", sensors=None, threshold=None):
+        """
+        :param sensors: Sensor configuration as returned by load_sensor_config
+                        (read from sensors.config.ts when omitted)
+        :param threshold: Confidence needed for the fast path (default from
+                          the tier configuration)
+        """
+        self.language = language if language in INTENT_RULES else "en"
+        if sensors is None:
+            try:
+                sensors = load_sensor_config()
+            except (OSError, ValueError) as e:
+                print(f"Warning: sensor names unavailable, using aliases only: {e}",
+                      file=sys.stderr)
+                sensors = {}
+        if threshold is None:
+            threshold = load_tier_config().get('stt', {}).get(
+                'intent_confidence', DEFAULT_INTENT_CONFIDENCE)
+        self.threshold = float(threshold)
+
+        aliases = SENSOR_ALIASES.get(self.language, {})
+        self.phrases = {}
+        for key in sensors or aliases:
+            names = list(aliases.get(key, []))
+            if self.language == "en" and key in sensors:
+                names.append(sensors[key]["title"])
+            for name in names:
+                self.phrases.setdefault(normalize_transcript(name, self.language), key)
+
+        # Longer names first, so "engine oil temperature" wins over "engine"
+        sensor_pattern = '(?P<sensor>' + '|'.join(
+            re.escape(phrase) for phrase in sorted(self.phrases, key=len, reverse=True)) + ')'
+        codes_pattern = CODE_PHRASES[self.language]
+        self.rules = []
+        for rule in INTENT_RULES[self.language]:
+            if '{sensor}' in rule["pattern"] and not self.phrases:
+                continue
+            pattern = rule["pattern"].replace('{sensor}', sensor_pattern).replace(
+                '{codes}', codes_pattern)
+            self.rules.append((rule["intent"], re.compile(r'(?:^|\s)(' + pattern + r')(?=\s|$)'),
+                               rule.get("slots", {})))
+        self._fillers = re.compile(FILLERS[self.language])
+
+    def match_text(self, text):
+        """
+        Find the command covering most of one transcript.
+        :return: {"intent", "slots", "coverage", "span"} or None
+        """
+        text = ' '.join(self._fillers.sub(' ', normalize_transcript(text, self.language)).split())
+        if not text:
+            return None
+        words = len(text.split())
+        best = None
+        for intent, regex, slots in self.rules:
+            match = regex.search(text)
+            if match is None:
+                continue
+            span = match.group(1)
+            coverage = len(span.split()) / words
+            if best is not None and coverage <= best["coverage"]:
+                continue
+            found = dict(slots)
+            if match.groupdict().get("sensor"):
+                found["sensor"] = self.phrases[match.group("sensor")]
+            best = {"intent": intent, "slots": found, "coverage": coverage, "span": span}
+        return best
+
+    def match(self, hypotheses, asr_confidence=None):
+        """
+        Pick the intent best supported by a set of hypotheses.
+        :param hypotheses: List of {"text", "posterior"}, best first
+        :param asr_confidence: Recognizer confidence of a single hypothesis,
+                               folded into the score (n-best posteriors already
+                               carry it)
+        :return: Intent dictionary, or None when no command matched
+        """
+        total = sum(h["posterior"] for h in hypotheses)
+        if total <= 0:
+            return None
+
+        support = {}
+        for hypothesis in hypotheses:
+            found = self.match_text(hypothesis["text"])
+            if found is None:
+                continue
+            key = (found["intent"], tuple(sorted(found["slots"].items())))
+            entry = support.setdefault(key, {"score": 0.0, "match": found,
+                                             "hypothesis": hypothesis["text"]})
+            entry["score"] += hypothesis["posterior"] * found["coverage"]
+        if not support:
+            return None
+
+        entry = max(support.values(), key=lambda e: e["score"])
+        confidence = entry["score"] / total
+        if asr_confidence is not None:
+            confidence *= asr_confidence
+        intent = entry["match"]["intent"]
+        return {
+            "name": intent,
+            "slots": entry["match"]["slots"],
+            "confidence": round(confidence, 3),
+            "fast_path": confidence >= max(self.threshold, INTENT_MIN_CONFIDENCE.get(intent, 0.0)),
+            "matched": entry["match"]["span"],
+            "hypothesis": entry["hypothesis"],
+            "hypotheses": len(hypotheses)
+        }
+
+
+def get_matcher(language="en"):
+    """Compiled matcher for a language, shared by every transcription in the process."""
+    with _matchers_lock:
+        if language not in _matchers:
+            _matchers[language] = IntentMatcher(language)
+        return _matchers[language]
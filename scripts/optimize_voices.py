@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:  # Needs the onnx package as well
+    quantize_dynamic = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from audio_spool import atomic_output
+from piper_tts import (PiperTTS, VARIANTS_DIR, VARIANTS_REGISTRY, VOICE_VARIANTS,
+                       variant_machine)
+from speech_metrics import PIPER_RTF_PATTERN
+
+
+# Fixed sentences per language: numbers, codes and sensor phrasing like
+# the assistant's real answers
+BENCHMARK_SENTENCES = {
+    'en': [
+        "Your coolant temperature is ninety two degrees Celsius.",
+        "The code P0301 means cylinder one is misfiring.",
+        "Battery voltage is twelve point six volts, which is normal.",
+        "Please check your tire pressure before the next long trip.",
+    ],
+    'ar': [
+        "درجة حرارة سائل التبريد اثنان وتسعون درجة مئوية.",
+        "الرمز P0301 يعني وجود خلل في الأسطوانة الأولى.",
+        "جهد البطارية اثنا عشر فولت وهو طبيعي.",
+        "يرجى فحص ضغط الإطارات قبل الرحلة القادمة.",
+    ],
+    'es': ["La temperatura del refrigerante es de noventa grados.",
+           "El voltaje de la batería es normal."],
+    'fr': ["La température du liquide de refroidissement est de quatre-vingt-dix degrés.",
+           "La tension de la batterie est normale."],
+    'de': ["Die Kühlmitteltemperatur beträgt neunzig Grad.",
+           "Die Batteriespannung ist normal."],
+    'it': ["La temperatura del liquido di raffreddamento è di novanta gradi.",
+           "La tensione della batteria è normale."],
+    'pt': ["A temperatura do líquido de arrefecimento é de noventa graus.",
+           "A tensão da bateria está normal."],
+    'ru': ["Температура охлаждающей жидкости девяносто градусов.",
+           "Напряжение аккумулятора в норме."],
+    'zh': ["冷却液温度是九十度。", "电池电压正常。"],
+}
+
+# Graph optimizations that do not depend on the CPU the model runs on
+GRAPH_OPTIMIZATION_LEVEL = 'ORT_ENABLE_EXTENDED'
+DEFAULT_MAX_DISTORTION = 2.0
+DEFAULT_MIN_SPEEDUP = 1.05
+
+# Spectral comparison settings
+FRAME_SIZE = 1024
+HOP_SIZE = 256
+BANDS = 40
+# Band levels further than this below the loudest band are clamped, so
+# noise in near-silent bands does not dominate the distance
+DYNAMIC_RANGE_DB = 80.0
+
+
+def optimize_graph(source, target):
+    """Save the model after onnxruntime's hardware-independent graph optimizations."""
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = getattr(
+        onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVEL)
+    with atomic_output(target) as output:
+        options.optimized_model_filepath = output.temp_path
+        onnxruntime.InferenceSession(source, options, providers=['CPUExecutionProvider'])
+        output.commit()
+
+
+def quantize_int8(source, target, op_types=None):
+    """Quantize weights to int8 with activations quantized at run time."""
+    with atomic_output(target) as output:
+        quantize_dynamic(source, output.temp_path, weight_type=QuantType.QInt8,
+                         op_types_to_quantize=op_types or None)
+        output.commit()
+
+
+def _band_spectrogram(pcm):
+    """Log-magnitude spectrogram in dB, averaged into BANDS linear bands."""
+    samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+    if len(samples) < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    count = 1 + (len(samples) - FRAME_SIZE) // HOP_SIZE
+    index = np.arange(FRAME_SIZE)[None, :] + HOP_SIZE * np.arange(count)[:, None]
+    spectrum = np.abs(np.fft.rfft(samples[index] * np.hanning(FRAME_SIZE), axis=1))
+    bands = np.array_split(spectrum, BANDS, axis=1)
+    energy = np.stack([band.mean(axis=1) for band in bands], axis=1)
+    levels = 20.0 * np.log10(energy + 1e-9)
+    return np.maximum(levels, levels.max() - DYNAMIC_RANGE_DB)
+
+
+def spectral_distance(reference, candidate):
+    """
+    Log-spectral distance in dB between two renderings of the same sentence,
+    after aligning their frames with dynamic time warping (quantization can
+    shift phoneme durations slightly).
+    :return: Mean per-frame RMS band difference in dB
+    """
+    ref = _band_spectrogram(reference)
+    cand = _band_spectrogram(candidate)
+    cost = np.sqrt(((ref[:, None, :] - cand[None, :, :]) ** 2).mean(axis=2))
+
+    n, m = cost.shape
+    total = np.full((n + 1, m + 1), np.inf)
+    steps = np.zeros((n + 1, m + 1))
+    total[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            moves = ((total[i - 1, j - 1], steps[i - 1, j - 1]),
+                     (total[i - 1, j], steps[i - 1, j]),
+                     (total[i, j - 1], steps[i, j - 1]))
+            best, length = min(moves)
+            total[i, j] = best + cost[i - 1, j - 1]
+            steps[i, j] = length + 1
+    return float(total[n, m] / steps[n, m])
+
+
+def synthesize_sentences(tts, model_path, sentences, work_dir):
+    """
+    Render the sentences with one piper process. Noise is disabled so the
+    output depends only on the model weights.
+    :return: (timing dictionary, list of PCM bytes, sample rate)
+    """
+    cmd = tts._build_piper_command(model_path, None, 1.0, 0.0, 1.0)
+    cmd.extend(['--noise_w', '0', '--output_dir', work_dir])
+    start = time.perf_counter()
+    result = subprocess.run(cmd, input='\n'.join(sentences) + '\n', capture_output=True,
+                            text=True, encoding='utf-8', cwd=str(tts.script_dir))
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Piper failed for {model_path}: {result.stderr.strip()}")
+
+    paths = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    audio = []
+    sample_rate = None
+    for path in paths:
+        with wave.open(os.path.join(str(tts.script_dir), path), 'rb') as wf:
+            audio.append(wf.readframes(wf.getnframes()))
+            sample_rate = wf.getframerate()
+
+    reports = PIPER_RTF_PATTERN.findall(result.stderr)
+    infer = sum(float(r[1]) for r in reports)
+    duration = sum(float(r[2]) for r in reports)
+    if not duration and audio:
+        duration = sum(len(pcm) / 2.0 / sample_rate for pcm in audio)
+    timing = {
+        "wall_s": round(wall, 4),
+        # Without piper's real-time factor lines, model loading counts too
+        "infer_s": round(infer if reports else wall, 4),
+        "audio_s": round(duration, 4)
+    }
+    timing["real_time_factor"] = round(timing["infer_s"] / duration, 4) if duration else None
+    return timing, audio, sample_rate
+
+
+def benchmark(tts, model_path, sentences, runs):
+    """
+    Render the sentence set several times.
+    :return: (summary with the median real-time factor, audio of the last run)
+    """
+    timings = []
+    audio = []
+    for _ in range(runs):
+        work_dir = tempfile.mkdtemp(prefix='.tmp-piper-', dir=tts.spool.root)
+        try:
+            timing, audio, _ = synthesize_sentences(tts, model_path, sentences, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        timings.append(timing)
+    factors = [t["real_time_factor"] for t in timings if t["real_time_factor"] is not None]
+    return {
+        "runs": runs,
+        "real_time_factor": round(statistics.median(factors), 4) if factors else None,
+        "infer_s": round(statistics.median(t["infer_s"] for t in timings), 4),
+        "audio_s": timings[-1]["audio_s"]
+    }, audio
+
+
+def compare_quality(reference, candidate):
+    """Quality of a variant against the fp32 rendering (None without numpy)."""
+    if np is None or len(reference) != len(candidate):
+        return None
+    distances = [spectral_distance(ref, cand) for ref, cand in zip(reference, candidate)]
+    durations = [len(cand) / float(len(ref)) for ref, cand in zip(reference, candidate) if ref]
+    return {
+        "log_spectral_distance_db": round(statistics.mean(distances), 3),
+        "max_log_spectral_distance_db": round(max(distances), 3),
+        "duration_ratio": round(statistics.mean(durations), 4) if durations else None
+    }
+
+
+def select_variant(baseline, variants, max_distortion, min_speedup):
+    """
+    Pick the fastest variant that is meaningfully faster than fp32 and within
+    the distortion budget. Quantized variants need a measured quality score;
+    graph optimization keeps the arithmetic and only needs to be faster.
+    :return: Variant name, or None to keep the fp32 model
+    """
+    base_rtf = baseline.get("real_time_factor")
+    best, best_rtf = None, None
+    for name, variant in variants.items():
+        rtf = (variant.get("benchmark") or {}).get("real_time_factor")
+        if not base_rtf or not rtf or base_rtf / rtf < min_speedup:
+            continue
+        quality = variant.get("quality")
+        if quality is None and name != 'opt':
+            continue
+        if quality is not None and quality["log_spectral_distance_db"] > max_distortion:
+            continue
+        if best_rtf is None or rtf < best_rtf:
+            best, best_rtf = name, rtf
+    return best
+
+
+def load_registry(voices_dir):
+    path = os.path.join(voices_dir, VARIANTS_REGISTRY)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"voices": {}}
+
+
+def save_registry(voices_dir, registry):
+    with atomic_output(os.path.join(voices_dir, VARIANTS_REGISTRY)) as output:
+        with open(output.temp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, indent=2, ensure_ascii=False)
+        output.commit()
+
+
+def optimize_voice(tts, voice_name, language, args):
+    """
+    Build, benchmark and score the variants of one voice.
+    :return: Registry entry for the voice
+    """
+    source = str(tts.voices_dir / voice_name)
+    entry = {"language": language, "source_size": os.path.getsize(source), "variants": {}}
+
+    for name in args.variants:
+        target_dir = tts.voices_dir / VARIANTS_DIR / name
+        os.makedirs(target_dir, exist_ok=True)
+        target = str(target_dir / voice_name)
+        if args.force or not os.path.exists(target):
+            print(f"Building {name} variant of {voice_name}...", file=sys.stderr)
+            start = time.perf_counter()
+            if name == 'opt':
+                optimize_graph(source, target)
+            else:
+                quantize_int8(source, target, args.quantize_ops)
+            build_s = round(time.perf_counter() - start, 2)
+        else:
+            build_s = None
+        # Piper reads the voice config next to the model
+        shutil.copyfile(f"{source}.json", f"{target}.json")
+        entry["variants"][name] = {
+            "path": os.path.relpath(target, str(tts.voices_dir)),
+            "size": os.path.getsize(target),
+            "build_s": build_s
+        }
+
+    if args.skip_benchmark:
+        entry["selected"] = None
+        return entry
+
+    sentences = BENCHMARK_SENTENCES.get(language, BENCHMARK_SENTENCES['en'])
+    print(f"Benchmarking {voice_name} (fp32)...", file=sys.stderr)
+    entry["baseline"], reference = benchmark(tts, source, sentences, args.runs)
+    for name, variant in entry["variants"].items():
+        print(f"Benchmarking {voice_name} ({name})...", file=sys.stderr)
+        variant["benchmark"], audio = benchmark(
+            tts, str(tts.voices_dir / variant["path"]), sentences, args.runs)
+        variant["quality"] = compare_quality(reference, audio)
+        base_rtf = entry["baseline"]["real_time_factor"]
+        rtf = variant["benchmark"]["real_time_factor"]
+        variant["speedup"] = round(base_rtf / rtf, 3) if base_rtf and rtf else None
+
+    entry["selected"] = select_variant(
+        entry["baseline"], entry["variants"], args.max_distortion, args.min_speedup)
+    return entry
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description='Build graph-optimized and int8-quantized Piper voice variants, '
+                    'benchmark them and register the best one per voice')
+    parser.add_argument('--script-dir', help='Directory containing piper executable and voices folder')
+    parser.add_argument('--languages', nargs='+',
+                        help='Languages to optimize (default: every supported language installed)')
+    parser.add_argument('--variants', nargs='+', choices=VOICE_VARIANTS[1:],
+                        default=list(VOICE_VARIANTS[1:]), help='Variants to build')
+    parser.add_argument('--quantize-ops', nargs='+',
+                        help='Operator types to quantize (default: all onnxruntime supports)')
+    parser.add_argument('--runs', type=int, default=3, help='Benchmark runs per model (default 3)')
+    parser.add_argument('--max-distortion', type=float, default=DEFAULT_MAX_DISTORTION,
+                        help='Largest mean log-spectral distance (dB) a selected variant may have')
+    parser.add_argument('--min-speedup', type=float, default=DEFAULT_MIN_SPEEDUP,
+                        help='Smallest speedup over fp32 worth selecting a variant for')
+    parser.add_argument('--skip-benchmark', action='store_true',
+                        help='Only build the variants; nothing is selected')
+    parser.add_argument('--force', action='store_true', help='Rebuild existing variants')
+    args = parser.parse_args()
+
+    if onnxruntime is None or ('int8' in args.variants and quantize_dynamic is None):
+        print(json.dumps({
+            "success": False,
+            "error": "onnxruntime and onnx are required: pip install onnxruntime onnx"
+        }, indent=2))
+        return 1
+    if np is None and not args.skip_benchmark:
+        print("Warning: numpy not installed; quality is not scored and int8 variants "
+              "will not be selected", file=sys.stderr)
+
+    tts = PiperTTS(args.script_dir)
+    if not tts.piper_available and not args.skip_benchmark:
+        print(json.dumps({
+            "success": False,
+            "error": "Piper TTS executable not found",
+            "installation": tts.get_installation_instructions()
+        }, indent=2))
+        return 1
+
+    registry = load_registry(str(tts.voices_dir))
+    registry["machine"] = variant_machine()
+    registry["onnxruntime"] = onnxruntime.__version__
+    results = {}
+    for language, voice_name in tts.supported_languages.items():
+        if args.languages and language not in args.languages:
+            continue
+        if not (tts.voices_dir / voice_name).exists():
+            continue
+        try:
+            results[voice_name] = registry.setdefault("voices", {})[voice_name] = \
+                optimize_voice(tts, voice_name, language, args)
+        except Exception as e:
+            print(f"Warning: Failed to optimize {voice_name}: {e}", file=sys.stderr)
+            results[voice_name] = {"error": str(e)}
+
+    save_registry(str(tts.voices_dir), registry)
+    print(json.dumps({
+        "success": bool(results) and not any("error" in r for r in results.values()),
+        "registry": os.path.join(str(tts.voices_dir), VARIANTS_REGISTRY),
+        "voices": results
+    }, indent=2, ensure_ascii=False))
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
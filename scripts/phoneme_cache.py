@@ -0,0 +1,346 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from espeak_ng_lib import ESpeakLibrary
+
+
+DEFAULT_MAX_ENTRIES = 50000
+# Entries also kept in process memory, for long-running callers
+MEMORY_ENTRIES = 4096
+# Let the table grow this much past the bound before trimming it
+EVICTION_SLACK = 0.1
+
+# Punctuation that ends a clause when followed by whitespace, mapped to the
+# phoneme Piper appends for it (as piper-phonemize does for eSpeak's clause
+# terminators)
+CLAUSE_PUNCTUATION = {
+    '.': '.', '…': '.', '!': '!', '?': '?', '؟': '?',
+    ',': ',', '،': ',', ';': ';', '؛': ';', ':': ':',
+}
+_CLAUSE_END_PATTERN = re.compile(
+    '[' + re.escape(''.join(CLAUSE_PUNCTUATION)) + r']+(?=\s|$)')
+
+BOS, EOS, PAD = '^', '$', '_'
+
+
+def default_cache_path():
+    """
+    Cache database location: SPEECH_PHONEME_CACHE if set, otherwise the
+    user cache directory, so entries survive reboots and temp cleanups.
+    """
+    configured = os.environ.get('SPEECH_PHONEME_CACHE')
+    if configured:
+        return configured
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'obd-speech', 'phonemes.sqlite3')
+
+
+def phoneme_cache_enabled():
+    """False when SPEECH_PHONEME_CACHE is set to 'off'."""
+    return os.environ.get('SPEECH_PHONEME_CACHE', '').lower() not in ('off', '0', 'false')
+
+
+def normalize_clause(text):
+    """Cache key form of a clause: NFC with whitespace collapsed."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def split_clauses(text):
+    """
+    Split text into clauses at punctuation followed by whitespace, so
+    decimals and codes ("3.5", "P0301") stay whole.
+    :return: List of (clause text, Piper punctuation phoneme or None)
+    """
+    clauses = []
+    start = 0
+    for match in _CLAUSE_END_PATTERN.finditer(text):
+        clause = normalize_clause(text[start:match.start()])
+        if clause:
+            clauses.append((clause, CLAUSE_PUNCTUATION[match.group()[0]]))
+        start = match.end()
+    clause = normalize_clause(text[start:])
+    if clause:
+        clauses.append((clause, None))
+    return clauses
+
+
+class PhonemeCache:
+    """
+    Persistent, bounded cache of Piper phoneme IDs per clause.
+
+    Entries are keyed by voice, eSpeak voice and normalized clause and live
+    in a SQLite database shared by all processes on the host, with a small
+    in-memory layer in front. Once the table exceeds max_entries the least
+    recently used entries are evicted. When the database cannot be opened
+    the cache keeps working in memory only.
+
+    Hits only save work where the IDs reach the model: in process
+    (SPEECH_PIPER_IN_PROCESS=1) or with a piper build that reads
+    "phoneme_ids". The stock piper CLI phonemizes the text itself.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or default_cache_path()
+        self.max_entries = max(1, int(max_entries if max_entries is not None else
+                                      os.environ.get('SPEECH_PHONEME_CACHE_MAX_ENTRIES',
+                                                     DEFAULT_MAX_ENTRIES)))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        """Open the database on first use; False when it is unusable."""
+        if self._db is None:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                     check_same_thread=False)
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                db.execute('CREATE TABLE IF NOT EXISTS phonemes ('
+                           'voice TEXT NOT NULL, espeak_voice TEXT NOT NULL, '
+                           'clause TEXT NOT NULL, ids BLOB NOT NULL, used REAL NOT NULL, '
+                           'PRIMARY KEY (voice, espeak_voice, clause))')
+                db.execute('CREATE INDEX IF NOT EXISTS phonemes_used ON phonemes (used)')
+                self._entries = db.execute('SELECT COUNT(*) FROM phonemes').fetchone()[0]
+                self._db = db
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: Phoneme cache {self.path} unavailable, using memory only: {e}",
+                      file=sys.stderr)
+                self._db = False
+        return self._db
+
+    def _remember(self, key, ids):
+        self._memory[key] = ids
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def get_many(self, voice, espeak_voice, clauses):
+        """
+        Look up several clauses.
+        :return: Dictionary of clause -> list of phoneme IDs for the hits
+        """
+        found = {}
+        with self._lock:
+            missing = []
+            for clause in clauses:
+                ids = self._memory.get((voice, espeak_voice, clause))
+                if ids is not None:
+                    self._memory.move_to_end((voice, espeak_voice, clause))
+                    found[clause] = ids
+                elif clause not in missing:
+                    missing.append(clause)
+
+            db = self._connect() if missing else None
+            if db:
+                try:
+                    used = []
+                    for clause in missing:
+                        row = db.execute(
+                            'SELECT ids FROM phonemes WHERE voice = ? AND espeak_voice = ? '
+                            'AND clause = ?', (voice, espeak_voice, clause)).fetchone()
+                        if row is not None:
+                            ids = array('H', row[0]).tolist()
+                            found[clause] = ids
+                            self._remember((voice, espeak_voice, clause), ids)
+                            used.append(clause)
+                    if used:
+                        now = time.time()
+                        db.executemany(
+                            'UPDATE phonemes SET used = ? WHERE voice = ? AND espeak_voice = ? '
+                            'AND clause = ?', [(now, voice, espeak_voice, c) for c in used])
+                except sqlite3.Error as e:
+                    print(f"Warning: Phoneme cache lookup failed: {e}", file=sys.stderr)
+
+            hits = sum(1 for clause in clauses if clause in found)
+            self.hits += hits
+            self.misses += len(clauses) - hits
+        return found
+
+    def put_many(self, voice, espeak_voice, entries):
+        """
+        Store phoneme IDs for several clauses.
+        :param entries: Dictionary of clause -> list of phoneme IDs
+        """
+        with self._lock:
+            for clause, ids in entries.items():
+                self._remember((voice, espeak_voice, clause), ids)
+
+            db = self._connect() if entries else None
+            if not db:
+                return
+            now = time.time()
+            try:
+                before = db.total_changes
+                db.executemany(
+                    'INSERT OR REPLACE INTO phonemes (voice, espeak_voice, clause, ids, used) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(voice, espeak_voice, clause, array('H', ids).tobytes(), now)
+                     for clause, ids in entries.items()])
+                self._entries += db.total_changes - before
+                if self._entries > self.max_entries * (1 + EVICTION_SLACK):
+                    self._evict(db)
+            except sqlite3.Error as e:
+                print(f"Warning: Phoneme cache update failed: {e}", file=sys.stderr)
+
+    def _evict(self, db):
+        """Trim the table back to max_entries, least recently used first."""
+        self._entries = db.execute('SELECT COUNT(*) FROM phonemes').fetchone()[0]
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            db.execute('DELETE FROM phonemes WHERE rowid IN '
+                       '(SELECT rowid FROM phonemes ORDER BY used LIMIT ?)', (excess,))
+            self._entries -= excess
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._memory.clear()
+            db = self._connect()
+            if db:
+                db.execute('DELETE FROM phonemes')
+                self._entries = 0
+
+    def stats(self):
+        """Return cache usage statistics."""
+        with self._lock:
+            db = self._connect()
+            entries = voices = None
+            if db:
+                entries, voices = db.execute(
+                    'SELECT COUNT(*), COUNT(DISTINCT voice) FROM phonemes').fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path if db else None,
+                "entries": entries,
+                "voices": voices,
+                "max_entries": self.max_entries,
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+class VoicePhonemizer:
+    """
+    Turn text into Piper phoneme IDs for one voice, phonemizing only the
+    clauses the cache has not seen.
+
+    Follows piper-phonemize: eSpeak IPA phonemes are NFD-decomposed and
+    mapped through the voice's phoneme_id_map, with the pad ID after every
+    phoneme and the BOS/EOS IDs around the utterance. Clause punctuation is
+    added as a phoneme, and clauses are joined with a space.
+    """
+
+    def __init__(self, voice_model_path, cache, library):
+        with open(f"{voice_model_path}.json", 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.voice = os.path.basename(voice_model_path)
+        self.espeak_voice = config.get('espeak', {}).get('voice', 'en-us')
+        self.id_map = config.get('phoneme_id_map') or {}
+        self.cache = cache
+        self.library = library
+        self.supported = (
+            config.get('phoneme_type', 'espeak') == 'espeak'
+            and all(symbol in self.id_map for symbol in (BOS, EOS, PAD, ' ')))
+
+    def _to_ids(self, phonemes):
+        pad = self.id_map[PAD]
+        ids = []
+        for phoneme in unicodedata.normalize('NFD', phonemes):
+            mapped = self.id_map.get(phoneme)
+            if mapped is None:
+                continue  # Piper skips phonemes the voice does not know
+            ids.extend(mapped)
+            ids.extend(pad)
+        return ids
+
+    def phoneme_ids(self, text, stats):
+        """
+        Encode text as one utterance.
+        :param text: Text to encode
+        :param stats: Dictionary whose clause/hit/miss counters are updated
+        :return: List of phoneme IDs
+        """
+        clauses = split_clauses(text)
+        cached = self.cache.get_many(
+            self.voice, self.espeak_voice, [clause for clause, _ in clauses])
+
+        computed = {}
+        for clause, _ in clauses:
+            if clause not in cached and clause not in computed:
+                computed[clause] = self._to_ids(
+                    self.library.text_to_phonemes(clause, self.espeak_voice))
+        if computed:
+            self.cache.put_many(self.voice, self.espeak_voice, computed)
+
+        hits = sum(1 for clause, _ in clauses if clause in cached)
+        stats["clauses"] = stats.get("clauses", 0) + len(clauses)
+        stats["hits"] = stats.get("hits", 0) + hits
+        stats["misses"] = stats.get("misses", 0) + len(clauses) - hits
+
+        pad = self.id_map[PAD]
+        ids = list(self.id_map[BOS]) + list(pad)
+        for index, (clause, punctuation) in enumerate(clauses):
+            ids.extend(cached.get(clause) or computed.get(clause, []))
+            if punctuation and punctuation in self.id_map:
+                ids.extend(self.id_map[punctuation])
+                ids.extend(pad)
+            if index < len(clauses) - 1:
+                ids.extend(self.id_map[' '])
+                ids.extend(pad)
+        ids.extend(self.id_map[EOS])
+        return ids
+
+
+def phonemizer_library():
+    """The eSpeak NG library if it can phonemize, otherwise None."""
+    library = ESpeakLibrary.get()
+    if library is None or not library.can_phonemize:
+        return None
+    return library
+
+
+def finish_stats(stats):
+    """Add the hit rate to per-request phoneme statistics."""
+    clauses = stats.get("clauses", 0)
+    stats["hit_rate"] = round(stats.get("hits", 0) / clauses, 4) if clauses else None
+    return stats
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Inspect or clear the Piper phoneme cache')
+    parser.add_argument('--stats', action='store_true', help='Print cache statistics')
+    parser.add_argument('--clear', action='store_true', help='Remove every cached entry')
+    parser.add_argument('--path', help='Cache database (default: SPEECH_PHONEME_CACHE)')
+    args = parser.parse_args()
+
+    cache = PhonemeCache(args.path)
+    result = {}
+    if args.clear:
+        cache.clear()
+        result["cleared"] = True
+    if args.stats or not args.clear:
+        result["stats"] = cache.stats()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from resource_profile import active_profile
+
+# numpy and onnxruntime are imported on first in-process use. Loading them
+# takes over 100 ms (more on a Pi), which every piper_tts run and sensor
+# readout would otherwise pay without running a model here
+np = None
+onnxruntime = None
+
+
+DEFAULT_MAX_BATCH = 8
+# Seconds the first request of a batch waits for others to join it
+DEFAULT_MAX_WAIT = 0.01
+DEFAULT_NOISE_W = 0.8
+# Samples the VITS decoder produces per frame
+HOP_LENGTH = 256
+# Frames quieter than this relative to the loudest frame count as padding
+PADDING_FLOOR_DB = -50.0
+MAX_WAV_VALUE = 32767.0
+
+
+def in_process_available():
+    """True when numpy and onnxruntime are installed (checked without importing them)."""
+    return all(importlib.util.find_spec(name) is not None for name in ('numpy', 'onnxruntime'))
+
+
+def _load_runtime():
+    """Import numpy and onnxruntime into this module."""
+    global np, onnxruntime
+    if onnxruntime is None:
+        import numpy
+        import onnxruntime as runtime
+        np, onnxruntime = numpy, runtime
+
+
+def in_process_enabled():
+    """In-process inference is opt-in through SPEECH_PIPER_IN_PROCESS=1."""
+    return os.environ.get('SPEECH_PIPER_IN_PROCESS', '').lower() in ('1', 'true', 'yes')
+
+
+def audio_to_pcm(samples):
+    """Float audio to 16-bit PCM, peak-normalized the way piper does it."""
+    peak = max(0.01, float(np.max(np.abs(samples)))) if len(samples) else 1.0
+    scaled = np.clip(samples * (MAX_WAV_VALUE / peak), -MAX_WAV_VALUE, MAX_WAV_VALUE)
+    return scaled.astype('<i2').tobytes()
+
+
+def trim_padding(samples):
+    """
+    Cut the tail a batched item got from padding. The exported Piper models
+    return no audio lengths, and masked frames decode to near silence, so
+    the item ends after its last frame above the padding floor.
+    """
+    frames = len(samples) // HOP_LENGTH
+    if frames == 0:
+        return samples
+    energy = np.sqrt(np.mean(
+        samples[:frames * HOP_LENGTH].reshape(frames, HOP_LENGTH) ** 2, axis=1))
+    floor = energy.max() * (10.0 ** (PADDING_FLOOR_DB / 20.0))
+    loud = np.nonzero(energy > floor)[0]
+    end = (loud[-1] + 2) * HOP_LENGTH if len(loud) else len(samples)
+    return samples[:end]
+
+
+class OnnxVoice:
+    """
+    A Piper voice loaded into this process with onnxruntime.
+
+    The session is sized by the active resource profile's thread count and
+    is safe to run from several threads.
+    """
+
+    def __init__(self, model_path):
+        with open(f"{model_path}.json", 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.model_path = model_path
+        self.sample_rate = int(self.config.get('audio', {}).get('sample_rate', 22050))
+        self.noise_w = float(self.config.get('inference', {}).get('noise_w', DEFAULT_NOISE_W))
+        self.pad_id = self.config.get('phoneme_id_map', {}).get('_', [0])[0]
+
+        _load_runtime()
+        options = onnxruntime.SessionOptions()
+        threads = active_profile().threads
+        if threads:
+            options.intra_op_num_threads = int(threads)
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def infer(self, items, scales):
+        """
+        Synthesize several utterances in one padded batch.
+        :param items: List of (phoneme IDs, speaker ID or None)
+        :param scales: (noise_scale, length_scale, noise_w)
+        :return: List of PCM bytes, one per item
+        """
+        lengths = np.array([len(ids) for ids, _ in items], dtype=np.int64)
+        batch = np.full((len(items), int(lengths.max())), self.pad_id, dtype=np.int64)
+        for row, (ids, _) in enumerate(items):
+            batch[row, :len(ids)] = ids
+
+        feeds = {
+            "input": batch,
+            "input_lengths": lengths,
+            "scales": np.array(scales, dtype=np.float32)
+        }
+        if 'sid' in self.input_names:
+            feeds["sid"] = np.array([speaker or 0 for _, speaker in items], dtype=np.int64)
+
+        outputs = self.session.run(None, feeds)
+        audio = outputs[0].reshape(len(items), -1)
+        # Models exported with an audio lengths output are split exactly
+        audio_lengths = outputs[1].reshape(-1) if len(outputs) > 1 else None
+
+        pcm = []
+        for row in range(len(items)):
+            samples = audio[row]
+            if audio_lengths is not None:
+                samples = samples[:int(audio_lengths[row])]
+            elif len(items) > 1 and lengths[row] < batch.shape[1]:
+                samples = trim_padding(samples)
+            pcm.append(audio_to_pcm(samples))
+        return pcm
+
+
+class _Request:
+    __slots__ = ('ids', 'speaker', 'scales', 'future')
+
+    def __init__(self, ids, speaker, scales):
+        self.ids = ids
+        self.speaker = speaker
+        self.scales = scales
+        self.future = Future()
+
+
+class MicroBatcher:
+    """
+    Gather utterances for one voice into batches.
+
+    The first pending utterance waits up to max_wait seconds for others to
+    join it, up to max_batch in total. Utterances with the same scales run
+    as one padded batch, and the audio goes back to each caller's future.
+    """
+
+    def __init__(self, voice, max_batch=None, max_wait=None):
+        self.voice = voice
+        self.max_batch = max(1, int(max_batch if max_batch is not None else
+                                    os.environ.get('SPEECH_BATCH_MAX_SIZE', DEFAULT_MAX_BATCH)))
+        self.max_wait = float(max_wait if max_wait is not None else
+                              float(os.environ.get('SPEECH_BATCH_MAX_WAIT_MS',
+                                                   DEFAULT_MAX_WAIT * 1000)) / 1000.0)
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, ids, scales, speaker=None):
+        """
+        Queue one utterance.
+        :return: Future resolving to (PCM bytes, size of the batch it ran in)
+        """
+        request = _Request(ids, speaker, tuple(scales))
+        self._queue.put(request)
+        return request.future
+
+    def _gather(self):
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                pending.append(self._queue.get(timeout=timeout) if timeout > 0
+                               else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            groups = {}
+            for request in self._gather():
+                groups.setdefault(request.scales, []).append(request)
+            for scales, requests in groups.items():
+                try:
+                    pcm = self.voice.infer([(r.ids, r.speaker) for r in requests], scales)
+                except Exception as e:
+                    for request in requests:
+                        request.future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.items += len(requests)
+                for request, audio in zip(requests, pcm):
+                    request.future.set_result((audio, len(requests)))
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_s": self.max_wait,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else None
+        }
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_path):
+    """The process-wide batcher for a voice model, loading the model once."""
+    with _batchers_lock:
+        batcher = _batchers.get(model_path)
+        if batcher is None:
+            batcher = _batchers[model_path] = MicroBatcher(OnnxVoice(model_path))
+        return batcher
+
+
+def benchmark(model_path, requests, concurrency, max_batch, max_wait, seed=1):
+    """
+    Throughput of concurrent synthesis with a given batch limit, using
+    random phoneme ID sequences of typical sentence lengths.
+    """
+    voice = OnnxVoice(model_path)
+    batcher = MicroBatcher(voice, max_batch, max_wait)
+    id_values = [ids[0] for key, ids in voice.config.get('phoneme_id_map', {}).items()
+                 if key not in ('^', '$', '_')] or list(range(1, 100))
+    rng = random.Random(seed)
+    utterances = [[rng.choice(id_values) for _ in range(rng.randint(40, 160))]
+                  for _ in range(requests)]
+    scales = (0.667, 1.0, voice.noise_w)
+
+    # Warm up the session so the first batch does not pay for it
+    voice.infer([(utterances[0], None)], scales)
+
+    def one(ids):
+        start = time.perf_counter()
+        pcm, _ = batcher.submit(ids, scales).result()
+        return time.perf_counter() - start, len(pcm) / 2.0 / voice.sample_rate
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, utterances))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "max_batch": max_batch,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "utterances_per_s": round(requests / elapsed, 3),
+        "audio_s_per_s": round(sum(audio for _, audio in results) / elapsed, 3),
+        "p50_latency_s": round(latencies[len(latencies) // 2], 4),
+        "max_latency_s": round(latencies[-1], 4),
+        "batching": batcher.stats()
+    }
+
+
+def main():
+    """Command line interface: measure batching throughput for a voice."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark micro-batched in-process Piper inference')
+    parser.add_argument('model', help='Piper .onnx voice (with its .onnx.json)')
+    parser.add_argument('--requests', type=int, default=32, help='Utterances to synthesize')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[1, DEFAULT_MAX_BATCH],
+                        help='Batch limits to compare (default 1 and 8)')
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help='Batching window in milliseconds')
+    args = parser.parse_args()
+
+    if not in_process_available():
+        print(json.dumps({
+            "success": False,
+            "error": "numpy and onnxruntime are required: pip install numpy onnxruntime"
+        }, indent=2))
+        return 1
+
+    runs = [benchmark(args.model, args.requests, args.concurrency, size,
+                      args.max_wait_ms / 1000.0) for size in args.max_batch]
+    baseline = runs[0]["utterances_per_s"]
+    for run in runs:
+        run["speedup"] = round(run["utterances_per_s"] / baseline, 3) if baseline else None
+    print(json.dumps({"success": True, "model": args.model, "runs": runs}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
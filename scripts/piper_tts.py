@@ -1,17 +1,80 @@
 import os
 import sys
 import json
+import wave
+import shutil
+import tempfile
 import argparse
 import subprocess
-import tempfile
 import re
 import glob
+import time
 import platform
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from speech_metrics import SpeechMetrics, add_instrumentation_arguments, run_with_profile
+from speech_io import iter_text_source, read_text_source, resample_pcm
+from text_segmenter import SentenceSegmenter, script_runs
+from quality_tiers import TTS_TIERS, load_tier_config, track_job, tts_policy, voice_tier
+from audio_spool import atomic_output, get_spool
+from resource_profile import active_profile, add_resource_arguments, apply_profile
+from piper_onnx import get_batcher, in_process_available, in_process_enabled
+from speech_trace import SpeechTrace
+from phoneme_cache import (PhonemeCache, VoicePhonemizer, default_cache_path, finish_stats,
+                           phoneme_cache_enabled, phonemizer_library)
+
+
+# Optimized voice variants (built by optimize_voices.py) live under
+# voices/variants/<variant>/ and are registered in voices/variants.json
+VOICE_VARIANTS = ('fp32', 'opt', 'int8')
+VARIANTS_DIR = 'variants'
+VARIANTS_REGISTRY = 'variants.json'
+# Pause piper puts between sentences, in seconds
+SENTENCE_SILENCE = 0.2
+# Whether each piper executable reads phoneme IDs, kept beside the phoneme cache
+PIPER_CAPABILITIES_FILE = 'piper_capabilities.json'
+
+
+def variant_machine():
+    """
+    The hardware optimized variants are selected for: architecture and CPU
+    model, since int8 and graph-optimized speedups depend on both.
+    """
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.lower().startswith(('model name', 'hardware', 'cpu model')):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{platform.machine()} {cpu}".strip()
 
 
 class PiperTTS:
-    def __init__(self, script_dir=None):
+    def __init__(self, script_dir=None, metrics=None, tier=None, phoneme_cache=True,
+                 variant=None, in_process=None):
+        self.metrics = metrics or SpeechMetrics('piper_tts')
+        self.spool = get_spool()
+        self.tier_config = load_tier_config()
+        self.tier_policy = tts_policy(self.tier_config, tier)
+        # Phoneme IDs are cached per clause and fed to the in-process model,
+        # or to piper's JSON input when the piper build reads them
+        self.phoneme_cache = PhonemeCache() if phoneme_cache and phoneme_cache_enabled() else None
+        self._phonemizers = {}
+        self._reads_phoneme_ids = None
+        self._probe_started = False
+        # 'auto' uses the variant the optimizer selected for each voice
+        self.variant = variant or os.environ.get('SPEECH_VOICE_VARIANT') or 'auto'
+        # Run voices in this process with onnxruntime, batching sentences
+        self.in_process = (in_process_enabled() if in_process is None else in_process) \
+            and in_process_available()
+        self._batchers = {}
+        self._speakers = {}
+
         # Set the script directory (where piper executable and voices are located)
         if script_dir is None:
             script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -45,11 +108,13 @@ class PiperTTS:
             'zh': 'zh_CN-huayan-medium.onnx',  # Chinese voice
         }
 
-        # Check if piper is available
-        self.piper_available = self._check_piper_installation()
+        with self.metrics.stage('probe'):
+            # Check if piper is available
+            self.piper_available = self._check_piper_installation()
 
-        # Scan for available voice models
-        self.available_voices = self._scan_available_voices()
+            # Scan for available voice models
+            self.available_voices = self._scan_available_voices()
+            self.voice_variants = self._load_voice_variants()
 
     def _check_piper_installation(self):
         """Check if piper executable exists and is executable on Unix systems."""
@@ -82,6 +147,48 @@ class PiperTTS:
 
         return available_voices
 
+    def _load_voice_variants(self):
+        """
+        Read the optimized variant registry; empty when none were built.
+        Selections benchmarked on other hardware are dropped, since the
+        fastest variant there need not be the fastest here.
+        """
+        try:
+            with open(self.voices_dir / VARIANTS_REGISTRY, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+            voices = registry.get('voices', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+        if registry.get('machine') != variant_machine():
+            selected = [voice for voice, entry in voices.items() if entry.get('selected')]
+            if selected and self.variant == 'auto':
+                print(f"Warning: voice variants were selected on {registry.get('machine')}; "
+                      f"using fp32 until optimize_voices.py is run on this machine",
+                      file=sys.stderr)
+            voices = {voice: dict(entry, selected=None) for voice, entry in voices.items()}
+        return voices
+
+    def _apply_variant(self, voice_model_path):
+        """Swap a voice model for its registered optimized variant, if any."""
+        if not voice_model_path or self.variant == 'fp32':
+            return voice_model_path
+        entry = self.voice_variants.get(os.path.basename(voice_model_path), {})
+        name = entry.get('selected') if self.variant == 'auto' else self.variant
+        variant = entry.get('variants', {}).get(name) if name else None
+        if not variant:
+            return voice_model_path
+        variant_path = self.voices_dir / variant['path']
+        if variant_path.exists() and Path(f"{variant_path}.json").exists():
+            return str(variant_path)
+        return voice_model_path
+
+    def _voice_variant(self, voice_model_path):
+        """Name of the variant a voice model path points to."""
+        path = Path(voice_model_path)
+        if path.parent.parent.name == VARIANTS_DIR and path.parent.name in VOICE_VARIANTS:
+            return path.parent.name
+        return 'fp32'
+
     def _get_voice_model_path(self, language):
         """Get the path to the voice model for a given language."""
         # Check if we have a predefined voice for this language
@@ -108,38 +215,517 @@ class PiperTTS:
 
         return None
 
-    def _contains_arabic_text(self, text):
-        """Check if text contains Arabic characters."""
-        arabic_pattern = re.compile(r'[\u0600-\u06FF]')
-        return bool(arabic_pattern.search(text))
+    def _voice_speakers(self, voice_model_path):
+        """
+        Read the speakers of a multi-speaker voice from its .onnx.json config.
+        :return: Dictionary of speaker name -> speaker ID, empty for single-speaker voices
+        """
+        if voice_model_path not in self._speakers:
+            speakers = {}
+            try:
+                with open(f"{voice_model_path}.json", 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                num_speakers = int(config.get('num_speakers') or 1)
+                if num_speakers > 1:
+                    speakers = {str(name): int(speaker_id) for name, speaker_id
+                                in (config.get('speaker_id_map') or {}).items()}
+                    # Unnamed speakers are addressed by their ID
+                    speakers = speakers or {str(i): i for i in range(num_speakers)}
+            except (OSError, ValueError, TypeError, AttributeError):
+                pass
+            self._speakers[voice_model_path] = speakers
+        return self._speakers[voice_model_path]
+
+    def _resolve_speaker(self, voice_model_path, speaker):
+        """
+        Map a requested speaker name or ID to the voice's speaker ID. The
+        request is ignored for single-speaker voices, e.g. when a language
+        falls back to another voice.
+        :return: (speaker ID or None for the default, speaker dictionary or None)
+        :raises ValueError: When a multi-speaker voice has no such speaker
+        """
+        speakers = self._voice_speakers(voice_model_path) if voice_model_path else {}
+        if speaker is None or str(speaker) == '' or not speakers:
+            return None, None
+        name = str(speaker)
+        if name not in speakers and name.isdigit():
+            # A numeric ID rather than a speaker name
+            name = next((n for n, i in speakers.items() if i == int(name)), name)
+        if name not in speakers:
+            raise ValueError(
+                f"Voice {os.path.basename(voice_model_path)} has no speaker '{speaker}'")
+        return speakers[name], {"id": speakers[name], "name": name}
+
+    def _voice_sample_rate(self, voice_model_path):
+        """Read the output sample rate from the voice's .onnx.json config."""
+        try:
+            with open(f"{voice_model_path}.json", 'r', encoding='utf-8') as f:
+                return int(json.load(f)['audio']['sample_rate'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 22050
+
+    def _open_raw_player(self, sample_rate):
+        """Start an audio player reading raw 16-bit mono PCM on its stdin."""
+        rate = str(sample_rate)
+        players = [
+            ['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', rate, '-'],
+            ['paplay', '--raw', '--format=s16le', '--channels=1', f'--rate={rate}'],
+            ['play', '-q', '-t', 'raw', '-e', 'signed', '-b', '16', '-c', '1', '-r', rate, '-'],
+        ]
+        for cmd in players:
+            try:
+                return subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _voice_tiers(self, language):
+        """
+        Map each quality tier installed for a language to one voice.
+        Configured voices win, then the default voice, then the first by name.
+        :return: Dictionary of tier -> voice file name
+        """
+        configured = self.tier_config.get('tts', {}).get('voices', {}).get(language, {})
+        preferred = self.supported_languages.get(language)
+        installed = {}
+        for voice_name in sorted(self.available_voices.get(language, [])):
+            tier = voice_tier(voice_name)
+            if tier is not None:
+                installed.setdefault(tier, []).append(voice_name)
+
+        tiers = {}
+        for tier, voices in installed.items():
+            for candidate in (configured.get(tier), preferred):
+                if candidate in voices:
+                    tiers[tier] = candidate
+                    break
+            else:
+                tiers[tier] = voices[0]
+        return tiers
 
-    def _create_temp_file_for_text(self, text):
-        """Create a temporary file with proper UTF-8 encoding for text input."""
+    def _select_voice(self, language):
+        """
+        Pick the voice for a language at the tier the load policy chooses.
+        :return: (voice model path or None, tier selection dictionary)
+        """
+        if language not in self.available_voices and 'en' in self.available_voices:
+            language = 'en'
+
+        tiers = self._voice_tiers(language)
+        if not tiers:
+            # Voices without a tier suffix: keep the fixed mapping
+            return (self._apply_variant(self._get_voice_model_path(language)),
+                    {"tier": None, "reason": "untiered"})
+
+        selection = self.tier_policy.choose(tiers)
+        return self._apply_variant(str(self.voices_dir / tiers[selection["tier"]])), selection
+
+    def _phonemizer(self, voice_model_path):
+        """
+        The phonemizer for a voice, or None when the phoneme cache is off,
+        eSpeak NG cannot phonemize, or the voice is not eSpeak based.
+        """
+        if self.phoneme_cache is None:
+            return None
+        if voice_model_path not in self._phonemizers:
+            phonemizer = None
+            library = phonemizer_library()
+            if library is not None:
+                try:
+                    phonemizer = VoicePhonemizer(voice_model_path, self.phoneme_cache, library)
+                    if phonemizer.supported:
+                        library.text_to_phonemes('a', phonemizer.espeak_voice)
+                    else:
+                        phonemizer = None
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Warning: Sending text to piper, phonemizer unavailable for "
+                          f"{os.path.basename(voice_model_path)}: {e}", file=sys.stderr)
+                    phonemizer = None
+            self._phonemizers[voice_model_path] = phonemizer
+        return self._phonemizers[voice_model_path]
+
+    def _capabilities(self):
+        """:return: (capability file path, key of this piper executable, known capabilities)"""
+        stat = self.piper_executable.stat()
+        key = f"{self.piper_executable.resolve()}:{stat.st_size}:{int(stat.st_mtime)}"
+        path = os.path.join(os.path.dirname(default_cache_path()), PIPER_CAPABILITIES_FILE)
         try:
-            temp_file = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8',
-                                                    suffix='.txt', delete=False)
-            temp_file.write(text)
-            temp_file.close()
-            return temp_file.name
-        except Exception as e:
-            raise Exception(f"Failed to create temporary file: {str(e)}")
+            with open(path, 'r', encoding='utf-8') as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            known = {}
+        return path, key, known
+
+    def probe_phoneme_ids(self, voice_model_path=None, language='en'):
+        """
+        Find out whether the piper executable synthesizes from "phoneme_ids"
+        in --json-input lines, and remember the answer beside the phoneme
+        cache. The same short text is sent with the IDs of a long sentence
+        and with its own IDs: only a build that reads the IDs makes the first
+        much longer. Costs two piper runs, so it is a setup step
+        (--probe-phoneme-ids), never part of a request.
+        :param voice_model_path: Voice to probe with (default: the language's voice)
+        :return: Result dictionary
+        """
+        if not self.piper_available:
+            return {"success": False, "error": "Piper TTS executable not found"}
+        voice_model_path = voice_model_path or self._get_voice_model_path(language)
+        phonemizer = self._phonemizer(voice_model_path) if voice_model_path else None
+        if phonemizer is None:
+            return {
+                "success": False,
+                "error": "Probing needs a voice and libespeak-ng to phonemize for it"
+            }
+
+        cmd = self._build_piper_command(voice_model_path) + ['--output_raw', '--json-input']
+
+        def audio_bytes(sentence):
+            line = json.dumps({"text": "Hi.", "phoneme_ids": phonemizer.phoneme_ids(
+                sentence, {})})
+            result = subprocess.run(cmd, input=(line + '\n').encode('utf-8'),
+                                    capture_output=True, timeout=60,
+                                    cwd=str(self.script_dir))
+            return len(result.stdout) if result.returncode == 0 else 0
 
-    def _cleanup_temp_file(self, file_path):
-        """Clean up temporary file."""
         try:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-        except Exception as e:
-            print(
-                f"Warning: Failed to cleanup temp file {file_path}: {e}", file=sys.stderr)
+            short = audio_bytes("Hi.")
+            reads = short > 0 and audio_bytes(
+                "The engine temperature is normal and every sensor reads fine.") > 2 * short
+        except (OSError, subprocess.SubprocessError) as e:
+            return {"success": False, "error": f"Probe failed: {str(e)}"}
+
+        path, key, known = self._capabilities()
+        known[key] = reads
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_output(path) as output:
+                with open(output.temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(known, f, indent=2)
+                output.commit()
+        except OSError as e:
+            print(f"Warning: Failed to save piper capabilities to {path}: {e}", file=sys.stderr)
+        self._reads_phoneme_ids = reads
+        return {
+            "success": True,
+            "executable": str(self.piper_executable),
+            "voice_model": os.path.basename(voice_model_path),
+            "reads_phoneme_ids": reads,
+            "capabilities_file": path
+        }
+
+    def _probe_in_background(self, voice_model_path):
+        """Run probe_phoneme_ids in a detached low-priority process."""
+        if self._probe_started:
+            return
+        self._probe_started = True
+        cmd = [sys.executable, os.path.abspath(__file__), '--probe-phoneme-ids',
+               voice_model_path, '--script-dir', str(self.script_dir),
+               '--resource-profile', 'background']
+        try:
+            subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            print(f"Warning: Failed to start the piper phoneme ID probe: {e}", file=sys.stderr)
+
+    def _piper_reads_phoneme_ids(self, voice_model_path):
+        """
+        Whether the piper executable reads "phoneme_ids" in --json-input
+        lines. The stock piper CLI only reads "text" there and runs eSpeak
+        itself, so with it the phoneme cache saves nothing and only the
+        in-process path (SPEECH_PIPER_IN_PROCESS=1) benefits from cache hits.
+        SPEECH_PIPER_PHONEME_IDS=1 or 0 decides without probing. Otherwise the
+        answer probe_phoneme_ids stored is used; while there is none, text is
+        sent and the probe runs in the background.
+        :return: True, False, or None while the probe is pending
+        """
+        configured = os.environ.get('SPEECH_PIPER_PHONEME_IDS', '').lower()
+        if configured:
+            return configured in ('1', 'true', 'yes')
+        if self._reads_phoneme_ids is None:
+            _, key, known = self._capabilities()
+            if key not in known:
+                self._probe_in_background(voice_model_path)
+                return None
+            self._reads_phoneme_ids = known[key]
+        return self._reads_phoneme_ids
+
+    def _phoneme_input(self, voice_model_path):
+        """
+        Decide how text is fed to piper for a voice. Phoneme IDs are only
+        sent to piper builds that read them; otherwise piper phonemizes the
+        text itself and the result says so.
+        :return: (phonemizer or None for plain text, phoneme statistics dictionary)
+        """
+        phonemizer = self._phonemizer(voice_model_path)
+        if phonemizer is None:
+            return None, {"input": "text"}
+        reads = self._piper_reads_phoneme_ids(voice_model_path)
+        if not reads:
+            return None, {
+                "input": "text",
+                "piper_reads_phoneme_ids": reads,
+                "note": ("piper phonemizes the text itself; phoneme cache hits only save work "
+                         "in process (SPEECH_PIPER_IN_PROCESS=1)" if reads is False else
+                         "checking whether piper reads phoneme IDs; sending text meanwhile")
+            }
+        return phonemizer, {"input": "phoneme_ids"}
+
+    def _encode_line(self, phonemizer, line, phonemes):
+        """
+        Encode one input line for piper. With a phonemizer this is a
+        --json-input line carrying the phoneme IDs, so piper skips eSpeak;
+        the text is kept beside them.
+        """
+        if phonemizer is None:
+            return line
+        with self.metrics.stage('phonemize'):
+            ids = phonemizer.phoneme_ids(line, phonemes)
+        return json.dumps({"text": line, "phoneme_ids": ids}, ensure_ascii=False)
+
+    def _batcher(self, voice_model_path):
+        """
+        The in-process batcher for a voice, or None to run the piper
+        executable. Needs numpy, onnxruntime and a phonemizer for the voice.
+        """
+        if not self.in_process or self._phonemizer(voice_model_path) is None:
+            return None
+        if voice_model_path not in self._batchers:
+            try:
+                self._batchers[voice_model_path] = get_batcher(voice_model_path)
+            except Exception as e:
+                print(f"Warning: Using the piper executable, failed to load "
+                      f"{os.path.basename(voice_model_path)} in process: {e}", file=sys.stderr)
+                self._batchers[voice_model_path] = None
+        return self._batchers[voice_model_path]
+
+    def _text_to_speech_in_process(self, batcher, voice_model_path, tier, text, language,
+                                   output, speed, noise_scale, length_scale, speaker=None):
+        """
+        Synthesize with the in-process model. Every sentence is queued as its
+        own utterance, so the sentences of one answer, and concurrent
+        requests for the same voice, run as padded batches. The speakers of
+        a multi-speaker voice share the model and batch together.
+        """
+        speaker_id, speaker_info = self._resolve_speaker(voice_model_path, speaker)
+        segmenter = SentenceSegmenter()
+        sentences = segmenter.feed(text) + segmenter.flush()
+        phonemizer = self._phonemizer(voice_model_path)
+        phonemes = {"input": "phoneme_ids"}
+        with self.metrics.stage('phonemize'):
+            utterances = [phonemizer.phoneme_ids(sentence, phonemes) for sentence in sentences]
+
+        scales = (noise_scale, length_scale, batcher.voice.noise_w)
+        with self.metrics.stage('synth'), track_job('tts'):
+            futures = [batcher.submit(ids, scales, speaker_id) for ids in utterances]
+            audio = [future.result() for future in futures]
+
+        sample_rate = batcher.voice.sample_rate
+        silence = b'\0\0' * int(SENTENCE_SILENCE * sample_rate)
+        with self.metrics.stage('encode'):
+            with wave.open(output.temp_path, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(sample_rate)
+                for pcm, _ in audio:
+                    wf.writeframes(pcm)
+                    wf.writeframes(silence)
+        output_file = output.commit()
+
+        return self.metrics.attach({
+            "success": True,
+            "text": text,
+            "language": language,
+            "voice_model": os.path.basename(voice_model_path),
+            "voice_variant": self._voice_variant(voice_model_path),
+            "speaker": speaker_info,
+            "tier": tier["tier"],
+            "tier_selection": tier,
+            "file_path": output_file,
+            "file_size": os.path.getsize(output_file),
+            "phonemes": finish_stats(phonemes),
+            "inference": {
+                "mode": "in_process",
+                "utterances": len(utterances),
+                "batch_sizes": [size for _, size in audio],
+                "batcher": batcher.stats()
+            },
+            "settings": {
+                "speed": speed,
+                "noise_scale": noise_scale,
+                "length_scale": length_scale
+            }
+        })
+
+    def _plan_segments(self, text, language):
+        """
+        Split mixed-script text into runs and pick the voice for each.
+        :return: List of segment dictionaries, or an empty list when the text
+                 is read by a single voice
+        """
+        runs = script_runs(text, language)
+        if len({run_language for run_language, _ in runs}) < 2:
+            return []
+
+        segments = []
+        for run_language, run_text in runs:
+            voice_model_path, tier = self._select_voice(run_language)
+            if not voice_model_path:
+                return []
+            segments.append({
+                "language": run_language,
+                "text": run_text,
+                "voice_model_path": voice_model_path,
+                "tier": tier
+            })
+        if len({segment["voice_model_path"] for segment in segments}) < 2:
+            return []
+        return segments
+
+    def _synthesize_lines(self, voice_model_path, lines, speed, noise_scale, length_scale,
+                          phonemes=None, speaker_id=None):
+        """
+        Synthesize several lines with one piper process, so the voice model
+        is loaded once.
+        :param phonemes: Optional dictionary receiving the phoneme statistics
+        :param speaker_id: Speaker of a multi-speaker voice (default speaker when None)
+        :return: List of (pcm bytes, sample_rate), one per line
+        """
+        work_dir = tempfile.mkdtemp(prefix='.tmp-piper-', dir=self.spool.root)
+        try:
+            cmd = self._build_piper_command(
+                voice_model_path, None, speed, noise_scale, length_scale, speaker_id)
+            cmd.extend(['--output_dir', work_dir])
+            phonemizer, stats = self._phoneme_input(voice_model_path)
+            if phonemizer is not None:
+                cmd.append('--json-input')
+            piper_input = [self._encode_line(phonemizer, line, stats) for line in lines]
+            if phonemes is not None:
+                phonemes.update(stats)
+            env = os.environ.copy()
+            env['PYTHONIOENCODING'] = 'utf-8'
+
+            result = subprocess.run(active_profile().worker_command(cmd),
+                                    input='\n'.join(piper_input) + '\n', capture_output=True,
+                                    text=True, encoding='utf-8', env=env,
+                                    cwd=str(self.script_dir))
+            self.metrics.record_piper_stderr(result.stderr)
+            if result.returncode != 0:
+                raise RuntimeError(f"Piper TTS failed: {result.stderr}")
+
+            # piper prints the path of each WAV it writes, in input order
+            paths = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+            if len(paths) != len(lines):
+                raise RuntimeError(
+                    f"Piper produced {len(paths)} files for {len(lines)} segments")
+
+            audio = []
+            for path in paths:
+                with wave.open(os.path.join(str(self.script_dir), path), 'rb') as wf:
+                    audio.append((wf.readframes(wf.getnframes()), wf.getframerate()))
+            return audio
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _text_to_speech_mixed(self, segments, text, language, output,
+                              speed, noise_scale, length_scale, speaker=None):
+        """
+        Read mixed-script text with one voice per script. Each voice runs in
+        its own piper process concurrently with the others, and the PCM is
+        stitched back together in reading order. The speaker applies to the
+        voice of the request language; the other voices use their default.
+        """
+        by_voice = {}
+        for index, segment in enumerate(segments):
+            by_voice.setdefault(segment["voice_model_path"], []).append(index)
+
+        primary = next((s for s in segments if s["language"] == language), segments[0])
+        speaker_id, speaker_info = None, None
+        if primary["language"] == language:
+            speaker_id, speaker_info = self._resolve_speaker(
+                primary["voice_model_path"], speaker)
+
+        audio = [None] * len(segments)
+        voice_phonemes = {voice_model_path: {} for voice_model_path in by_voice}
+        with self.metrics.stage('synth'), track_job('tts'):
+            with ThreadPoolExecutor(max_workers=len(by_voice)) as pool:
+                futures = {
+                    pool.submit(self._synthesize_lines, voice_model_path,
+                                [segments[i]["text"] for i in indices],
+                                speed, noise_scale, length_scale,
+                                voice_phonemes[voice_model_path],
+                                speaker_id if voice_model_path == primary["voice_model_path"]
+                                else None): indices
+                    for voice_model_path, indices in by_voice.items()
+                }
+                for future, indices in futures.items():
+                    for index, pcm in zip(indices, future.result()):
+                        audio[index] = pcm
+
+        phonemes = {"input": "phoneme_ids" if any(
+            stats.get("input") == "phoneme_ids" for stats in voice_phonemes.values()) else "text"}
+        for stats in voice_phonemes.values():
+            for counter in ("clauses", "hits", "misses"):
+                if counter in stats:
+                    phonemes[counter] = phonemes.get(counter, 0) + stats[counter]
+
+        sample_rate = max(rate for _, rate in audio)
+        with self.metrics.stage('encode'):
+            with wave.open(output.temp_path, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(sample_rate)
+                for pcm, rate in audio:
+                    wf.writeframes(resample_pcm(pcm, rate, sample_rate))
+        output_file = output.commit()
+
+        return self.metrics.attach({
+            "success": True,
+            "text": text,
+            "language": language,
+            "voice_model": os.path.basename(primary["voice_model_path"]),
+            "voice_variant": self._voice_variant(primary["voice_model_path"]),
+            "speaker": speaker_info,
+            "tier": primary["tier"]["tier"],
+            "tier_selection": primary["tier"],
+            "segments": [
+                {
+                    "language": segment["language"],
+                    "text": segment["text"],
+                    "voice_model": os.path.basename(segment["voice_model_path"]),
+                    "voice_variant": self._voice_variant(segment["voice_model_path"]),
+                    "tier": segment["tier"]["tier"]
+                }
+                for segment in segments
+            ],
+            "file_path": output_file,
+            "file_size": os.path.getsize(output_file),
+            "sample_rate": sample_rate,
+            "phonemes": finish_stats(phonemes),
+            "settings": {
+                "speed": speed,
+                "noise_scale": noise_scale,
+                "length_scale": length_scale
+            }
+        })
 
-    def _build_piper_command(self, voice_model_path, output_file=None, speed=1.0, noise_scale=0.667, length_scale=1.0):
+    def _contains_arabic_text(self, text):
+        """Check if text contains Arabic characters."""
+        arabic_pattern = re.compile(r'[\u0600-\u06FF]')
+        return bool(arabic_pattern.search(text))
+
+    def _build_piper_command(self, voice_model_path, output_file=None, speed=1.0, noise_scale=0.667, length_scale=1.0,
+                             speaker_id=None):
         """Build piper command."""
         cmd = [str(self.piper_executable)]
 
         # Voice model
         cmd.extend(['--model', voice_model_path])
 
+        # Speaker of a multi-speaker voice
+        if speaker_id is not None:
+            cmd.extend(['--speaker', str(speaker_id)])
+
         # Output file
         if output_file:
             cmd.extend(['--output_file', output_file])
@@ -182,7 +768,7 @@ class PiperTTS:
         return base_instructions
 
     def text_to_speech_file(self, text, language="en", output_file=None,
-                            speed=1.0, noise_scale=0.667, length_scale=1.0):
+                            speed=1.0, noise_scale=0.667, length_scale=1.0, speaker=None):
         """
         Convert text to speech and save as WAV file using Piper TTS.
         :param text: Text to convert
@@ -191,16 +777,16 @@ class PiperTTS:
         :param speed: Speech speed (length_scale, default 1.0)
         :param noise_scale: Noise scale for voice variation (default 0.667)
         :param length_scale: Length scale for speech rate (default 1.0)
+        :param speaker: Speaker name or ID for multi-speaker voices
         :return: Result dictionary
         """
-        if not self.piper_available:
+        if not self.piper_available and not self.in_process:
             return {
                 "success": False,
                 "error": "Piper TTS executable not found",
                 "installation": self.get_installation_instructions()
             }
 
-        temp_file_path = None
         try:
             if not text.strip():
                 return {
@@ -208,9 +794,13 @@ class PiperTTS:
                     "error": "Empty text provided"
                 }
 
-            # Get voice model path
-            voice_model_path = self._get_voice_model_path(language)
-            if not voice_model_path:
+            # Mixed-script text (e.g. Arabic with English part names and DTC
+            # codes) is read run by run with the matching voices
+            segments = self._plan_segments(text, language)
+
+            # Get voice model path at the tier current load allows
+            voice_model_path, tier = self._select_voice(language)
+            if not voice_model_path and not segments:
                 return {
                     "success": False,
                     "error": f"No voice model found for language '{language}'",
@@ -218,154 +808,191 @@ class PiperTTS:
                     "installation": self.get_installation_instructions()
                 }
 
-            # Generate output filename if not provided
-            if output_file is None:
-                output_file = f"tts_output_{hash(text) % 10000}.wav"
-
-            # Create temporary file for text input (Piper reads from stdin or file)
-            temp_file_path = self._create_temp_file_for_text(text)
-
-            # Build piper command
-            cmd = self._build_piper_command(
-                voice_model_path, output_file, speed, noise_scale, length_scale
-            )
-
-            # Set environment for proper UTF-8 handling
-            env = os.environ.copy()
-            env['PYTHONIOENCODING'] = 'utf-8'
-
-            # Execute piper command with text input
-            with open(temp_file_path, 'r', encoding='utf-8') as input_file:
-                result = subprocess.run(cmd, stdin=input_file, capture_output=True,
-                                        text=True, env=env, cwd=str(self.script_dir))
-
-            if result.returncode == 0:
-                return {
-                    "success": True,
-                    "text": text,
-                    "language": language,
-                    "voice_model": os.path.basename(voice_model_path),
-                    "file_path": output_file,
-                    "file_size": os.path.getsize(output_file) if os.path.exists(output_file) else 0,
-                    "settings": {
-                        "speed": speed,
-                        "noise_scale": noise_scale,
-                        "length_scale": length_scale
-                    }
-                }
-            else:
+            # All speakers of a voice share its model; only the ID differs
+            try:
+                speaker_id, speaker_info = self._resolve_speaker(voice_model_path, speaker)
+            except ValueError as e:
                 return {
                     "success": False,
-                    "error": f"Piper TTS failed: {result.stderr}",
-                    "stdout": result.stdout,
-                    "command": " ".join(cmd)
+                    "error": str(e),
+                    "available_speakers": list(self._voice_speakers(voice_model_path))
                 }
 
+            # Write through a temp file; unnamed outputs go to the managed spool
+            if output_file is None:
+                output = self.spool.output('tts_output')
+            else:
+                output = atomic_output(output_file)
+
+            with output:
+                if segments:
+                    return self._text_to_speech_mixed(
+                        segments, text, language, output, speed, noise_scale, length_scale,
+                        speaker)
+
+                batcher = self._batcher(voice_model_path)
+                if batcher is not None:
+                    return self._text_to_speech_in_process(
+                        batcher, voice_model_path, tier, text, language, output,
+                        speed, noise_scale, length_scale, speaker)
+
+                # Build piper command
+                cmd = self._build_piper_command(
+                    voice_model_path, output.temp_path, speed, noise_scale, length_scale,
+                    speaker_id
+                )
+
+                # Feed cached phoneme IDs instead of text when possible
+                phonemizer, phonemes = self._phoneme_input(voice_model_path)
+                if phonemizer is not None:
+                    cmd.append('--json-input')
+                    piper_input = self._encode_line(phonemizer, ' '.join(text.split()), phonemes)
+                else:
+                    piper_input = text
+
+                # Set environment for proper UTF-8 handling
+                env = os.environ.copy()
+                env['PYTHONIOENCODING'] = 'utf-8'
+
+                # Execute piper command, feeding the text through its stdin pipe
+                with self.metrics.stage('synth'), track_job('tts'):
+                    result = subprocess.run(active_profile().worker_command(cmd),
+                                            input=piper_input, capture_output=True,
+                                            text=True, encoding='utf-8', env=env,
+                                            cwd=str(self.script_dir))
+                self.metrics.record_piper_stderr(result.stderr)
+
+                if result.returncode == 0:
+                    output_file = output.commit()
+                    return self.metrics.attach({
+                        "success": True,
+                        "text": text,
+                        "language": language,
+                        "voice_model": os.path.basename(voice_model_path),
+                        "voice_variant": self._voice_variant(voice_model_path),
+                        "speaker": speaker_info,
+                        "tier": tier["tier"],
+                        "tier_selection": tier,
+                        "file_path": output_file,
+                        "file_size": os.path.getsize(output_file),
+                        "phonemes": finish_stats(phonemes),
+                        "settings": {
+                            "speed": speed,
+                            "noise_scale": noise_scale,
+                            "length_scale": length_scale
+                        }
+                    })
+                else:
+                    return self.metrics.attach({
+                        "success": False,
+                        "error": f"Piper TTS failed: {result.stderr}",
+                        "stdout": result.stdout,
+                        "command": " ".join(cmd)
+                    })
+
         except Exception as e:
             return {
                 "success": False,
                 "error": f"TTS generation failed: {str(e)}"
             }
-        finally:
-            # Clean up temporary file
-            if temp_file_path:
-                self._cleanup_temp_file(temp_file_path)
 
-    def text_to_speech_play(self, text, language="en", speed=1.0, noise_scale=0.667, length_scale=1.0):
+    def text_to_speech_play(self, text, language="en", speed=1.0, noise_scale=0.667, length_scale=1.0,
+                            speaker=None):
         """
         Convert text to speech and play directly using Piper TTS.
         Note: Piper generates WAV files, so we create a temp file and could play it.
         For direct playback, you might want to pipe to a audio player.
         """
-        # For Piper, we'll generate a temporary WAV file and then play it
-        temp_wav_file = None
-        temp_text_file = None
+        # For Piper, we'll generate a spooled WAV file, play it and release it
+        wav_path = None
 
         try:
-            # Create temporary WAV file
-            temp_wav_file = tempfile.NamedTemporaryFile(
-                suffix='.wav', delete=False)
-            temp_wav_file.close()
-
             # Generate the audio file
             result = self.text_to_speech_file(
-                text, language, temp_wav_file.name, speed, noise_scale, length_scale
+                text, language, None, speed, noise_scale, length_scale, speaker
             )
 
             if not result['success']:
                 return result
+            wav_path = result['file_path']
 
             # Try to play the file based on OS
             try:
-                if self.is_windows:
-                    # Windows - use PowerShell Media.SoundPlayer
-                    subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{temp_wav_file.name}").PlaySync()'],
-                                   check=True, capture_output=True)
-                elif self.is_macos:
-                    # macOS - use afplay
-                    subprocess.run(['afplay', temp_wav_file.name],
-                                   check=True, capture_output=True)
-                elif self.is_linux:
-                    # Linux - try common audio players in order of preference
-                    players = ['paplay', 'aplay', 'mpg123', 'mpv', 'cvlc']
-                    played = False
-
-                    for player in players:
-                        try:
-                            if player == 'paplay':
-                                # PulseAudio
-                                subprocess.run(
-                                    [player, temp_wav_file.name], check=True, capture_output=True)
-                                played = True
-                                break
-                            elif player == 'aplay':
-                                # ALSA
-                                subprocess.run(
-                                    [player, temp_wav_file.name], check=True, capture_output=True)
-                                played = True
-                                break
-                            elif player in ['mpg123', 'mpv', 'cvlc']:
-                                # Media players that can handle WAV
+                with self.metrics.stage('playback'):
+                    if self.is_windows:
+                        # Windows - use PowerShell Media.SoundPlayer
+                        subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{wav_path}").PlaySync()'],
+                                       check=True, capture_output=True)
+                    elif self.is_macos:
+                        # macOS - use afplay
+                        subprocess.run(['afplay', wav_path],
+                                       check=True, capture_output=True)
+                    elif self.is_linux:
+                        # Linux - try common audio players in order of preference
+                        players = ['paplay', 'aplay', 'mpg123', 'mpv', 'cvlc']
+                        played = False
+
+                        for player in players:
+                            try:
+                                if player == 'paplay':
+                                    # PulseAudio
+                                    subprocess.run(
+                                        [player, wav_path], check=True, capture_output=True)
+                                    played = True
+                                    break
+                                elif player == 'aplay':
+                                    # ALSA
+                                    subprocess.run(
+                                        [player, wav_path], check=True, capture_output=True)
+                                    played = True
+                                    break
+                                elif player in ['mpg123', 'mpv', 'cvlc']:
+                                    # Media players that can handle WAV
+                                    subprocess.run(
+                                        [player, wav_path], check=True, capture_output=True)
+                                    played = True
+                                    break
+                            except (subprocess.CalledProcessError, FileNotFoundError):
+                                continue
+
+                        if not played:
+                            return {
+                                "success": False,
+                                "error": "No audio player found. Install one of: paplay (PulseAudio), aplay (ALSA), mpg123, mpv, or vlc."
+                            }
+                    else:
+                        # Fallback for other Unix systems
+                        players = ['aplay', 'paplay', 'afplay', 'play']
+                        for player in players:
+                            try:
                                 subprocess.run(
-                                    [player, temp_wav_file.name], check=True, capture_output=True)
-                                played = True
+                                    [player, wav_path], check=True, capture_output=True)
                                 break
-                        except (subprocess.CalledProcessError, FileNotFoundError):
-                            continue
-
-                    if not played:
-                        return {
-                            "success": False,
-                            "error": "No audio player found. Install one of: paplay (PulseAudio), aplay (ALSA), mpg123, mpv, or vlc."
-                        }
-                else:
-                    # Fallback for other Unix systems
-                    players = ['aplay', 'paplay', 'afplay', 'play']
-                    for player in players:
-                        try:
-                            subprocess.run(
-                                [player, temp_wav_file.name], check=True, capture_output=True)
-                            break
-                        except (subprocess.CalledProcessError, FileNotFoundError):
-                            continue
-                    else:
-                        return {
-                            "success": False,
-                            "error": "No audio player found. Install aplay, paplay, afplay, or sox."
-                        }
-
-                return {
+                            except (subprocess.CalledProcessError, FileNotFoundError):
+                                continue
+                        else:
+                            return {
+                                "success": False,
+                                "error": "No audio player found. Install aplay, paplay, afplay, or sox."
+                            }
+
+                return self.metrics.attach({
                     "success": True,
                     "text": text,
                     "language": language,
                     "voice_model": result.get('voice_model', 'unknown'),
+                    "voice_variant": result.get('voice_variant'),
+                    "speaker": result.get('speaker'),
+                    "tier": result.get('tier'),
+                    "tier_selection": result.get('tier_selection'),
+                    "phonemes": result.get('phonemes'),
                     "played": True,
                     "settings": {
                         "speed": speed,
                         "noise_scale": noise_scale,
                         "length_scale": length_scale
                     }
-                }
+                })
 
             except subprocess.CalledProcessError as e:
                 return {
@@ -380,8 +1007,204 @@ class PiperTTS:
             }
         finally:
             # Clean up temporary files
-            if temp_wav_file and os.path.exists(temp_wav_file.name):
-                self._cleanup_temp_file(temp_wav_file.name)
+            if wav_path:
+                self.spool.release(wav_path)
+
+    def text_stream_to_speech(self, fragments, language="en", sink=None,
+                              speed=1.0, noise_scale=0.667, length_scale=1.0, speaker=None):
+        """
+        Speak text that arrives in fragments (e.g. a streamed LLM answer).
+        Each sentence is sent to a single piper process as soon as it closes,
+        so speech starts while the rest of the text is still being produced;
+        audio is emitted in sentence order.
+        :param fragments: Iterable of text fragments
+        :param language: Language code
+        :param sink: Callable receiving raw 16-bit mono PCM chunks; plays the
+                     audio when omitted
+        :param speaker: Speaker name or ID for multi-speaker voices
+        :return: Result dictionary with per-stream latency figures
+        """
+        if not self.piper_available:
+            return {
+                "success": False,
+                "error": "Piper TTS executable not found",
+                "installation": self.get_installation_instructions()
+            }
+
+        voice_model_path, tier = self._select_voice(language)
+        if not voice_model_path:
+            return {
+                "success": False,
+                "error": f"No voice model found for language '{language}'",
+                "available_languages": list(self.available_voices.keys()),
+                "installation": self.get_installation_instructions()
+            }
+        try:
+            speaker_id, speaker_info = self._resolve_speaker(voice_model_path, speaker)
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "available_speakers": list(self._voice_speakers(voice_model_path))
+            }
+        sample_rate = self._voice_sample_rate(voice_model_path)
+
+        player = None
+        if sink is None:
+            player = self._open_raw_player(sample_rate)
+            if player is None:
+                return {
+                    "success": False,
+                    "error": "No raw audio player found. Install aplay, paplay or sox."
+                }
+            sink = player.stdin.write
+
+        # --output_raw makes piper synthesize each input line as it arrives
+        cmd = self._build_piper_command(
+            voice_model_path, None, speed, noise_scale, length_scale, speaker_id) + ['--output_raw']
+        phonemizer, phonemes = self._phoneme_input(voice_model_path)
+        if phonemizer is not None:
+            cmd.append('--json-input')
+        env = os.environ.copy()
+        env['PYTHONIOENCODING'] = 'utf-8'
+
+        start = time.perf_counter()
+        sentences = []
+        marks = {"first_sentence": None, "first_audio": None}
+        # bytes from piper, and of those delivered to the player or output
+        audio = {"bytes": 0, "output_bytes": 0, "error": None}
+        stderr_chunks = []
+
+        try:
+            process = subprocess.Popen(active_profile().worker_command(cmd), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                                       cwd=str(self.script_dir))
+        except OSError as e:
+            if player is not None:
+                player.stdin.close()
+                player.wait()
+            return {
+                "success": False,
+                "error": f"Failed to start piper: {str(e)}"
+            }
+
+        def forward_audio():
+            fd = process.stdout.fileno()
+            while True:
+                chunk = os.read(fd, 1 << 16)
+                if not chunk:
+                    return
+                if marks["first_audio"] is None:
+                    marks["first_audio"] = time.perf_counter()
+                audio["bytes"] += len(chunk)
+                if audio["error"] is None:
+                    try:
+                        sink(chunk)
+                        audio["output_bytes"] += len(chunk)
+                    except (BrokenPipeError, OSError) as e:
+                        # Keep draining so piper is never blocked on a full pipe
+                        audio["error"] = f"Audio output failed: {str(e)}"
+
+        readers = [
+            threading.Thread(target=forward_audio, daemon=True),
+            threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()),
+                             daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+
+        def submit(sentence):
+            if marks["first_sentence"] is None:
+                marks["first_sentence"] = time.perf_counter()
+            sentences.append(sentence)
+            line = self._encode_line(phonemizer, sentence, phonemes)
+            process.stdin.write((line + '\n').encode('utf-8'))
+            process.stdin.flush()
+
+        segmenter = SentenceSegmenter()
+        with self.metrics.stage('stream'), track_job('tts'):
+            try:
+                for fragment in fragments:
+                    for sentence in segmenter.feed(fragment):
+                        submit(sentence)
+                for sentence in segmenter.flush():
+                    submit(sentence)
+            except BrokenPipeError:
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                returncode = process.wait()
+                for reader in readers:
+                    reader.join()
+                if player is not None:
+                    try:
+                        player.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    player.wait()
+
+        stderr = b''.join(stderr_chunks).decode('utf-8', 'replace')
+        self.metrics.record_piper_stderr(stderr)
+
+        if not sentences:
+            return {
+                "success": False,
+                "error": "Empty text provided"
+            }
+
+        def since_start(mark):
+            return round(mark - start, 6) if mark is not None else None
+
+        first_audio_latency = None
+        if marks["first_audio"] is not None:
+            first_audio_latency = round(marks["first_audio"] - marks["first_sentence"], 6)
+        # Also reported on failure, so callers know whether any audio was heard
+        stream = {
+            "sentences": len(sentences),
+            "sample_rate": sample_rate,
+            "audio_bytes": audio["bytes"],
+            "output_bytes": audio["output_bytes"],
+            "audio_duration_s": round(audio["bytes"] / 2.0 / sample_rate, 3),
+            "first_sentence_s": since_start(marks["first_sentence"]),
+            "first_audio_s": since_start(marks["first_audio"]),
+            "first_audio_latency_s": first_audio_latency
+        }
+
+        if returncode != 0:
+            return self.metrics.attach({
+                "success": False,
+                "error": f"Piper TTS failed: {stderr}",
+                "command": " ".join(cmd),
+                "stream": stream
+            })
+        if audio["error"]:
+            return self.metrics.attach({
+                "success": False,
+                "error": audio["error"],
+                "stream": stream
+            })
+
+        return self.metrics.attach({
+            "success": True,
+            "text": " ".join(sentences),
+            "language": language,
+            "voice_model": os.path.basename(voice_model_path),
+            "voice_variant": self._voice_variant(voice_model_path),
+            "speaker": speaker_info,
+            "tier": tier["tier"],
+            "tier_selection": tier,
+            "played": player is not None,
+            "phonemes": finish_stats(phonemes),
+            "stream": stream,
+            "settings": {
+                "speed": speed,
+                "noise_scale": noise_scale,
+                "length_scale": length_scale
+            }
+        })
 
     def list_voices(self):
         """List available voice models."""
@@ -395,6 +1218,17 @@ class PiperTTS:
         return {
             "success": True,
             "available_voices": self.available_voices,
+            "voice_tiers": {language: self._voice_tiers(language)
+                            for language in self.available_voices},
+            "voice_variants": {voice: entry.get('selected')
+                               for voice, entry in self.voice_variants.items()},
+            "voice_speakers": {
+                voice: sorted(speakers, key=speakers.get)
+                for voice, speakers in (
+                    (voice, self._voice_speakers(str(self.voices_dir / voice)))
+                    for voices in self.available_voices.values() for voice in voices)
+                if speakers
+            },
             "supported_languages": list(self.supported_languages.keys()),
             "voices_directory": str(self.voices_dir),
             "piper_executable": str(self.piper_executable)
@@ -407,9 +1241,10 @@ def main():
         description='Offline TTS using Piper TTS (Windows/Linux/macOS)')
 
     # Support both direct text and file input
-    group = parser.add_mutually_exclusive_group(required=True)
+    group = parser.add_mutually_exclusive_group()
     group.add_argument('text', nargs='?', help='Text to convert to speech')
-    group.add_argument('--file', '-f', help='File containing text to convert')
+    group.add_argument('--file', '-f',
+                       help="File containing text to convert, '-' for stdin, 'fd:N' or 'shm:NAME'")
 
     parser.add_argument('--language', '-l', default='en',
                         help='Language code (en, ar, es, fr, etc.)')
@@ -422,16 +1257,53 @@ def main():
                         help='Length scale for speech rate (default 1.0)')
     parser.add_argument('--play', action='store_true',
                         help='Play directly instead of saving to file')
+    parser.add_argument('--stream-text', action='store_true',
+                        help='Read text incrementally from --file (default stdin) and '
+                             'synthesize each sentence as soon as it is complete; '
+                             'without --play raw 16-bit PCM goes to stdout and the '
+                             'result to stderr')
     parser.add_argument('--list-voices', action='store_true',
                         help='List available voice models')
+    parser.add_argument('--tier', choices=['auto'] + list(TTS_TIERS), default='auto',
+                        help='Voice quality tier (default: chosen from current load)')
+    parser.add_argument('--variant', choices=['auto'] + list(VOICE_VARIANTS), default=None,
+                        help='Voice model variant (default: SPEECH_VOICE_VARIANT or the '
+                             'one optimize_voices.py selected)')
+    parser.add_argument('--in-process', action='store_true', default=None,
+                        help='Run the voice with onnxruntime in this process, batching '
+                             'sentences (default: SPEECH_PIPER_IN_PROCESS; needs numpy, '
+                             'onnxruntime and the phoneme cache)')
+    parser.add_argument('--speaker',
+                        help='Speaker name or ID for multi-speaker voices (see --list-voices)')
+    parser.add_argument('--no-phoneme-cache', action='store_true',
+                        help='Send plain text to piper instead of cached phoneme IDs')
+    parser.add_argument('--probe-phoneme-ids', nargs='?', const='', metavar='VOICE',
+                        help='Check whether the piper executable reads phoneme IDs, using '
+                             'VOICE or the --language voice, remember the answer and exit')
     parser.add_argument('--format', choices=['json', 'text'], default='json',
                         help='Output format')
     parser.add_argument(
         '--script-dir', help='Directory containing piper executable and voices folder')
+    add_instrumentation_arguments(parser)
+    add_resource_arguments(parser)
 
     args = parser.parse_args()
 
-    tts = PiperTTS(args.script_dir)
+    return run_with_profile(lambda: run(args), args.profile)
+
+
+def run(args):
+    """Run a synthesis for parsed command line arguments."""
+    metrics = SpeechMetrics(
+        'piper_tts', enabled=(args.timings or bool(args.metrics_file)) or None)
+    profile = apply_profile(args.resource_profile)
+    tts = PiperTTS(args.script_dir, metrics, None if args.tier == 'auto' else args.tier,
+                   not args.no_phoneme_cache, args.variant, args.in_process)
+
+    if args.probe_phoneme_ids is not None:
+        result = tts.probe_phoneme_ids(args.probe_phoneme_ids or None, args.language)
+        print(json.dumps(result, indent=2))
+        return 0 if result['success'] else 1
 
     if args.list_voices:
         result = tts.list_voices()
@@ -446,11 +1318,16 @@ def main():
                 print(f"Error: {result['error']}")
         return 0 if result['success'] else 1
 
+    # Use length_scale for speed control (Piper's equivalent to speech rate)
+    length_scale = 1.0 / args.speed if args.speed != 0 else 1.0
+
+    if args.stream_text:
+        return run_text_stream(args, tts, metrics, length_scale, profile)
+
     # Get text from file or command line argument
     if args.file:
         try:
-            with open(args.file, 'r', encoding='utf-8') as f:
-                text = f.read().strip()
+            text = read_text_source(args.file).strip()
         except Exception as e:
             print(json.dumps({
                 "success": False,
@@ -467,18 +1344,23 @@ def main():
         }))
         return 1
 
-    # Use length_scale for speed control (Piper's equivalent to speech rate)
-    length_scale = 1.0 / args.speed if args.speed != 0 else 1.0
+    try:
+        with profile.job() as usage:
+            if args.play:
+                result = tts.text_to_speech_play(
+                    text, args.language, args.speed, args.noise_scale, length_scale,
+                    args.speaker
+                )
+            else:
+                result = tts.text_to_speech_file(
+                    text, args.language, args.output,
+                    args.speed, args.noise_scale, length_scale, args.speaker
+                )
+        result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e)}
 
-    if args.play:
-        result = tts.text_to_speech_play(
-            text, args.language, args.speed, args.noise_scale, length_scale
-        )
-    else:
-        result = tts.text_to_speech_file(
-            text, args.language, args.output,
-            args.speed, args.noise_scale, length_scale
-        )
+    metrics.dump_prometheus(args.metrics_file)
 
     if args.format == 'json':
         print(json.dumps(result, indent=2))
@@ -495,6 +1377,55 @@ def main():
     return 0
 
 
+def _write_stdout(chunk):
+    """Write a raw PCM chunk to stdout as soon as it is synthesized."""
+    sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
+
+
+def run_text_stream(args, tts, metrics, length_scale, profile):
+    """Speak text from a stream as it arrives (--stream-text)."""
+    # Without --play raw PCM goes to stdout, so the result has to go to stderr
+    sink = None if args.play else _write_stdout
+    result_stream = sys.stdout if args.play else sys.stderr
+
+    trace = SpeechTrace('tts', 'piper_tts_stream', {
+        "language": args.language,
+        "speed": args.speed,
+        "noise_scale": args.noise_scale,
+        "length_scale": length_scale,
+        "speaker": args.speaker,
+        "play": args.play
+    })
+    # The text is only known once the stream has been read
+    spoken = []
+
+    def fragments():
+        for fragment in [args.text] if args.text else iter_text_source(args.file or '-'):
+            spoken.append(fragment)
+            yield fragment
+
+    try:
+        with profile.job() as usage:
+            result = tts.text_stream_to_speech(
+                fragments(), args.language, sink, args.speed, args.noise_scale, length_scale,
+                args.speaker)
+        result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e)}
+
+    trace.record(result, text=''.join(spoken))
+    metrics.dump_prometheus(args.metrics_file)
+
+    if args.format == 'json':
+        print(json.dumps(result, indent=2), file=result_stream)
+    elif result['success']:
+        print(f"Spoke {result['stream']['sentences']} sentences", file=result_stream)
+    else:
+        print(f"Error: {result['error']}", file=sys.stderr)
+    return 0 if result['success'] else 1
+
+
 # Function for NestJS integration
 def synthesize_speech(text, language="en", output_file=None, play_directly=False, **kwargs):
     """
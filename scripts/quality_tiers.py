@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+
+# Quality tiers from cheapest to best
+TTS_TIERS = ('x_low', 'low', 'medium', 'high')
+STT_TIERS = ('small', 'large')
+
+DEFAULT_TTS_TIER = 'medium'
+DEFAULT_STT_TIER = 'small'
+
+# Vosk model directory names per tier, in search order. The legacy names
+# ('en-us', 'ar') hold whichever model was installed before tiers existed
+# and count as the small tier.
+DEFAULT_STT_MODELS = {
+    'en': {
+        'small': ['en-us-small', 'vosk-model-small-en-us-0.15', 'en-us'],
+        'large': ['en-us-large', 'vosk-model-en-us-0.22'],
+    },
+    'ar': {
+        'small': ['ar-small', 'vosk-model-ar-mgb2-0.4', 'ar'],
+        'large': ['ar-large', 'vosk-model-ar-0.22-linto-1.1.0'],
+    },
+}
+
+# Pressure thresholds (0 = idle, 1 = saturated)
+DEFAULT_IDLE_PRESSURE = 0.3
+DEFAULT_BUSY_PRESSURE = 0.7
+DEFAULT_OVERLOAD_PRESSURE = 0.9
+# Concurrent speech jobs that count as full pressure
+DEFAULT_MAX_QUEUE = 4
+# Mean word confidence below which STT re-decodes with a larger model
+DEFAULT_REDECODE_CONFIDENCE = 0.6
+# Processes that may load an STT model above the default tier (idle
+# upgrades, re-decoding): 'long_lived' (workers that keep the model loaded),
+# 'always' or 'never'. A one-shot process would load the large model (close
+# to 2 GB) from scratch for a single request, after the load was sampled.
+DEFAULT_STT_IDLE_UPGRADE = 'long_lived'
+IDLE_UPGRADE_MODES = ('long_lived', 'always', 'never')
+
+JOBS_DIR = os.path.join(tempfile.gettempdir(), 'obd-speech-jobs')
+
+
+def load_tier_config(path=None):
+    """
+    Read the optional tier configuration (SPEECH_TIERS_FILE), e.g.
+      {"tts": {"default_tier": "medium",
+               "voices": {"en": {"high": "en_US-ryan-high.onnx"}}},
+       "stt": {"default_tier": "small", "redecode_confidence": 0.6,
+               "intent_confidence": 0.75, "idle_upgrade": "long_lived",
+               "models": {"en": {"large": ["vosk-model-en-us-0.22"]}}},
+       "policy": {"idle": 0.3, "busy": 0.7, "overload": 0.9, "max_queue": 4}}
+    :return: Configuration dictionary (empty when not configured)
+    """
+    path = path or os.environ.get('SPEECH_TIERS_FILE')
+    if not path:
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Failed to read tier config {path}: {e}", file=sys.stderr)
+        return {}
+
+
+def stt_model_names(language, config=None):
+    """
+    Vosk model directory names per tier for a language; configured names
+    are searched before the defaults.
+    :return: Dictionary of tier -> list of directory names
+    """
+    configured = (config or {}).get('stt', {}).get('models', {}).get(language, {})
+    defaults = DEFAULT_STT_MODELS.get(language, {})
+    names = {}
+    for tier in STT_TIERS:
+        candidates = list(configured.get(tier, [])) + defaults.get(tier, [])
+        if candidates:
+            names[tier] = candidates
+    return names
+
+
+def voice_tier(voice_name):
+    """Return the quality tier encoded in a Piper voice name (e.g. en_US-ryan-high.onnx)."""
+    stem = voice_name[:-len('.onnx')] if voice_name.endswith('.onnx') else voice_name
+    tier = stem.rsplit('-', 1)[-1]
+    return tier if tier in TTS_TIERS else None
+
+
+def cpu_pressure():
+    """
+    Fraction of recent time runnable tasks waited for a CPU.
+    Uses Linux pressure stall information when available, otherwise the
+    1-minute load average per CPU; 0.0 when neither can be read.
+    """
+    try:
+        with open('/proc/pressure/cpu', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('some'):
+                    fields = dict(item.split('=') for item in line.split()[1:])
+                    return float(fields['avg10']) / 100.0
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def active_jobs():
+    """Count speech jobs currently running in any process on this host."""
+    count = 0
+    try:
+        with os.scandir(JOBS_DIR) as it:
+            for entry in it:
+                pid = entry.name.split('-', 1)[0]
+                if not pid.isdigit():
+                    continue
+                if _pid_alive(int(pid)):
+                    count += 1
+                else:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+    except FileNotFoundError:
+        pass
+    return count
+
+
+@contextmanager
+def track_job(kind):
+    """Register a running job so other processes see it in the queue depth."""
+    path = None
+    try:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        path = os.path.join(JOBS_DIR, f"{os.getpid()}-{kind}-{time.monotonic_ns()}")
+        open(path, 'w').close()
+    except OSError:
+        path = None
+    try:
+        yield
+    finally:
+        if path is not None:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class TierPolicy:
+    """
+    Choose a quality tier from current load.
+
+    Pressure is the higher of CPU pressure and queue depth (running jobs plus
+    SPEECH_QUEUE_DEPTH reported by the caller, over max_queue). Below idle
+    the best available tier is used, up to busy the default tier, up to
+    overload one tier below the default, and above that the cheapest tier.
+    Without upgrades, idle stays on the default tier and allows_upgrade()
+    is always False.
+    """
+
+    def __init__(self, tiers, default_tier, config=None, forced=None, upgrades=True):
+        config = config or {}
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.idle = float(config.get('idle', DEFAULT_IDLE_PRESSURE))
+        self.busy = float(config.get('busy', DEFAULT_BUSY_PRESSURE))
+        self.overload = float(config.get('overload', DEFAULT_OVERLOAD_PRESSURE))
+        self.max_queue = max(1, int(config.get('max_queue', DEFAULT_MAX_QUEUE)))
+        self.forced = forced
+        self.upgrades = upgrades
+
+    def load(self):
+        """Return the current load figures."""
+        try:
+            reported = int(os.environ.get('SPEECH_QUEUE_DEPTH', 0))
+        except ValueError:
+            reported = 0
+        queue_depth = active_jobs() + max(0, reported)
+        cpu = cpu_pressure()
+        return {
+            "cpu_pressure": round(cpu, 3),
+            "queue_depth": queue_depth,
+            "pressure": round(max(cpu, queue_depth / float(self.max_queue)), 3)
+        }
+
+    def _nearest(self, available, tier):
+        """The available tier closest to tier, preferring the cheaper side."""
+        rank = self.tiers.index(tier)
+        return min(available, key=lambda t: (abs(self.tiers.index(t) - rank),
+                                             self.tiers.index(t) > rank))
+
+    def choose(self, available, load=None):
+        """
+        Pick a tier among the available ones.
+        :param available: Tiers that are installed for the request's language
+        :param load: Load figures from load(); measured when omitted
+        :return: Dictionary with the tier, the reason and the load figures
+        """
+        available = sorted((t for t in set(available) if t in self.tiers),
+                           key=self.tiers.index)
+        if not available:
+            return {"tier": None, "reason": "unavailable", "available": []}
+
+        if self.forced:
+            if self.forced in available:
+                return {"tier": self.forced, "reason": "forced", "available": available}
+            print(f"Warning: tier '{self.forced}' is not installed; choosing by load",
+                  file=sys.stderr)
+
+        load = load or self.load()
+        pressure = load["pressure"]
+        default = self._nearest(available, self.default_tier)
+        index = available.index(default)
+
+        if pressure < self.idle:
+            tier, reason = available[-1] if self.upgrades else default, "idle"
+        elif pressure < self.busy:
+            tier, reason = default, "normal"
+        elif pressure < self.overload:
+            tier, reason = available[max(0, index - 1)], "busy"
+        else:
+            tier, reason = available[0], "overloaded"
+
+        selection = {"tier": tier, "reason": reason, "available": available}
+        selection.update(load)
+        return selection
+
+    def allows_upgrade(self, load=None):
+        """True when there is headroom for extra work such as a second decode."""
+        if not self.upgrades:
+            return False
+        load = load or self.load()
+        return load["pressure"] < self.busy
+
+
+def tts_policy(config=None, forced=None):
+    """TierPolicy for Piper voices (SPEECH_TTS_TIER forces a tier)."""
+    config = load_tier_config() if config is None else config
+    return TierPolicy(
+        TTS_TIERS,
+        config.get('tts', {}).get('default_tier', DEFAULT_TTS_TIER),
+        config.get('policy'),
+        forced or os.environ.get('SPEECH_TTS_TIER') or None)
+
+
+def stt_policy(config=None, forced=None, long_lived=False):
+    """
+    TierPolicy for Vosk models (SPEECH_STT_TIER forces a tier).
+    :param long_lived: The caller keeps models loaded across requests (the
+                       --serve worker); by default only such processes
+                       upgrade past the default tier (stt.idle_upgrade)
+    """
+    config = load_tier_config() if config is None else config
+    stt = config.get('stt', {})
+    mode = stt.get('idle_upgrade', DEFAULT_STT_IDLE_UPGRADE)
+    if mode not in IDLE_UPGRADE_MODES:
+        print(f"Warning: Unknown stt.idle_upgrade '{mode}', using "
+              f"'{DEFAULT_STT_IDLE_UPGRADE}'", file=sys.stderr)
+        mode = DEFAULT_STT_IDLE_UPGRADE
+    return TierPolicy(
+        STT_TIERS,
+        stt.get('default_tier', DEFAULT_STT_TIER),
+        config.get('policy'),
+        forced or os.environ.get('SPEECH_STT_TIER') or None,
+        mode == 'always' or (mode == 'long_lived' and long_lived))
+
+
+def main():
+    """Command line interface: show the current load and tier decisions."""
+    parser = argparse.ArgumentParser(description='Show speech quality tier decisions')
+    parser.add_argument('--config', help='Tier configuration file (default: SPEECH_TIERS_FILE)')
+    args = parser.parse_args()
+
+    config = load_tier_config(args.config)
+    tts = tts_policy(config)
+    stt = stt_policy(config)
+    load = tts.load()
+    print(json.dumps({
+        "load": load,
+        "tts": tts.choose(TTS_TIERS, load),
+        "stt": stt.choose(STT_TIERS, load),
+        "stt_worker": stt_policy(config, long_lived=True).choose(STT_TIERS, load)
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import ctypes
+import argparse
+import shutil
+import platform
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from speech_metrics import cpu_times
+
+
+# Named profiles. 'sbc' keeps CPU 0 and disk priority free for the OBD
+# reader on a Raspberry Pi class board; 'background' yields to everything.
+BUILTIN_PROFILES = {
+    'default': {},
+    'sbc': {
+        "threads": 1,
+        "reserve_cpus": "0",
+        "nice": 10,
+        "ionice": "best-effort:7",
+        "max_jobs": 1,
+    },
+    'background': {
+        "threads": 1,
+        "reserve_cpus": "0",
+        "nice": 19,
+        "ionice": "idle",
+        "max_jobs": 1,
+    },
+}
+
+# Environment variables that size the thread pools of the libraries the
+# speech workers load (Kaldi's BLAS, OpenMP builds of onnxruntime). The
+# piper binary's onnxruntime uses its own pool, sized from the CPU count,
+# and reads none of them; see ResourceProfile.worker_command().
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# Single-value overrides on top of the selected profile
+ENV_OVERRIDES = {
+    'SPEECH_THREADS': ('threads', int),
+    'SPEECH_CPUS': ('cpus', str),
+    'SPEECH_NICE': ('nice', int),
+    'SPEECH_IONICE': ('ionice', str),
+    'SPEECH_MAX_JOBS': ('max_jobs', int),
+}
+
+DEFAULT_JOB_WAIT = 120.0
+SLOTS_DIR = os.path.join(tempfile.gettempdir(), 'obd-speech-slots')
+
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+IOPRIO_WHO_PROCESS = 1
+# ioprio_set syscall numbers per architecture
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+                       'armv7l': 314, 'armv6l': 314, 'riscv64': 30}
+
+
+def parse_cpu_list(spec):
+    """Parse a CPU list such as '1-3,5' into a set of CPU numbers."""
+    cpus = set()
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def _set_ionice(spec):
+    """Set this process's I/O priority, e.g. 'idle' or 'best-effort:7'."""
+    name, _, level = spec.partition(':')
+    io_class = IOPRIO_CLASSES[name]
+    syscall = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if platform.system() != 'Linux' or syscall is None:
+        raise OSError(f"ionice is not supported on {platform.system()} {platform.machine()}")
+    libc = ctypes.CDLL(None, use_errno=True)
+    value = (io_class << 13) | (int(level) if level else 0)
+    if libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0, value) != 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+
+class ResourceProfile:
+    """
+    CPU budget for speech work: thread count, CPU affinity, nice and ionice
+    levels, and a host-wide limit on concurrent jobs.
+
+    apply() configures the current process. Affinity, priorities and the
+    thread environment are inherited by the workers it spawns (piper,
+    ffmpeg, espeak-ng). The limits therefore cover the whole job, except the
+    thread count for piper, which only worker_command() enforces.
+    """
+
+    def __init__(self, name='default', settings=None):
+        self.name = name
+        settings = settings or {}
+        self.threads = settings.get('threads')
+        self.cpus = settings.get('cpus')
+        self.reserve_cpus = settings.get('reserve_cpus')
+        self.nice = settings.get('nice')
+        self.ionice = settings.get('ionice')
+        self.max_jobs = settings.get('max_jobs')
+        self.job_wait = float(settings.get('job_wait', DEFAULT_JOB_WAIT))
+        self.applied = {}
+
+    @classmethod
+    def load(cls, spec=None):
+        """
+        Build the profile named by spec or SPEECH_RESOURCE_PROFILE: a built-in
+        name, or a JSON file whose optional "base" names a built-in to extend.
+        SPEECH_THREADS, SPEECH_CPUS, SPEECH_NICE, SPEECH_IONICE and
+        SPEECH_MAX_JOBS override single settings.
+        """
+        spec = spec or os.environ.get('SPEECH_RESOURCE_PROFILE') or 'default'
+        if spec in BUILTIN_PROFILES:
+            name, settings = spec, dict(BUILTIN_PROFILES[spec])
+        else:
+            try:
+                with open(spec, 'r', encoding='utf-8') as f:
+                    configured = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Failed to read resource profile {spec}: {e}", file=sys.stderr)
+                configured = {}
+            name = os.path.splitext(os.path.basename(spec))[0]
+            settings = dict(BUILTIN_PROFILES.get(configured.pop('base', 'default'), {}))
+            settings.update(configured)
+
+        for variable, (key, cast) in ENV_OVERRIDES.items():
+            value = os.environ.get(variable)
+            if value:
+                try:
+                    settings[key] = cast(value)
+                except ValueError:
+                    print(f"Warning: Ignoring invalid {variable}={value}", file=sys.stderr)
+        return cls(name, settings)
+
+    def allowed_cpus(self):
+        """CPUs the speech workers may run on, or None when unrestricted."""
+        if not hasattr(os, 'sched_getaffinity') or (self.cpus is None and self.reserve_cpus is None):
+            return None
+        cpus = parse_cpu_list(self.cpus) if self.cpus is not None else os.sched_getaffinity(0)
+        if self.reserve_cpus is not None:
+            remaining = cpus - parse_cpu_list(self.reserve_cpus)
+            # Never reserve every CPU: a single-core board still has to speak
+            cpus = remaining or cpus
+        return sorted(cpus & os.sched_getaffinity(0)) or None
+
+    def thread_environment(self):
+        """Environment variables limiting library thread pools."""
+        if not self.threads:
+            return {}
+        return {variable: str(self.threads) for variable in THREAD_ENV_VARS}
+
+    def worker_cpus(self):
+        """
+        CPUs for a worker that cannot be told its thread count: the last
+        `threads` of the CPUs this process may use, or None when the thread
+        budget already covers them all.
+        """
+        if not self.threads or not hasattr(os, 'sched_getaffinity'):
+            return None
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) <= int(self.threads):
+            return None
+        return cpus[-int(self.threads):]
+
+    def worker_command(self, cmd):
+        """
+        Wrap a worker command so it honours the thread budget.
+
+        piper has no thread option, and its onnxruntime sizes the intra-op
+        pool from the CPU count, ignoring THREAD_ENV_VARS. The only limit it
+        respects is CPU affinity, so with a thread budget the command runs
+        under taskset on that many CPUs. The pool keeps its size but its
+        threads share the pinned CPUs, which bounds the CPU time piper takes.
+        Without taskset the command runs unchanged; the in-process backend
+        (piper_onnx) sets intra_op_num_threads directly instead.
+        :param cmd: Command list
+        :return: Command list, prefixed with taskset when pinning applies
+        """
+        cpus = self.worker_cpus()
+        taskset = shutil.which('taskset') if cpus else None
+        if not taskset:
+            return cmd
+        return [taskset, '-c', ','.join(str(cpu) for cpu in cpus)] + list(cmd)
+
+    def apply(self):
+        """
+        Apply the profile to the current process (and so to its children).
+        Settings the platform or permissions do not allow are skipped with a
+        warning.
+        :return: Dictionary of the settings in effect
+        """
+        # Keep explicit thread settings from the environment
+        for variable, value in self.thread_environment().items():
+            os.environ.setdefault(variable, value)
+        if self.threads:
+            self.applied["threads"] = self.threads
+
+        cpus = self.allowed_cpus()
+        if cpus:
+            try:
+                os.sched_setaffinity(0, cpus)
+                self.applied["cpus"] = cpus
+            except OSError as e:
+                print(f"Warning: Failed to set CPU affinity: {e}", file=sys.stderr)
+
+        if self.nice is not None and hasattr(os, 'nice'):
+            try:
+                # Only ever lower the priority; raising it needs privileges
+                current = os.nice(0)
+                if self.nice > current:
+                    os.nice(self.nice - current)
+                self.applied["nice"] = os.nice(0)
+            except OSError as e:
+                print(f"Warning: Failed to set nice level: {e}", file=sys.stderr)
+
+        if self.ionice:
+            try:
+                _set_ionice(self.ionice)
+                self.applied["ionice"] = self.ionice
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Warning: Failed to set I/O priority {self.ionice}: {e}", file=sys.stderr)
+
+        if self.max_jobs:
+            self.applied["max_jobs"] = self.max_jobs
+        return self.applied
+
+    def ffmpeg_arguments(self):
+        """Extra ffmpeg options for the thread budget."""
+        return ['-threads', str(self.threads)] if self.threads else []
+
+    @contextmanager
+    def _slot(self, wait):
+        """Hold one of max_jobs host-wide job slots; yields the seconds waited."""
+        if not self.max_jobs or fcntl is None or not wait:
+            yield 0.0
+            return
+
+        os.makedirs(SLOTS_DIR, exist_ok=True)
+        start = time.monotonic()
+        held = None
+        while held is None:
+            for index in range(int(self.max_jobs)):
+                lock_file = open(os.path.join(SLOTS_DIR, f"slot-{index}.lock"), 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    held = lock_file
+                    break
+                except BlockingIOError:
+                    lock_file.close()
+            if held is None:
+                if time.monotonic() - start > self.job_wait:
+                    raise TimeoutError(
+                        f"No speech job slot free after {self.job_wait:.0f}s "
+                        f"(max_jobs={self.max_jobs})")
+                time.sleep(0.05)
+        try:
+            yield time.monotonic() - start
+        finally:
+            fcntl.flock(held, fcntl.LOCK_UN)
+            held.close()
+
+    @contextmanager
+    def job(self, wait=True):
+        """
+        Run one speech job under the profile: wait for a job slot, then
+        measure the CPU time of this process and its finished children.
+        :param wait: False to start at once regardless of max_jobs (urgent alerts)
+        :return: Dictionary filled with the job's resource report on exit
+        """
+        report = {"profile": self.name}
+        report.update(self.applied)
+        with self._slot(wait) as waited:
+            own_start, children_start = cpu_times()
+            wall_start = time.perf_counter()
+            try:
+                yield report
+            finally:
+                own_end, children_end = cpu_times()
+                wall = time.perf_counter() - wall_start
+                cpu = (own_end - own_start) + (children_end - children_start)
+                report.update({
+                    "slot_wait_s": round(waited, 4),
+                    "wall_s": round(wall, 4),
+                    "cpu_s": round(cpu, 4),
+                    "cpu_utilization": round(cpu / wall, 3) if wall > 0 else None
+                })
+
+
+_active_profile = None
+
+
+def active_profile():
+    """The profile applied to this process (loaded from the environment if none was)."""
+    global _active_profile
+    if _active_profile is None:
+        _active_profile = ResourceProfile.load()
+    return _active_profile
+
+
+def apply_profile(spec=None):
+    """Load and apply a resource profile for this process."""
+    global _active_profile
+    _active_profile = ResourceProfile.load(spec)
+    _active_profile.apply()
+    return _active_profile
+
+
+def prime_thread_environment():
+    """
+    Export the thread limits of SPEECH_RESOURCE_PROFILE before native
+    libraries that read them at load time (Kaldi's BLAS in vosk) are imported.
+    """
+    for variable, value in ResourceProfile.load().thread_environment().items():
+        os.environ.setdefault(variable, value)
+
+
+def add_resource_arguments(parser):
+    """Add the shared --resource-profile option to a CLI."""
+    parser.add_argument('--resource-profile', metavar='NAME_OR_FILE',
+                        help="CPU budget: 'default', 'sbc', 'background' or a JSON profile "
+                             "(default: SPEECH_RESOURCE_PROFILE)")
+
+
+def main():
+    """Command line interface: show the profile that would be applied."""
+    parser = argparse.ArgumentParser(description='Show the speech resource profile')
+    add_resource_arguments(parser)
+    args = parser.parse_args()
+
+    profile = ResourceProfile.load(args.resource_profile)
+    print(json.dumps({
+        "profile": profile.name,
+        "threads": profile.threads,
+        "cpus": profile.allowed_cpus(),
+        "nice": profile.nice,
+        "ionice": profile.ionice,
+        "max_jobs": profile.max_jobs,
+        "job_wait_s": profile.job_wait,
+        "environment": profile.thread_environment(),
+        "worker_cpus": profile.worker_cpus()
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
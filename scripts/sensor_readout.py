@@ -0,0 +1,603 @@
+import os
+import sys
+import json
+import time
+import wave
+import struct
+import hashlib
+import argparse
+import threading
+import subprocess
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Taken before the speech modules load, to report a one-shot readout's startup
+STARTED = time.perf_counter()
+
+from piper_tts import PiperTTS
+from speech_metrics import SpeechMetrics, add_instrumentation_arguments, run_with_profile
+from audio_spool import atomic_output
+from resource_profile import add_resource_arguments, apply_profile
+from sensors_config import load_sensor_config
+
+
+# Spoken form of the units in sensors.config.ts; others are read as written
+UNIT_WORDS = {
+    'RPM': 'RPM',
+    'km/h': 'kilometers per hour',
+    'mph': 'miles per hour',
+    '%': 'percent',
+    'V': 'volts',
+    '°C': 'degrees Celsius',
+    '°F': 'degrees Fahrenheit',
+    'bar': 'bar',
+    'psi': 'PSI',
+    'kPa': 'kilopascals',
+    'inHg': 'inches of mercury',
+    '° BTDC': 'degrees before top dead center',
+    'g/s': 'grams per second',
+    'lb/min': 'pounds per minute',
+    'min': 'minutes',
+    'km': 'kilometers',
+    'miles': 'miles',
+}
+
+ONES = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine',
+        'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen',
+        'seventeen', 'eighteen', 'nineteen']
+TENS = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+# Languages the number words are pre-rendered for; others use full synthesis
+READOUT_LANGUAGES = ('en',)
+MAX_READOUT_VALUE = 999999
+
+# Overlap of consecutive units, in seconds
+CROSSFADE_S = 0.012
+# Pause between the sensor name and its value
+NAME_PAUSE_S = 0.15
+# Silence kept around each unit after trimming
+UNIT_MARGIN_S = 0.01
+# Frames quieter than this relative to a unit's peak are trimmed
+TRIM_FLOOR_DB = -40.0
+# Synthesis settings the units are rendered with
+RENDER_NOISE_SCALE = 0.667
+RENDER_LENGTH_SCALE = 1.0
+
+def default_cache_dir():
+    """Unit bank location: SPEECH_READOUT_CACHE if set, otherwise the user cache directory."""
+    configured = os.environ.get('SPEECH_READOUT_CACHE')
+    if configured:
+        return configured
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'obd-speech', 'readouts')
+
+
+def _two_digits(n):
+    return ONES[n] if n < 20 else TENS[n // 10] + (f"-{ONES[n % 10]}" if n % 10 else '')
+
+
+def _below_thousand(n):
+    words = []
+    if n >= 100:
+        words += [ONES[n // 100], 'hundred']
+        n %= 100
+        if n == 0:
+            return words
+    words.append(_two_digits(n))
+    return words
+
+
+def number_words(value, decimals):
+    """
+    Spell a value as readout units: whole numbers below a hundred are one
+    unit ("ninety-two"), larger ones are built with "hundred" and
+    "thousand", and decimals are read digit by digit after "point".
+    :return: List of words, or None when the value is out of range
+    """
+    text = f"{abs(value):.{decimals}f}"
+    whole, _, fraction = text.partition('.')
+    whole = int(whole)
+    if whole > MAX_READOUT_VALUE:
+        return None
+
+    words = ['minus'] if value < 0 and float(text) != 0 else []
+    if whole >= 1000:
+        words += _below_thousand(whole // 1000) + ['thousand']
+        if whole % 1000:
+            words += _below_thousand(whole % 1000)
+    else:
+        words += _below_thousand(whole)
+    fraction = fraction.rstrip('0')
+    if fraction:
+        words += ['point'] + [ONES[int(digit)] for digit in fraction]
+    return words
+
+
+def default_decimals(value):
+    """One decimal for small values (13.8 V), none from a hundred up (3000 RPM)."""
+    return 0 if abs(value) >= 100 else 1
+
+
+def trim_silence(pcm, sample_rate):
+    """Cut the leading and trailing silence piper puts around an utterance."""
+    samples = array('h', pcm)
+    frame = max(1, sample_rate // 200)
+    peaks = [max(abs(s) for s in samples[i:i + frame]) for i in range(0, len(samples), frame)]
+    if not peaks or max(peaks) == 0:
+        return pcm
+    floor = max(peaks) * (10.0 ** (TRIM_FLOOR_DB / 20.0))
+    loud = [index for index, peak in enumerate(peaks) if peak > floor]
+    margin = int(UNIT_MARGIN_S * sample_rate)
+    start = max(0, loud[0] * frame - margin)
+    end = min(len(samples), (loud[-1] + 1) * frame + margin)
+    return samples[start:end].tobytes()
+
+
+def crossfade_join(clips, sample_rate):
+    """Join 16-bit PCM clips, overlapping each junction with a linear crossfade."""
+    overlap = int(CROSSFADE_S * sample_rate)
+    out = array('h')
+    for clip in clips:
+        samples = array('h', clip)
+        n = min(overlap, len(out), len(samples))
+        for i in range(n):
+            fade = (i + 1) / (n + 1)
+            j = len(out) - n + i
+            out[j] = int(out[j] * (1.0 - fade) + samples[i] * fade)
+        out.extend(samples[n:])
+    return out.tobytes()
+
+
+class UnitBank:
+    """
+    Pre-rendered PCM of the readout units for one voice and speaker.
+
+    Banks are stored as a single file (index length, JSON index, PCM) so
+    they can be replaced atomically, and are kept in memory once loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sample_rate = None
+        self.units = {}
+
+    def load(self):
+        """Read the bank from disk; a missing or damaged file leaves it empty."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            (index_length,) = struct.unpack_from('<I', data)
+            index = json.loads(data[4:4 + index_length].decode('utf-8'))
+            pcm = memoryview(data)[4 + index_length:]
+            self.sample_rate = index['sample_rate']
+            self.units = {phrase: bytes(pcm[offset:offset + length])
+                          for phrase, (offset, length) in index['units'].items()}
+        except (OSError, ValueError, KeyError, struct.error):
+            self.units = {}
+        return self
+
+    def save(self):
+        """Write the bank through a temp file."""
+        index = {"sample_rate": self.sample_rate, "units": {}}
+        offset = 0
+        for phrase, pcm in self.units.items():
+            index["units"][phrase] = (offset, len(pcm))
+            offset += len(pcm)
+        encoded = json.dumps(index, ensure_ascii=False).encode('utf-8')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(struct.pack('<I', len(encoded)))
+            f.write(encoded)
+            for pcm in self.units.values():
+                f.write(pcm)
+        os.replace(temp_path, self.path)
+
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+
+class SensorReadout:
+    """
+    Speak live sensor values by splicing pre-rendered units.
+
+    Number words, unit names and the sensor names from sensors.config.ts
+    are rendered once per voice with a single piper process. A readout is
+    then assembled from those units with short crossfades, without running
+    the model. Anything the bank does not cover is synthesized in full.
+    """
+
+    def __init__(self, tts=None, sensors=None, cache_dir=None, metrics=None):
+        self.metrics = metrics or SpeechMetrics('sensor_readout')
+        self.tts = tts or PiperTTS(metrics=self.metrics)
+        if sensors is None:
+            try:
+                sensors = load_sensor_config()
+            except (OSError, ValueError) as e:
+                print(f"Warning: Failed to read the sensor config: {e}", file=sys.stderr)
+                sensors = {}
+        self.sensors = sensors
+        self.cache_dir = cache_dir or default_cache_dir()
+        self._background_started = False
+
+    def find_sensor(self, sensor):
+        """Look a sensor up by key (ENGINE_RPM) or title (Engine RPM)."""
+        if sensor in self.sensors:
+            return sensor, self.sensors[sensor]
+        for key, config in self.sensors.items():
+            if config["title"].lower() == str(sensor).lower():
+                return key, config
+        return None, None
+
+    def phrases(self, language='en'):
+        """Every unit a readout in this language can be built from."""
+        if language not in READOUT_LANGUAGES:
+            return []
+        phrases = [_two_digits(n) for n in range(100)] + ['hundred', 'thousand', 'point', 'minus']
+        for config in self.sensors.values():
+            phrases.append(config["title"])
+            for unit in config["unit"].values():
+                phrases.append(UNIT_WORDS.get(unit, unit))
+        return list(dict.fromkeys(phrases))
+
+    def compose(self, config, value, units='metric', decimals=None, language='en'):
+        """
+        Build the readout for a value already in the requested unit system.
+        :return: (text for full synthesis, list of units or None when not spliceable)
+        """
+        unit = config["unit"][units]
+        if decimals is None:
+            decimals = default_decimals(value)
+        words = number_words(value, decimals) if language in READOUT_LANGUAGES else None
+        if words is None:
+            # Piper spells digits in the voice's own language
+            return f"{config['title']}, {value:.{decimals}f} {unit}", None
+        unit_words = UNIT_WORDS.get(unit, unit)
+        text = f"{config['title']}, {' '.join(words)} {unit_words}"
+        return text, [config["title"]] + words + [unit_words]
+
+    def _voice(self, language, speaker):
+        """:return: (voice model path or None, speaker ID, speaker dictionary)"""
+        voice_model_path = self.tts._apply_variant(self.tts._get_voice_model_path(language))
+        speaker_id, speaker_info = self.tts._resolve_speaker(voice_model_path, speaker)
+        return voice_model_path, speaker_id, speaker_info
+
+    def _bank(self, voice_model_path, speaker_id):
+        """The process-wide unit bank for a voice, loaded from disk on first use."""
+        stat = os.stat(voice_model_path)
+        key = hashlib.sha1(json.dumps([
+            os.path.abspath(voice_model_path), stat.st_size, int(stat.st_mtime),
+            speaker_id, RENDER_NOISE_SCALE, RENDER_LENGTH_SCALE
+        ]).encode('utf-8')).hexdigest()[:12]
+        stem = os.path.basename(voice_model_path)[:-len('.onnx')]
+        path = os.path.join(self.cache_dir, f"{stem}-{key}.bank")
+        with _banks_lock:
+            bank = _banks.get(path)
+            if bank is None:
+                bank = _banks[path] = UnitBank(path).load()
+            return bank
+
+    def prepare(self, language='en', speaker=None):
+        """
+        Render the units missing from the bank of a language's voice.
+        :return: Result dictionary
+        """
+        if language not in READOUT_LANGUAGES:
+            return {
+                "success": False,
+                "error": f"Readouts are not pre-rendered for language '{language}'",
+                "languages": list(READOUT_LANGUAGES)
+            }
+        if not self.tts.piper_available:
+            return {
+                "success": False,
+                "error": "Piper TTS executable not found",
+                "installation": self.tts.get_installation_instructions()
+            }
+        try:
+            voice_model_path, speaker_id, speaker_info = self._voice(language, speaker)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        if not voice_model_path:
+            return {
+                "success": False,
+                "error": f"No voice model found for language '{language}'"
+            }
+
+        bank = self._bank(voice_model_path, speaker_id)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(f"{bank.path}.lock", 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return {"success": True, "skipped": "Another process is rendering this voice"}
+
+            # Pick up what another process rendered since the bank was loaded
+            bank.load()
+            missing = [phrase for phrase in self.phrases(language) if phrase not in bank.units]
+            if missing:
+                try:
+                    with self.metrics.stage('render'):
+                        rendered = self.tts._synthesize_lines(
+                            voice_model_path, missing, 1.0,
+                            RENDER_NOISE_SCALE, RENDER_LENGTH_SCALE, None, speaker_id)
+                except Exception as e:
+                    return self.metrics.attach({
+                        "success": False,
+                        "error": f"Failed to render readout units: {str(e)}"
+                    })
+                with self.metrics.stage('encode'):
+                    for phrase, (pcm, sample_rate) in zip(missing, rendered):
+                        bank.units[phrase] = trim_silence(pcm, sample_rate)
+                        bank.sample_rate = sample_rate
+                    bank.save()
+
+        return self.metrics.attach({
+            "success": True,
+            "language": language,
+            "voice_model": os.path.basename(voice_model_path),
+            "speaker": speaker_info,
+            "bank": bank.path,
+            "units": len(bank.units),
+            "rendered": len(missing),
+            "bank_bytes": sum(len(pcm) for pcm in bank.units.values())
+        })
+
+    def _prepare_in_background(self, language, speaker):
+        """Render a voice's missing units in a detached low-priority process."""
+        if self._background_started or not self.tts.piper_available:
+            return
+        self._background_started = True
+        cmd = [sys.executable, os.path.abspath(__file__), '--prepare',
+               '--language', language, '--script-dir', str(self.tts.script_dir),
+               '--resource-profile', 'background']
+        if speaker is not None:
+            cmd.extend(['--speaker', str(speaker)])
+        env = os.environ.copy()
+        env['SPEECH_READOUT_CACHE'] = self.cache_dir
+        try:
+            subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, env=env, start_new_session=True)
+        except OSError as e:
+            print(f"Warning: Failed to start readout rendering: {e}", file=sys.stderr)
+
+    def readout(self, sensor, value, units='metric', language='en', output_file=None,
+                play=False, speaker=None, decimals=None):
+        """
+        Speak a sensor value, e.g. "Coolant Temperature, ninety-two degrees Celsius".
+        :param sensor: Sensor key or title from sensors.config.ts
+        :param value: Value, already converted to the unit system
+        :param units: 'metric' or 'imperial'
+        :param output_file: Output WAV file path (spooled when omitted)
+        :param play: Play the readout instead of returning a file
+        :param speaker: Speaker name or ID for multi-speaker voices
+        :param decimals: Decimals to read (default: one below 100, none above)
+        :return: Result dictionary
+        """
+        start = time.perf_counter()
+        key, config = self.find_sensor(sensor)
+        if config is None:
+            return {
+                "success": False,
+                "error": f"Unknown sensor '{sensor}'",
+                "sensors": list(self.sensors)
+            }
+        if units not in ('metric', 'imperial'):
+            return {
+                "success": False,
+                "error": f"Unknown unit system '{units}'"
+            }
+
+        text, parts = self.compose(config, float(value), units, decimals, language)
+        readout = {"sensor": key, "value": value, "unit": config["unit"][units]}
+        try:
+            voice_model_path, speaker_id, speaker_info = self._voice(language, speaker)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+        missing = None
+        if parts is not None and voice_model_path:
+            bank = self._bank(voice_model_path, speaker_id)
+            missing = [part for part in parts if part not in bank.units]
+            if not missing:
+                with self.metrics.stage('splice'):
+                    pause = b'\0\0' * int(NAME_PAUSE_S * bank.sample_rate)
+                    pcm = crossfade_join([bank.units[parts[0]] + pause] +
+                                         [bank.units[part] for part in parts[1:]],
+                                         bank.sample_rate)
+                readout.update({"mode": "spliced", "units": len(parts)})
+                result = self._emit(pcm, bank.sample_rate, output_file, play)
+                if result["success"]:
+                    result.update({
+                        "text": text,
+                        "language": language,
+                        "voice_model": os.path.basename(voice_model_path),
+                        "voice_variant": self.tts._voice_variant(voice_model_path),
+                        "speaker": speaker_info
+                    })
+                readout["elapsed_s"] = round(time.perf_counter() - start, 6)
+                result["readout"] = readout
+                return self.metrics.attach(result)
+            self._prepare_in_background(language, speaker)
+
+        # Not covered by the bank: synthesize the whole sentence
+        if play:
+            result = self.tts.text_to_speech_play(
+                text, language, 1.0, RENDER_NOISE_SCALE, RENDER_LENGTH_SCALE, speaker)
+        else:
+            result = self.tts.text_to_speech_file(
+                text, language, output_file, 1.0, RENDER_NOISE_SCALE, RENDER_LENGTH_SCALE,
+                speaker)
+        readout.update({"mode": "synthesized", "missing_units": missing})
+        readout["elapsed_s"] = round(time.perf_counter() - start, 6)
+        result["readout"] = readout
+        return result
+
+    def _emit(self, pcm, sample_rate, output_file, play):
+        """Play spliced PCM, or write it as a WAV file."""
+        if play:
+            player = self.tts._open_raw_player(sample_rate)
+            if player is None:
+                return {
+                    "success": False,
+                    "error": "No raw audio player found. Install aplay, paplay or sox."
+                }
+            with self.metrics.stage('playback'):
+                try:
+                    player.stdin.write(pcm)
+                    player.stdin.close()
+                except BrokenPipeError:
+                    pass
+                player.wait()
+            return {"success": True, "played": True}
+
+        if output_file is None:
+            output = self.tts.spool.output('sensor_readout')
+        else:
+            output = atomic_output(output_file)
+        with output:
+            with self.metrics.stage('encode'):
+                with wave.open(output.temp_path, 'wb') as wf:
+                    wf.setnchannels(1)
+                    wf.setsampwidth(2)
+                    wf.setframerate(sample_rate)
+                    wf.writeframes(pcm)
+            output_file = output.commit()
+        return {
+            "success": True,
+            "file_path": output_file,
+            "file_size": os.path.getsize(output_file),
+            "sample_rate": sample_rate
+        }
+
+
+def serve(engine, profile, requests=None, out=None):
+    """
+    Answer readout requests until the input closes, keeping the engine and
+    its unit banks loaded between them. A one-shot readout pays for the
+    Python start, imports and bank load on every value; here a readout
+    costs the splice alone.
+
+    Each request is a JSON line with "sensor" and "value" and optionally
+    "imperial", "decimals", "language", "speaker", "output" and "play".
+    Each result is written as one JSON line, in request order.
+    :param requests: Line iterable (default: stdin)
+    :param out: Text stream for the results (default: stdout)
+    """
+    requests = requests if requests is not None else sys.stdin
+    out = out if out is not None else sys.stdout
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            sensor, value = request["sensor"], float(request["value"])
+        except (ValueError, KeyError, TypeError) as e:
+            result = {"success": False, "error": f"Invalid readout request: {e}"}
+        else:
+            try:
+                with profile.job(wait=False) as usage:
+                    result = engine.readout(
+                        sensor, value, 'imperial' if request.get("imperial") else 'metric',
+                        request.get("language", 'en'), request.get("output"),
+                        bool(request.get("play")), request.get("speaker"),
+                        request.get("decimals"))
+                result["resources"] = usage
+            except Exception as e:
+                # One bad readout must not take the server down
+                result = {"success": False, "error": f"Readout failed: {str(e)}"}
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(
+        description='Speak OBD sensor values from pre-rendered Piper units')
+    parser.add_argument('sensor', nargs='?', help='Sensor key (ENGINE_RPM) or title')
+    parser.add_argument('value', nargs='?', type=float,
+                        help='Value, already in the selected unit system')
+    parser.add_argument('--imperial', action='store_true', help='Read imperial units')
+    parser.add_argument('--decimals', type=int,
+                        help='Decimals to read (default: one below 100, none above)')
+    parser.add_argument('--language', '-l', default='en', help='Language code')
+    parser.add_argument('--speaker', help='Speaker name or ID for multi-speaker voices')
+    parser.add_argument('--output', '-o', help='Output WAV file path')
+    parser.add_argument('--play', action='store_true',
+                        help='Play directly instead of saving to file')
+    parser.add_argument('--prepare', action='store_true',
+                        help="Render the units missing from the voice's bank and exit")
+    parser.add_argument('--serve', action='store_true',
+                        help='Answer JSON readout requests from stdin, one per line')
+    parser.add_argument('--list-sensors', action='store_true',
+                        help='List the sensors read from sensors.config.ts')
+    parser.add_argument('--sensors-config',
+                        help='sensors.config.ts to read (default: SPEECH_SENSORS_CONFIG)')
+    parser.add_argument('--format', choices=['json', 'text'], default='json',
+                        help='Output format')
+    parser.add_argument(
+        '--script-dir', help='Directory containing piper executable and voices folder')
+    add_instrumentation_arguments(parser)
+    add_resource_arguments(parser)
+
+    args = parser.parse_args()
+    if not (args.prepare or args.list_sensors or args.serve) and (args.sensor is None or args.value is None):
+        parser.error('sensor and value are required')
+
+    return run_with_profile(lambda: run(args), args.profile)
+
+
+def run(args):
+    """Run a readout for parsed command line arguments."""
+    metrics = SpeechMetrics(
+        'sensor_readout', enabled=(args.timings or bool(args.metrics_file)) or None)
+    profile = apply_profile(args.resource_profile)
+    sensors = load_sensor_config(args.sensors_config) if args.sensors_config else None
+    engine = SensorReadout(PiperTTS(args.script_dir, metrics), sensors, metrics=metrics)
+
+    if args.serve:
+        serve(engine, profile)
+        metrics.dump_prometheus(args.metrics_file)
+        return 0
+
+    try:
+        if args.list_sensors:
+            result = {"success": True, "sensors": engine.sensors}
+        elif args.prepare:
+            with profile.job() as usage:
+                result = engine.prepare(args.language, args.speaker)
+            result["resources"] = usage
+        else:
+            # Readouts are short and time critical, like alerts: never queue
+            startup = time.perf_counter() - STARTED
+            with profile.job(wait=False) as usage:
+                result = engine.readout(
+                    args.sensor, args.value, 'imperial' if args.imperial else 'metric',
+                    args.language, args.output, args.play, args.speaker, args.decimals)
+            if "readout" in result:
+                # elapsed_s covers the readout alone; this process also paid for these
+                result["readout"]["startup_s"] = round(startup, 6)
+            result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e)}
+
+    metrics.dump_prometheus(args.metrics_file)
+
+    if args.format == 'json':
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif result['success']:
+        print(result.get('text') or f"Units: {result.get('units', len(result.get('sensors', {})))}")
+    else:
+        print(f"Error: {result['error']}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
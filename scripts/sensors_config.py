@@ -0,0 +1,39 @@
+import os
+import re
+
+
+# The frontend's sensor table, shared with the speech scripts
+SENSORS_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'src', 'obd', 'config', 'sensors.config.ts')
+
+_QUOTED = r"(['\"])(.*?)\1"
+
+
+def load_sensor_config(path=None):
+    """
+    Read sensor names and units from the frontend's sensors.config.ts.
+    :param path: Config file (default: SPEECH_SENSORS_CONFIG or the repository copy)
+    :return: Dictionary of sensor key -> {"title", "unit": {"metric", "imperial"}}
+    """
+    path = path or os.environ.get('SPEECH_SENSORS_CONFIG') or SENSORS_CONFIG
+    with open(path, 'r', encoding='utf-8') as f:
+        # Drop line comments, which hold disabled entries
+        source = '\n'.join(line.split('//', 1)[0] for line in f.read().splitlines())
+
+    match = re.search(r'export const sensorConfig\s*=\s*\{(.*?)\n\};', source, re.S)
+    if not match:
+        raise ValueError(f"No sensorConfig found in {path}")
+
+    sensors = {}
+    entries = re.split(r'\n  ([A-Z0-9_]+): \{', match.group(1))
+    for key, entry in zip(entries[1::2], entries[2::2]):
+        title = re.search(r'title:\s*' + _QUOTED, entry)
+        unit = re.search(r'unit:\s*\{\s*metric:\s*' + _QUOTED + r',\s*imperial:\s*' + _QUOTED,
+                         entry)
+        if title and unit:
+            sensors[key] = {
+                "title": title.group(2),
+                "unit": {"metric": unit.group(2), "imperial": unit.group(4)}
+            }
+    return sensors
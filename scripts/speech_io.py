@@ -0,0 +1,486 @@
+import os
+import sys
+import mmap
+import codecs
+import struct
+from array import array
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+    resource_tracker = None
+
+
+# numpy, imported on first use; False once the import has failed
+_np = None
+
+# Defaults for headerless PCM input (what Vosk expects)
+RAW_SAMPLE_RATE = 16000
+RAW_CHANNELS = 1
+RAW_SAMPLE_WIDTH = 2
+
+
+def _numpy():
+    """numpy, imported on first use so scripts that never need it start faster."""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+def describe_source(spec):
+    """
+    Split an input source spec into (kind, value).
+
+    Supported specs:
+      '-'             standard input
+      'fd:N'          an inherited file descriptor
+      'shm:NAME'      a named shared-memory segment
+      'shm:NAME:LEN'  the first LEN bytes of a shared-memory segment
+      anything else   a filesystem path
+    """
+    if spec == '-':
+        return 'stdin', None
+    if spec.startswith('fd:') and spec[3:].isdigit():
+        return 'fd', int(spec[3:])
+    if spec.startswith('shm:'):
+        return 'shm', spec[4:]
+    return 'path', spec
+
+
+def is_stream_source(spec):
+    """True when spec refers to stdin, a descriptor or shared memory rather than a file."""
+    return describe_source(spec)[0] != 'path'
+
+
+def _read_fd(fd):
+    """Read a descriptor to EOF into a single bytearray."""
+    buffer = bytearray()
+    while True:
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            return buffer
+        buffer.extend(chunk)
+
+
+class InputBuffer:
+    """
+    Bytes of an input source, exposed as a memoryview.
+
+    Files are memory-mapped and shared-memory segments are used in place, so
+    neither is copied; stdin and descriptors are read once into memory.
+    Use as a context manager so mappings are released.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.kind, value = describe_source(spec)
+        self._mmap = None
+        self._shm = None
+        self._file = None
+
+        if self.kind == 'stdin':
+            self.view = memoryview(_read_fd(sys.stdin.fileno()))
+        elif self.kind == 'fd':
+            try:
+                self.view = memoryview(_read_fd(value))
+            finally:
+                os.close(value)
+        elif self.kind == 'shm':
+            self.view = self._open_shared_memory(value)
+        else:
+            self.view = self._open_file(value)
+
+    def _open_file(self, path):
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            return memoryview(b'')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def _open_shared_memory(self, value):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory input requires Python 3.8+")
+        name, _, length = value.partition(':')
+        self._shm = shared_memory.SharedMemory(name=name)
+        if resource_tracker is not None and os.name != 'nt':
+            # Attaching must not make this process unlink the producer's segment
+            try:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+            except Exception:
+                pass
+        view = self._shm.buf
+        if length:
+            view = view[:int(length)]
+        return view
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._shm is not None:
+            self._shm.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _BytesSource:
+    """InputBuffer stand-in for data that is already in memory."""
+
+    kind = 'memory'
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+
+    def close(self):
+        self.view.release()
+
+
+def read_text_source(spec, encoding='utf-8-sig'):
+    """
+    Read text from a source spec (see describe_source).
+    Shared-memory segments may be zero padded; trailing NULs are dropped.
+    """
+    with InputBuffer(spec) as source:
+        data = bytes(source.view)
+    if source.kind == 'shm':
+        data = data.rstrip(b'\0')
+    return data.decode(encoding)
+
+
+def iter_text_source(spec, encoding='utf-8', chunk_size=4096):
+    """
+    Yield text from a source spec as it arrives, for producers that write
+    incrementally (e.g. an LLM answer streamed to stdin). Multi-byte
+    characters split across reads are decoded once complete.
+    """
+    kind, value = describe_source(spec)
+    if kind not in ('stdin', 'fd'):
+        yield read_text_source(spec)
+        return
+
+    fd = sys.stdin.fileno() if kind == 'stdin' else value
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    try:
+        while True:
+            data = os.read(fd, chunk_size)
+            text = decoder.decode(data, final=not data)
+            if text:
+                yield text
+            if not data:
+                return
+    finally:
+        if kind == 'fd':
+            os.close(fd)
+
+
+class AudioBuffer:
+    """
+    PCM audio from an input source.
+
+    pcm is a memoryview over the sample data (no header); for files and
+    shared memory it points directly into the mapping.
+    """
+
+    def __init__(self, source, pcm, channels, sample_width, sample_rate):
+        self.source = source
+        self.pcm = pcm
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+
+    @property
+    def frame_count(self):
+        return len(self.pcm) // (self.channels * self.sample_width)
+
+    @property
+    def duration(self):
+        return self.frame_count / float(self.sample_rate) if self.sample_rate else 0.0
+
+    def chunks(self, frames):
+        """
+        Yield memoryview slices of at most `frames` frames.
+        Each slice is released once the next one is requested.
+        """
+        step = frames * self.channels * self.sample_width
+        for offset in range(0, len(self.pcm), step):
+            with self.pcm[offset:offset + step] as chunk:
+                yield chunk
+
+    def as_array(self):
+        """Return samples as a zero-copy NumPy int16 array (requires numpy)."""
+        np = _numpy()
+        if np is None:
+            raise RuntimeError("numpy is required for array access")
+        return np.frombuffer(self.pcm, dtype='<i2')
+
+    def close(self):
+        if self.pcm is not None:
+            self.pcm.release()
+            self.pcm = None
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def pcm_buffer(data, sample_rate=RAW_SAMPLE_RATE, channels=RAW_CHANNELS):
+    """Wrap in-memory s16le PCM in an AudioBuffer."""
+    source = _BytesSource(data)
+    return AudioBuffer(source, source.view[:], channels, RAW_SAMPLE_WIDTH, sample_rate)
+
+
+def resample_pcm(pcm, from_rate, to_rate):
+    """
+    Linearly resample 16-bit mono little-endian PCM, e.g. to join audio from
+    voices with different sample rates.
+    :return: Resampled PCM bytes
+    """
+    if from_rate == to_rate or not pcm:
+        return bytes(pcm)
+
+    step = from_rate / float(to_rate)
+    count = len(pcm) // 2
+    out_count = int(count / step)
+    np = _numpy()
+    if np is not None:
+        samples = np.frombuffer(pcm, dtype='<i2', count=count).astype(np.float32)
+        positions = np.arange(out_count) * step
+        return np.interp(positions, np.arange(count), samples).astype('<i2').tobytes()
+
+    samples = array('h')
+    samples.frombytes(bytes(pcm[:count * 2]))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    out = array('h', [0]) * out_count
+    last = count - 1
+    for i in range(out_count):
+        position = i * step
+        j = int(position)
+        k = min(j + 1, last)
+        out[i] = int(samples[j] + (samples[k] - samples[j]) * (position - j))
+    if sys.byteorder == 'big':
+        out.byteswap()
+    return out.tobytes()
+
+
+def parse_wav_header(view):
+    """
+    Locate the format and data chunks of a RIFF/WAVE buffer.
+    :return: (channels, sample_width, sample_rate, data_offset, data_length)
+    """
+    if len(view) < 12 or bytes(view[0:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE buffer")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack('<I', view[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate = struct.unpack(
+                '<HHI', view[body:body + 8])
+            bits = struct.unpack('<H', view[body + 14:body + 16])[0]
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError(f"Unsupported WAV encoding: {audio_format}")
+            fmt = (channels, bits // 8, sample_rate)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            # Streamed WAVs may carry a placeholder size; clamp to the buffer
+            length = min(chunk_size, len(view) - body)
+            return fmt + (body, length)
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV buffer has no data chunk")
+
+
+def open_audio_source(spec, raw_sample_rate=RAW_SAMPLE_RATE, raw_channels=RAW_CHANNELS):
+    """
+    Open audio from a source spec (see describe_source).
+    WAV input is parsed in place. Streams (stdin, descriptors, shared
+    memory) without a WAV header are taken as raw s16le PCM; files must be
+    WAV, so other formats fail instead of decoding as noise.
+    :return: AudioBuffer (use as a context manager)
+    """
+    source = InputBuffer(spec)
+    try:
+        view = source.view
+        if bytes(view[0:4]) == b'RIFF':
+            channels, sample_width, sample_rate, offset, length = parse_wav_header(view)
+            pcm = view[offset:offset + length]
+        elif source.kind == 'path':
+            raise ValueError(f"{spec} is not a WAV file; convert it first (--convert)")
+        else:
+            channels, sample_width, sample_rate = raw_channels, RAW_SAMPLE_WIDTH, raw_sample_rate
+            pcm = view[:]
+        return AudioBuffer(source, pcm, channels, sample_width, sample_rate)
+    except Exception:
+        source.close()
+        raise
+
+
+def _read_exact(stream, size):
+    """Read size bytes from a blocking stream, fewer only at EOF."""
+    data = stream.read(size) or b''
+    if len(data) == size:
+        return data
+    buffer = bytearray(data)
+    while data and len(buffer) < size:
+        data = stream.read(size - len(buffer)) or b''
+        buffer.extend(data)
+    return bytes(buffer)
+
+
+class PCMStream:
+    """
+    PCM audio read sequentially from a file, stdin, a descriptor or a pipe.
+
+    Unlike AudioBuffer nothing is mapped or accumulated: blocks are read as
+    they are decoded, so memory stays flat however long the input is.
+    position counts the PCM bytes read or skipped since the start of the
+    sample data.
+    """
+
+    def __init__(self, stream, channels=RAW_CHANNELS, sample_width=RAW_SAMPLE_WIDTH,
+                 sample_rate=RAW_SAMPLE_RATE, length=None, prefix=b''):
+        """
+        :param stream: Binary file object positioned at the sample data
+        :param length: Bytes of sample data, or None to read to EOF
+        :param prefix: Sample bytes already read from the stream
+        """
+        self.stream = stream
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.length = length
+        self.position = 0
+        self._prefix = prefix
+        try:
+            self._data_start = stream.tell() - len(prefix) if stream.seekable() else None
+        except (AttributeError, OSError, ValueError):
+            self._data_start = None
+
+    @property
+    def bytes_per_second(self):
+        return self.channels * self.sample_width * self.sample_rate
+
+    def _limit(self, size):
+        if self.length is None:
+            return size
+        return max(0, min(size, self.length - self.position))
+
+    def read(self, size):
+        """Read up to size bytes of sample data; b'' at the end."""
+        size = self._limit(size)
+        if not size:
+            return b''
+        if self._prefix:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            if len(data) < size:
+                data += _read_exact(self.stream, size - len(data))
+        else:
+            data = _read_exact(self.stream, size)
+        self.position += len(data)
+        return data
+
+    def skip(self, offset):
+        """
+        Move forward to a byte offset in the sample data, seeking when the
+        input allows it and reading past the audio otherwise.
+        :return: New position (short of offset when the input ended first)
+        """
+        if self.length is not None:
+            offset = min(offset, self.length)
+        if offset <= self.position:
+            return self.position
+        if self._data_start is not None:
+            self.stream.seek(self._data_start + offset)
+            self._prefix = b''
+            self.position = offset
+            return self.position
+        while self.position < offset:
+            if not self.read(min(offset - self.position, 1 << 16)):
+                break
+        return self.position
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _read_wav_stream_header(stream):
+    """
+    Read the RIFF/WAVE chunks in front of the sample data of a stream.
+    :return: (channels, sample_width, sample_rate, data_length or None when
+              the header carries a streaming placeholder)
+    """
+    fmt = None
+    while True:
+        header = _read_exact(stream, 8)
+        if len(header) < 8:
+            raise ValueError("WAV stream has no data chunk")
+        chunk_id = header[0:4]
+        chunk_size = struct.unpack('<I', header[4:8])[0]
+        if chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return fmt + (None if chunk_size in (0, 0xFFFFFFFF) else chunk_size,)
+        body = _read_exact(stream, chunk_size + (chunk_size & 1))
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate = struct.unpack('<HHI', body[0:8])
+            bits = struct.unpack('<H', body[14:16])[0]
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError(f"Unsupported WAV encoding: {audio_format}")
+            fmt = (channels, bits // 8, sample_rate)
+
+
+def open_audio_stream(spec, raw_sample_rate=RAW_SAMPLE_RATE, raw_channels=RAW_CHANNELS):
+    """
+    Open audio from a path, '-' or 'fd:N' for sequential reading (see
+    PCMStream). WAV input is recognized by its header; stdin and
+    descriptors without one are taken as raw s16le PCM, files must be WAV.
+    :return: PCMStream (use as a context manager)
+    """
+    kind, value = describe_source(spec)
+    if kind == 'shm':
+        raise ValueError("Shared memory input is already in memory; stream a file or pipe")
+    if kind == 'stdin':
+        stream = sys.stdin.buffer
+    elif kind == 'fd':
+        stream = os.fdopen(value, 'rb')
+    else:
+        stream = open(value, 'rb')
+    try:
+        prefix = _read_exact(stream, 12)
+        if len(prefix) == 12 and prefix[0:4] == b'RIFF' and prefix[8:12] == b'WAVE':
+            channels, sample_width, sample_rate, length = _read_wav_stream_header(stream)
+            return PCMStream(stream, channels, sample_width, sample_rate, length)
+        if kind == 'path':
+            raise ValueError(f"{spec} is not a WAV file; convert it first (--convert)")
+        return PCMStream(stream, raw_channels, RAW_SAMPLE_WIDTH, raw_sample_rate, prefix=prefix)
+    except Exception:
+        stream.close()
+        raise
@@ -0,0 +1,252 @@
+import os
+import re
+import sys
+import time
+import cProfile
+import pstats
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Piper logs e.g. "Real-time factor: 0.27 (infer=1.2 sec, audio=4.4 sec)"
+PIPER_RTF_PATTERN = re.compile(
+    r'Real-time factor:\s*([\d.]+)\s*\(infer=([\d.]+)\s*sec,\s*audio=([\d.]+)\s*sec\)')
+
+PROMETHEUS_LINE_PATTERN = re.compile(r'^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def timings_enabled():
+    """Instrumentation is opt-in through SPEECH_TIMINGS=1, and on while recording a trace."""
+    return (os.environ.get('SPEECH_TIMINGS', '').lower() in ('1', 'true', 'yes')
+            or bool(os.environ.get('SPEECH_TRACE_FILE')))
+
+
+def cpu_times():
+    """Return (self_cpu, children_cpu) in seconds."""
+    if resource is None:
+        return time.process_time(), 0.0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def peak_rss_bytes():
+    """Return (self_peak, children_peak) resident set size in bytes, or None."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+class SpeechMetrics:
+    """
+    Per-stage wall and CPU time for one speech request.
+
+    CPU time includes finished child processes (piper, ffmpeg, espeak-ng),
+    so subprocess work is attributed to the stage that waited for it.
+    When disabled every call is a cheap no-op.
+    """
+
+    def __init__(self, script, enabled=None):
+        self.script = script
+        self.enabled = timings_enabled() if enabled is None else enabled
+        self.stages = {}
+        self.extra = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        wall_start = time.perf_counter()
+        own_start, children_start = cpu_times()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            own_end, children_end = cpu_times()
+            self.add(name, wall, (own_end - own_start) + (children_end - children_start))
+
+    def add(self, name, wall, cpu):
+        """Record a stage measured elsewhere."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.stages.setdefault(
+                name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+            entry["wall_s"] += wall
+            entry["cpu_s"] += cpu
+            entry["calls"] += 1
+
+    def record_piper_stderr(self, stderr):
+        """Keep the real-time factor piper reports on stderr."""
+        if not self.enabled or not stderr:
+            return
+        match = PIPER_RTF_PATTERN.search(stderr)
+        if match:
+            self.extra["piper"] = {
+                "real_time_factor": float(match.group(1)),
+                "infer_s": float(match.group(2)),
+                "audio_s": float(match.group(3))
+            }
+
+    def as_dict(self):
+        """Return the timings block attached to results."""
+        own_peak, children_peak = peak_rss_bytes()
+        timings = {
+            "total_wall_s": round(time.perf_counter() - self._start, 6),
+            "stages": {
+                name: {
+                    "wall_s": round(entry["wall_s"], 6),
+                    "cpu_s": round(entry["cpu_s"], 6),
+                    "calls": entry["calls"]
+                }
+                for name, entry in self.stages.items()
+            },
+            "peak_rss_bytes": own_peak,
+            "children_peak_rss_bytes": children_peak
+        }
+        timings.update(self.extra)
+        return timings
+
+    def attach(self, result):
+        """Add the timings block to a result dictionary when enabled."""
+        if self.enabled and isinstance(result, dict):
+            result["timings"] = self.as_dict()
+        return result
+
+    def dump_prometheus(self, path=None):
+        """
+        Add this request to the cumulative stats file in Prometheus text format.
+        :param path: Stats file; defaults to SPEECH_METRICS_FILE
+        """
+        path = path or os.environ.get('SPEECH_METRICS_FILE')
+        if not self.enabled or not path:
+            return
+
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(f"{path}.lock", 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            samples = read_prometheus(path)
+            for name, entry in self.stages.items():
+                labels = f'script="{self.script}",stage="{name}"'
+                for key, metric in (("wall_s", "speech_stage_wall_seconds_total"),
+                                    ("cpu_s", "speech_stage_cpu_seconds_total"),
+                                    ("calls", "speech_stage_calls_total")):
+                    samples[(metric, labels)] = samples.get(
+                        (metric, labels), 0.0) + entry[key]
+
+            labels = f'script="{self.script}"'
+            samples[("speech_requests_total", labels)] = samples.get(
+                ("speech_requests_total", labels), 0.0) + 1
+            own_peak, children_peak = peak_rss_bytes()
+            if own_peak is not None:
+                key = ("speech_peak_rss_bytes", labels)
+                samples[key] = max(samples.get(key, 0.0), own_peak)
+                key = ("speech_children_peak_rss_bytes", labels)
+                samples[key] = max(samples.get(key, 0.0), children_peak)
+
+            write_prometheus(path, samples)
+        except OSError as e:
+            print(f"Warning: Failed to write metrics to {path}: {e}", file=sys.stderr)
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+
+METRIC_TYPES = {
+    "speech_stage_wall_seconds_total": ("counter", "Wall time spent per speech stage"),
+    "speech_stage_cpu_seconds_total": ("counter", "CPU time (including child processes) per speech stage"),
+    "speech_stage_calls_total": ("counter", "Number of times each speech stage ran"),
+    "speech_requests_total": ("counter", "Number of instrumented speech requests"),
+    "speech_peak_rss_bytes": ("gauge", "Highest peak RSS seen for a speech script"),
+    "speech_children_peak_rss_bytes": ("gauge", "Highest peak RSS seen for a child process"),
+}
+
+
+def read_prometheus(path):
+    """Parse a stats file written by write_prometheus into {(metric, labels): value}."""
+    samples = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                match = PROMETHEUS_LINE_PATTERN.match(line)
+                if match:
+                    labels = (match.group(2) or '{}')[1:-1]
+                    samples[(match.group(1), labels)] = float(match.group(3))
+    except FileNotFoundError:
+        pass
+    return samples
+
+
+def write_prometheus(path, samples):
+    """Atomically write samples in Prometheus text exposition format."""
+    lines = []
+    for metric, (metric_type, help_text) in METRIC_TYPES.items():
+        series = sorted((labels, value) for (name, labels), value in samples.items()
+                        if name == metric)
+        if not series:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for labels, value in series:
+            lines.append(f"{metric}{{{labels}}} {value!r}")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def add_instrumentation_arguments(parser):
+    """Add the shared --timings/--metrics-file/--profile options to a CLI."""
+    parser.add_argument('--timings', action='store_true',
+                        help='Add a per-stage timings block to the result')
+    parser.add_argument('--metrics-file',
+                        help='Accumulate stage timings in this Prometheus text file')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='PSTATS_FILE',
+                        help='Profile the whole run with cProfile; write pstats to '
+                             'PSTATS_FILE or print a summary to stderr')
+
+
+def run_with_profile(fn, profile_path):
+    """
+    Run fn under cProfile when profile_path is set.
+    :param profile_path: pstats output file, or '-' for a summary on stderr
+    :return: fn's return value
+    """
+    if not profile_path:
+        return fn()
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn)
+    finally:
+        if profile_path == '-':
+            stats = pstats.Stats(profiler, stream=sys.stderr)
+            stats.sort_stats('cumulative').print_stats(30)
+        else:
+            profiler.dump_stats(profile_path)
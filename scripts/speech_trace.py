@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import socket
+import hashlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from speech_io import describe_source
+
+
+TRACE_VERSION = 1
+# Input audio is stored next to the trace, once per distinct recording
+BLOB_DIR_SUFFIX = '.blobs'
+
+_ARABIC_LETTER = re.compile('[\u0621-\u064a]')
+_LATIN_LETTER = re.compile('[A-Za-z\u00c0-\u024f]')
+_DIGIT = re.compile(r'\d')
+
+
+def trace_file():
+    """Trace file of this process (SPEECH_TRACE_FILE), or None when recording is off."""
+    return os.environ.get('SPEECH_TRACE_FILE') or None
+
+
+def trace_redacted():
+    """SPEECH_TRACE_REDACT=1 keeps the shape of inputs but not their content."""
+    return os.environ.get('SPEECH_TRACE_REDACT', '').lower() in ('1', 'true', 'yes')
+
+
+def redact_text(text):
+    """
+    Replace letters and digits while keeping word lengths, script and
+    punctuation, so segmenting and synthesis cost stay comparable.
+    """
+    text = _ARABIC_LETTER.sub('س', text)
+    text = _LATIN_LETTER.sub('x', text)
+    return _DIGIT.sub('0', text)
+
+
+def text_script(text):
+    """'arabic', 'latin', 'mixed' or None for text without letters."""
+    arabic = bool(_ARABIC_LETTER.search(text))
+    latin = bool(_LATIN_LETTER.search(text))
+    if arabic and latin:
+        return 'mixed'
+    return 'arabic' if arabic else 'latin' if latin else None
+
+
+def store_blob(trace_path, source_path):
+    """
+    Copy an input file into the trace's blob directory, named by content.
+    :return: Blob file name, relative to the blob directory
+    """
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    name = digest.hexdigest()[:32] + (os.path.splitext(source_path)[1].lower() or '.bin')
+
+    blob_dir = trace_path + BLOB_DIR_SUFFIX
+    target = os.path.join(blob_dir, name)
+    if not os.path.exists(target):
+        os.makedirs(blob_dir, exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, target)
+    return name
+
+
+def result_summary(result):
+    """The parts of a result a trace keeps: outcome, model choice and stage timings."""
+    timings = result.get("timings") or {}
+    summary = {
+        "success": bool(result.get("success")),
+        "error": result.get("error"),
+        "tier": result.get("tier"),
+        "engine": (result.get("routing") or {}).get("engine"),
+        "total_wall_s": timings.get("total_wall_s"),
+        "stages": {
+            name: round(stage["wall_s"], 6)
+            for name, stage in (timings.get("stages") or {}).items()
+        }
+    }
+    if "duration_s" in result:
+        summary["duration_s"] = result["duration_s"]
+    if "confidence" in result:
+        summary["confidence"] = result["confidence"]
+    if result.get("dispatch"):
+        # Decoded by a remote STT worker (voice_to_text.py --serve)
+        summary["node"] = result["dispatch"].get("node")
+    if result.get("stream"):
+        summary["first_audio_latency_s"] = result["stream"].get("first_audio_latency_s")
+    return summary
+
+
+class SpeechTrace:
+    """
+    Record one speech request to the trace file, when tracing is on.
+
+    A trace is NDJSON: one line per request with the request options, the
+    input (text, or a reference to the audio copied beside the trace), the
+    wall time from the entry point to the result and the per-stage timings.
+    SPEECH_TRACE_SAMPLE records only a fraction of the requests. Recording
+    never fails a request; problems are reported on stderr.
+    """
+
+    def __init__(self, kind, entry, request):
+        """
+        :param kind: 'stt' or 'tts'
+        :param entry: Entry point that served the request
+        :param request: Dictionary of request options (language, tier, ...)
+        """
+        self.kind = kind
+        self.entry = entry
+        self.request = request
+        self.path = trace_file()
+        if self.path:
+            sample = float(os.environ.get('SPEECH_TRACE_SAMPLE', '1') or 1)
+            if sample < 1 and random.random() >= sample:
+                self.path = None
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+    def _audio_input(self, source):
+        entry = {"source": None, "blob": None}
+        if source is None:
+            return entry
+        kind, value = describe_source(source)
+        entry["source"] = kind
+        if kind == 'path' and os.path.isfile(value):
+            entry["bytes"] = os.path.getsize(value)
+            if not trace_redacted():
+                entry["blob"] = store_blob(self.path, value)
+        return entry
+
+    def _text_input(self, text):
+        return {
+            "text": redact_text(text) if trace_redacted() else text,
+            "chars": len(text),
+            "script": text_script(text),
+            "redacted": trace_redacted()
+        }
+
+    def record(self, result, audio=None, text=None):
+        """
+        Append the request to the trace.
+        :param result: Result dictionary returned to the caller
+        :param audio: Input audio source spec (speech-to-text)
+        :param text: Input text (text-to-speech)
+        """
+        if not self.path:
+            return
+        wall = time.perf_counter() - self._start
+        try:
+            record = {
+                "v": TRACE_VERSION,
+                "id": uuid.uuid4().hex[:16],
+                "kind": self.kind,
+                "entry": self.entry,
+                "host": socket.gethostname(),
+                "ts": round(self.started, 4),
+                "wall_s": round(wall, 6),
+                "request": self.request,
+                "input": self._text_input(text) if text is not None else self._audio_input(audio),
+                "result": result_summary(result if isinstance(result, dict) else {})
+            }
+            replay_of = os.environ.get('SPEECH_TRACE_REPLAY_OF')
+            if replay_of:
+                record["replay_of"] = replay_of
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(line)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Failed to record trace to {self.path}: {e}", file=sys.stderr)
+
+
+def load_trace(path):
+    """
+    Read a trace file.
+    :return: List of request records, oldest first
+    """
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A request still being written when the trace was copied
+                print(f"Warning: skipping malformed trace line {number}", file=sys.stderr)
+    records.sort(key=lambda r: r.get("ts", 0.0))
+    return records
+
+
+def blob_path(trace_path, record):
+    """Stored input audio of a record, or None when it was not kept."""
+    name = (record.get("input") or {}).get("blob")
+    if not name:
+        return None
+    path = os.path.join(trace_path + BLOB_DIR_SUFFIX, name)
+    return path if os.path.isfile(path) else None
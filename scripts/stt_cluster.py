@@ -0,0 +1,497 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 5710
+
+# Every message is a frame: type (1 byte), payload length (4 bytes, big
+# endian), payload. Jobs carry a JSON header and raw PCM, everything else JSON.
+FRAME_HEADER = struct.Struct('!BI')
+JOB_HEADER = struct.Struct('!I')
+MAX_FRAME_BYTES = 1 << 30
+
+MSG_HELLO = 1
+MSG_JOB = 2
+MSG_RESULT = 3
+MSG_HEARTBEAT = 4
+MSG_ERROR = 5
+
+# Seconds between heartbeats while a worker decodes
+HEARTBEAT_INTERVAL = 1.0
+# A node is failed when nothing arrives from it for this long
+DEFAULT_HEARTBEAT_TIMEOUT = 5.0
+DEFAULT_CONNECT_TIMEOUT = 2.0
+# Remote attempts before a job is decoded locally
+DEFAULT_MAX_ATTEMPTS = 2
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return buffer
+
+
+def send_frame(sock, kind, *parts):
+    """Send one frame whose payload is the concatenation of parts."""
+    sock.sendall(FRAME_HEADER.pack(kind, sum(len(part) for part in parts)))
+    for part in parts:
+        sock.sendall(part)
+
+
+def recv_frame(sock):
+    """:return: (message type, payload bytearray)"""
+    kind, length = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Frame of {length} bytes exceeds the limit")
+    return kind, _recv_exact(sock, length)
+
+
+def send_json(sock, kind, message):
+    send_frame(sock, kind, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def pack_job(header, pcm):
+    """Frame parts of a job: header length, JSON header, PCM."""
+    encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return JOB_HEADER.pack(len(encoded)), encoded, pcm
+
+
+def unpack_job(payload):
+    """:return: (header dictionary, PCM memoryview)"""
+    (length,) = JOB_HEADER.unpack_from(payload)
+    header = json.loads(payload[JOB_HEADER.size:JOB_HEADER.size + length].decode('utf-8'))
+    return header, memoryview(payload)[JOB_HEADER.size + length:]
+
+
+def parse_node_list(spec):
+    """
+    Parse a static list of STT workers: host:port entries separated by
+    commas or whitespace, or the path of a file with one entry per line
+    ('#' starts a comment). The port defaults to DEFAULT_PORT.
+    :return: List of (host, port)
+    """
+    if not spec:
+        return []
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            spec = ' '.join(line.split('#', 1)[0] for line in f)
+    nodes = []
+    for entry in spec.replace(',', ' ').split():
+        host, separator, port = entry.rpartition(':')
+        if not separator:
+            host, port = entry, DEFAULT_PORT
+        nodes.append((host, int(port)))
+    return nodes
+
+
+def configured_nodes():
+    """Workers listed in SPEECH_STT_WORKERS (entries or a file path)."""
+    return parse_node_list(os.environ.get('SPEECH_STT_WORKERS'))
+
+
+class STTWorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Serve transcription jobs to dispatchers on other nodes.
+
+    A connection carries one job at a time and decoding runs on a pool of
+    `slots` threads. While a job decodes the connection sends heartbeats,
+    so a dispatcher can tell a long job from a dead node.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, decode, address=('0.0.0.0', DEFAULT_PORT), slots=1, name=None):
+        """
+        :param decode: Callable (job header, PCM memoryview) -> result dictionary
+        """
+        self.decode = decode
+        self.slots = max(1, int(slots))
+        self.name = name or socket.gethostname()
+        self.pool = ThreadPoolExecutor(max_workers=self.slots)
+        self.started = time.time()
+        self.stats = {"jobs": 0, "failed": 0, "audio_s": 0.0, "busy_s": 0.0}
+        self._stats_lock = threading.Lock()
+        super().__init__(address, _WorkerHandler)
+
+    def hello(self):
+        """Handshake reply: identity, capacity and statistics."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            "version": PROTOCOL_VERSION,
+            "name": self.name,
+            "slots": self.slots,
+            "uptime_s": round(time.time() - self.started, 1),
+            "stats": stats
+        }
+
+    def run_job(self, sock, header, pcm):
+        """Decode one job, sending heartbeats until the result is ready."""
+        start = time.perf_counter()
+        future = self.pool.submit(self.decode, header, pcm)
+        while not wait([future], timeout=HEARTBEAT_INTERVAL).done:
+            send_frame(sock, MSG_HEARTBEAT)
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"success": False, "error": f"Worker {self.name} failed: {str(e)}"}
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.stats["jobs"] += 1
+            self.stats["failed"] += 0 if result.get("success") else 1
+            self.stats["audio_s"] = round(self.stats["audio_s"] + header.get("duration", 0.0), 3)
+            self.stats["busy_s"] = round(self.stats["busy_s"] + elapsed, 3)
+        result["worker"] = {"name": self.name, "decode_s": round(elapsed, 4)}
+        return result
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            kind, _ = recv_frame(sock)
+            if kind != MSG_HELLO:
+                return
+            send_json(sock, MSG_HELLO, self.server.hello())
+            while True:
+                kind, payload = recv_frame(sock)
+                if kind == MSG_HEARTBEAT:
+                    send_frame(sock, MSG_HEARTBEAT)
+                elif kind == MSG_JOB:
+                    header, pcm = unpack_job(payload)
+                    send_json(sock, MSG_RESULT, self.server.run_job(sock, header, pcm))
+                else:
+                    send_json(sock, MSG_ERROR, {"error": f"Unexpected message type {kind}"})
+        except (OSError, ValueError, struct.error):
+            # Dispatcher went away or sent garbage; it requeues the job itself
+            return
+
+
+class STTNode:
+    """A worker as seen by the dispatcher, with its queue and statistics."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}" if port is not None else host
+        self.worker = None
+        self.slots = None
+        self.healthy = True
+        self.error = None
+        self.queue = deque()
+        self.jobs = 0
+        self.stolen = 0
+        self.failed = 0
+        self.audio_s = 0.0
+        self.busy_s = 0.0
+
+    def stats(self, elapsed):
+        return {
+            "node": self.name,
+            "worker": self.worker,
+            "healthy": self.healthy,
+            "error": self.error,
+            "slots": self.slots,
+            "jobs": self.jobs,
+            "stolen": self.stolen,
+            "failed_attempts": self.failed,
+            "audio_s": round(self.audio_s, 3),
+            "busy_s": round(self.busy_s, 3),
+            # Seconds of audio transcribed per second of the batch
+            "throughput": round(self.audio_s / elapsed, 3) if elapsed > 0 else None,
+            "mean_latency_s": round(self.busy_s / self.jobs, 4) if self.jobs else None
+        }
+
+
+class STTCluster:
+    """
+    Run a batch of transcription jobs on remote workers, with work stealing.
+
+    Jobs are dealt round-robin to the nodes' queues. Each connection (one
+    per worker slot) takes jobs from the front of its node's queue and, once
+    that is empty, steals from the back of the longest other queue, so
+    faster nodes end up with more of the batch. A node that drops its
+    connection or misses heartbeats is marked failed and its jobs go to the
+    others. Local decoding takes over when no remote node is left, and for
+    jobs that failed on max_attempts nodes.
+    """
+
+    def __init__(self, nodes, local_decode, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 heartbeat_timeout=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        :param nodes: List of (host, port)
+        :param local_decode: Callable (job, AudioBuffer or None when the input could not
+                             be opened, see job["open_error"]) -> result dictionary
+        """
+        self.nodes = [STTNode(host, port) for host, port in nodes]
+        self.local = STTNode('local', None)
+        self.local.slots = 1
+        self.local_decode = local_decode
+        self.connect_timeout = connect_timeout
+        self.heartbeat_timeout = float(heartbeat_timeout if heartbeat_timeout is not None else
+                                       os.environ.get('SPEECH_STT_HEARTBEAT_TIMEOUT',
+                                                      DEFAULT_HEARTBEAT_TIMEOUT))
+        self.max_attempts = max(1, max_attempts)
+        self.elapsed = 0.0
+        self._cond = threading.Condition()
+        self._results = {}
+        self._total = 0
+
+    def run(self, jobs):
+        """
+        Transcribe a batch.
+        :param jobs: List of job dictionaries with "name", "language", "tier",
+                     "redecode", "intents", "alternatives" and "open" (a
+                     callable returning the AudioBuffer)
+        :return: List of result dictionaries, in job order
+        """
+        start = time.perf_counter()
+        self._results = {}
+        self._total = len(jobs)
+        for index, job in enumerate(jobs):
+            job.update(index=index, attempts=[])
+            owner = self.nodes[index % len(self.nodes)] if self.nodes else self.local
+            owner.queue.append(job)
+
+        threads = [threading.Thread(target=self._serve_local, daemon=True)]
+        threads += [threading.Thread(target=self._serve_node, args=(node,), daemon=True)
+                    for node in self.nodes]
+        for thread in threads:
+            thread.start()
+        with self._cond:
+            while len(self._results) < self._total:
+                self._cond.wait()
+        self.elapsed = time.perf_counter() - start
+        return [self._results[index] for index in range(self._total)]
+
+    def stats(self):
+        """Per-node throughput statistics of the last batch."""
+        return {
+            "elapsed_s": round(self.elapsed, 3),
+            "nodes": [node.stats(self.elapsed) for node in self.nodes + [self.local]]
+        }
+
+    def _take(self, node):
+        """Next job for a node, stealing when its queue is empty; None when done."""
+        with self._cond:
+            while True:
+                if len(self._results) >= self._total or not node.healthy:
+                    return None
+                if node.queue:
+                    return node.queue.popleft()
+                # Remote nodes steal from each other; local decoding only
+                # steals once no remote node is left
+                if node is not self.local or not any(n.healthy for n in self.nodes):
+                    victims = [n for n in self.nodes if n is not node and n.queue]
+                    if victims:
+                        node.stolen += 1
+                        return max(victims, key=lambda n: len(n.queue)).queue.pop()
+                self._cond.wait()
+
+    def _fail(self, node, error):
+        with self._cond:
+            if node.healthy:
+                print(f"Warning: STT worker {node.name} failed: {error}", file=sys.stderr)
+            node.healthy = False
+            node.error = error
+            self._cond.notify_all()
+
+    def _requeue(self, job, node, error):
+        """Give a job that failed on a node to another node, or to local decoding."""
+        with self._cond:
+            node.failed += 1
+            job["attempts"].append({"node": node.name, "error": error})
+            healthy = [n for n in self.nodes if n.healthy and n is not node]
+            if len(job["attempts"]) >= self.max_attempts or not healthy:
+                self.local.queue.append(job)
+            else:
+                min(healthy, key=lambda n: len(n.queue)).queue.appendleft(job)
+            self._cond.notify_all()
+
+    def _finish(self, job, node, result, elapsed, duration):
+        result["file_path"] = job["name"]
+        result["dispatch"] = {
+            "node": node.name,
+            "latency_s": round(elapsed, 4),
+            "failed_attempts": job["attempts"]
+        }
+        with self._cond:
+            node.jobs += 1
+            node.audio_s += duration
+            node.busy_s += elapsed
+            self._results[job["index"]] = result
+            self._cond.notify_all()
+
+    def _connect(self, node):
+        """Open a connection and shake hands; returns (socket, worker hello)."""
+        sock = socket.create_connection((node.host, node.port), timeout=self.connect_timeout)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            send_json(sock, MSG_HELLO, {"version": PROTOCOL_VERSION})
+            kind, payload = recv_frame(sock)
+            hello = json.loads(payload.decode('utf-8')) if kind == MSG_HELLO else {}
+            if hello.get("version") != PROTOCOL_VERSION:
+                raise ConnectionError(f"Unsupported worker protocol {hello.get('version')}")
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(self.heartbeat_timeout)
+        return sock, hello
+
+    def _serve_node(self, node):
+        """Connect to a node, then serve it with one connection per slot."""
+        try:
+            sock, hello = self._connect(node)
+        except (OSError, ValueError) as e:
+            self._fail(node, f"Unreachable: {str(e)}")
+            return
+        with self._cond:
+            node.worker = hello.get("name")
+            node.slots = max(1, int(hello.get("slots", 1)))
+        for _ in range(node.slots - 1):
+            threading.Thread(target=self._serve_connection, args=(node, None),
+                             daemon=True).start()
+        self._serve_connection(node, sock)
+
+    def _serve_connection(self, node, sock):
+        if sock is None:
+            try:
+                sock, _ = self._connect(node)
+            except (OSError, ValueError) as e:
+                self._fail(node, f"Unreachable: {str(e)}")
+                return
+        with sock:
+            while True:
+                job = self._take(node)
+                if job is None:
+                    return
+                try:
+                    audio = job["open"]()
+                except Exception as e:
+                    # Unreadable input is reported by local decoding
+                    with self._cond:
+                        job["open_error"] = e
+                        self.local.queue.append(job)
+                        self._cond.notify_all()
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    with audio:
+                        duration = audio.duration
+                        header = {
+                            "name": job["name"],
+                            "language": job["language"],
+                            "tier": job.get("tier"),
+                            "redecode": job.get("redecode", True),
+                            "intents": job.get("intents", False),
+                            "alternatives": job.get("alternatives", 0),
+                            "channels": audio.channels,
+                            "sample_rate": audio.sample_rate,
+                            "duration": duration
+                        }
+                        send_frame(sock, MSG_JOB, *pack_job(header, audio.pcm))
+                    result = self._await_result(sock)
+                except (OSError, ValueError, struct.error) as e:
+                    error = "Heartbeat timeout" if isinstance(e, socket.timeout) else str(e)
+                    self._requeue(job, node, error)
+                    self._fail(node, error)
+                    return
+
+                if not result.get("success"):
+                    self._requeue(job, node, result.get("error"))
+                    continue
+                self._finish(job, node, result, time.perf_counter() - start, duration)
+
+    def _await_result(self, sock):
+        """Read frames until the result; heartbeats keep the read timeout from expiring."""
+        while True:
+            kind, payload = recv_frame(sock)
+            if kind == MSG_RESULT:
+                return json.loads(payload.decode('utf-8'))
+            if kind == MSG_ERROR:
+                raise ConnectionError(json.loads(payload.decode('utf-8')).get("error"))
+
+    def _serve_local(self):
+        while True:
+            job = self._take(self.local)
+            if job is None:
+                return
+            start = time.perf_counter()
+            audio = None
+            if "open_error" not in job:
+                try:
+                    audio = job["open"]()
+                except Exception as e:
+                    job["open_error"] = e
+            duration = audio.duration if audio is not None else 0.0
+            try:
+                result = self.local_decode(job, audio)
+            except Exception as e:
+                result = {
+                    "success": False,
+                    "error": f"Error processing audio file: {str(e)}",
+                    "text": "",
+                    "language": job["language"]
+                }
+            finally:
+                if audio is not None:
+                    audio.close()
+            self._finish(job, self.local, result, time.perf_counter() - start, duration)
+
+
+def probe_node(host, port, timeout=DEFAULT_CONNECT_TIMEOUT):
+    """Handshake with a worker and return its hello with the round trip time."""
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            send_json(sock, MSG_HELLO, {"version": PROTOCOL_VERSION})
+            kind, payload = recv_frame(sock)
+            hello = json.loads(payload.decode('utf-8')) if kind == MSG_HELLO else {}
+        hello.update({"node": f"{host}:{port}", "reachable": True,
+                      "rtt_s": round(time.perf_counter() - start, 4)})
+        return hello
+    except (OSError, ValueError, struct.error) as e:
+        return {"node": f"{host}:{port}", "reachable": False, "error": str(e)}
+
+
+def main():
+    """Command line interface: show the state of the configured STT workers."""
+    parser = argparse.ArgumentParser(
+        description='Show the STT workers voice_to_text.py can dispatch to '
+                    '(start one with: voice_to_text.py --serve HOST:PORT)')
+    parser.add_argument('--workers',
+                        help='host:port list or file (default: SPEECH_STT_WORKERS)')
+    args = parser.parse_args()
+
+    nodes = parse_node_list(args.workers) if args.workers else configured_nodes()
+    workers = [probe_node(host, port) for host, port in nodes]
+    print(json.dumps({
+        "success": bool(workers) and all(w["reachable"] for w in workers),
+        "workers": workers
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
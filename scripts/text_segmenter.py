@@ -0,0 +1,165 @@
+import re
+
+
+# Marks that end a sentence once followed by whitespace
+SENTENCE_TERMINATORS = '.!?؟…'  # includes the Arabic question mark
+# Clause marks (Arabic comma and semicolon, ';') that split long sentences
+CLAUSE_BOUNDARIES = '،؛;'
+# Closing quotes and brackets that belong to the sentence they follow
+CLOSERS = '"\'”’)]}»'
+
+ABBREVIATIONS = {'mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'vs', 'approx', 'e.g', 'i.e', 'fig'}
+
+_LAST_WORD_PATTERN = re.compile(r'(\S+)$')
+_LIST_MARKER_PATTERN = re.compile(r'^\s*\d+$')
+
+
+class SentenceSegmenter:
+    """
+    Split text that arrives in fragments into sentences as soon as they close.
+
+    A terminator only closes a sentence once the next character is known to
+    be whitespace, so decimals ("3.5"), list markers ("1.") and common
+    abbreviations are not split. Clause marks split a sentence once it is at
+    least min_clause_chars long, and text without any boundary is cut at a
+    word break after max_chars, which bounds the wait for the first audio.
+    """
+
+    def __init__(self, min_clause_chars=40, max_chars=250):
+        self.min_clause_chars = min_clause_chars
+        self.max_chars = max_chars
+        self._buffer = ''
+        self._scan = 0
+
+    def feed(self, text):
+        """
+        Add a fragment of text.
+        :return: List of sentences completed by this fragment
+        """
+        self._buffer += text
+        sentences = []
+        while True:
+            end = self._next_boundary()
+            if end is None:
+                break
+            self._emit(end, sentences)
+
+        if len(self._buffer) > self.max_chars:
+            cut = self._buffer.rfind(' ', 0, self.max_chars)
+            self._emit(cut + 1 if cut > 0 else self.max_chars, sentences)
+        return sentences
+
+    def flush(self):
+        """
+        Return whatever text is left once the input has ended.
+        :return: List with the final sentence, or an empty list
+        """
+        sentences = []
+        self._emit(len(self._buffer), sentences)
+        return sentences
+
+    def _emit(self, end, sentences):
+        sentence = ' '.join(self._buffer[:end].split())
+        self._buffer = self._buffer[end:]
+        self._scan = 0
+        if sentence:
+            sentences.append(sentence)
+
+    def _next_boundary(self):
+        """Return the end offset of the first complete sentence, or None."""
+        buffer = self._buffer
+        i = self._scan
+        while i < len(buffer):
+            ch = buffer[i]
+            if ch == '\n':
+                if buffer[:i].strip():
+                    return i + 1
+            elif ch in SENTENCE_TERMINATORS or ch in CLAUSE_BOUNDARIES:
+                end = i + 1
+                while end < len(buffer) and (buffer[end] in SENTENCE_TERMINATORS
+                                             or buffer[end] in CLOSERS):
+                    end += 1
+                if end == len(buffer):
+                    # Can't tell yet whether this closes the sentence
+                    self._scan = i
+                    return None
+                if buffer[end].isspace() and self._is_boundary(i):
+                    return end
+                i = end
+                continue
+            i += 1
+        self._scan = i
+        return None
+
+    def _is_boundary(self, i):
+        ch = self._buffer[i]
+        before = self._buffer[:i]
+        if ch in CLAUSE_BOUNDARIES:
+            return len(before.strip()) >= self.min_clause_chars
+        if ch == '.':
+            if _LIST_MARKER_PATTERN.match(before):
+                return False
+            match = _LAST_WORD_PATTERN.search(before)
+            if match:
+                word = match.group(1).lstrip('(["\'').lower()
+                if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                    return False
+        return True
+
+
+# Arabic script blocks: Arabic, Supplement, Extended-A and presentation forms
+_ARABIC_CHARS = '\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF'
+_SCRIPT_PATTERN = re.compile(rf'([{_ARABIC_CHARS}]+)|([A-Za-z\u00C0-\u024F]+)')
+_TOKEN_PATTERN = re.compile(r'\S+|\s+')
+
+
+def _token_scripts(token):
+    """Split a whitespace-free token into (script, text) pieces; digits and
+    symbols join the letters they are attached to ("P0301", "10W-40")."""
+    pieces = []
+    last = 0
+    for match in _SCRIPT_PATTERN.finditer(token):
+        script = 'arabic' if match.group(1) else 'latin'
+        if pieces and pieces[-1][0] == script:
+            pieces[-1][1] += token[last:match.end()]
+        elif pieces:
+            pieces[-1][1] += token[last:match.start()]
+            pieces.append([script, token[match.start():match.end()]])
+        else:
+            pieces.append([script, token[:match.end()]])
+        last = match.end()
+    if not pieces:
+        return [[None, token]]
+    pieces[-1][1] += token[last:]
+    return pieces
+
+
+def script_runs(text, language='en'):
+    """
+    Split text into runs of one script, each tagged with the language whose
+    voice should read it. Arabic script is read as 'ar'; Latin script as
+    the request language, or English when the request language is Arabic.
+    Whitespace, digits and punctuation stay with the neighbouring run.
+    :return: List of (language, text) in reading order
+    """
+    latin_language = 'en' if language == 'ar' else language
+    languages = {'arabic': 'ar', 'latin': latin_language}
+
+    runs = []
+    pending = ''  # neutral text seen before the first run started
+    for token in _TOKEN_PATTERN.findall(text):
+        for script, piece in ([[None, token]] if token.isspace() else _token_scripts(token)):
+            run_language = languages.get(script)
+            if run_language is None or (runs and runs[-1][0] == run_language):
+                if runs:
+                    runs[-1][1] += piece
+                else:
+                    pending += piece
+            else:
+                runs.append([run_language, pending + piece])
+                pending = ''
+
+    if not runs:
+        return [(language, text)] if text.strip() else []
+    return [(run_language, ' '.join(run.split())) for run_language, run in runs
+            if run.strip()]
@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+from piper_tts import PiperTTS
+from espeak_tts import ESpeakTTS
+from speech_io import read_text_source
+from resource_profile import add_resource_arguments, apply_profile
+from speech_trace import SpeechTrace
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+DEFAULT_STATE_FILE = os.path.join(tempfile.gettempdir(), 'tts_router_state.json')
+
+# Latency target (seconds) urgent requests must meet
+DEFAULT_URGENT_TARGET = 0.5
+# Latency budget (seconds) above which normal requests give up quality for speed
+DEFAULT_NORMAL_BUDGET = 8.0
+# Seconds an engine is skipped after repeated failures
+FAILURE_COOLDOWN = 60.0
+MAX_CONSECUTIVE_FAILURES = 3
+# In-flight counts older than this are assumed to be left by crashed processes
+IN_FLIGHT_STALE_AFTER = 300.0
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.3
+
+
+class TTSEngine:
+    """Common interface over the TTS engines."""
+
+    name = "base"
+    # Higher is better; used to order engines that both meet the budget
+    quality = 0
+    # Priors used until the engine has been measured (seconds, seconds/char)
+    default_base_latency = 0.1
+    default_per_char_latency = 0.001
+
+    def is_available(self):
+        raise NotImplementedError
+
+    def supports_language(self, language):
+        raise NotImplementedError
+
+    def synthesize(self, text, language="en", output_file=None, play=False, rate=1.0, **options):
+        """
+        Synthesize text.
+        :param rate: Relative speech rate (1.0 = engine default)
+        :return: Result dictionary in the engine's own format
+        """
+        raise NotImplementedError
+
+
+class PiperEngine(TTSEngine):
+    name = "piper"
+    quality = 2
+    default_base_latency = 1.0
+    default_per_char_latency = 0.02
+
+    def __init__(self, script_dir=None):
+        self.tts = PiperTTS(script_dir)
+
+    def is_available(self):
+        return self.tts.piper_available and bool(self.tts.available_voices)
+
+    def supports_language(self, language):
+        # PiperTTS silently falls back to English; only count real voices
+        return language in self.tts.available_voices
+
+    def synthesize(self, text, language="en", output_file=None, play=False, rate=1.0, **options):
+        length_scale = 1.0 / rate if rate else 1.0
+        noise_scale = options.get('noise_scale', 0.667)
+        speaker = options.get('speaker')
+        if play:
+            return self.tts.text_to_speech_play(
+                text, language, rate, noise_scale, length_scale, speaker)
+        return self.tts.text_to_speech_file(
+            text, language, output_file, rate, noise_scale, length_scale, speaker)
+
+
+class ESpeakEngine(TTSEngine):
+    name = "espeak"
+    quality = 1
+    default_base_latency = 0.05
+    default_per_char_latency = 0.0005
+
+    def __init__(self):
+        self.tts = ESpeakTTS()
+
+    def is_available(self):
+        return self.tts.espeak_available
+
+    def supports_language(self, language):
+        return language in self.tts.supported_languages
+
+    def synthesize(self, text, language="en", output_file=None, play=False, rate=1.0, **options):
+        speed = int(max(80, min(450, 175 * rate)))
+        pitch = options.get('pitch', 50)
+        amplitude = options.get('amplitude', 100)
+        if play:
+            return self.tts.text_to_speech_play(text, language, speed, pitch, amplitude)
+        return self.tts.text_to_speech_file(
+            text, language, output_file, speed, pitch, amplitude)
+
+
+class LatencyStats:
+    """
+    Recent latency model per engine, persisted between invocations.
+    Latency is modelled as base + per_char * len(text), both tracked as
+    moving averages, scaled by the number of jobs already in flight.
+    """
+
+    def __init__(self, state_file=DEFAULT_STATE_FILE):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, state):
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            print(f"Warning: Failed to save router state: {e}", file=sys.stderr)
+
+    def _update(self, fn):
+        """Apply fn to the persisted state under a cross-process lock."""
+        with self._lock:
+            lock_file = None
+            try:
+                if fcntl is not None:
+                    lock_file = open(f"{self.state_file}.lock", 'w')
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                state = self._read()
+                fn(state)
+                self._write(state)
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def snapshot(self, engine):
+        return self._read().get(engine.name, {})
+
+    def predict(self, engine, text_length):
+        """Predict the latency (seconds) of synthesizing text_length characters."""
+        entry = self.snapshot(engine)
+        base = entry.get('base', engine.default_base_latency)
+        per_char = entry.get('per_char', engine.default_per_char_latency)
+        in_flight = max(0, entry.get('in_flight', 0))
+        if time.time() - entry.get('updated', 0) > IN_FLIGHT_STALE_AFTER:
+            in_flight = 0
+        return (base + per_char * text_length) * (1 + in_flight)
+
+    def is_cooling_down(self, engine):
+        entry = self.snapshot(engine)
+        if entry.get('failures', 0) < MAX_CONSECUTIVE_FAILURES:
+            return False
+        return time.time() - entry.get('last_failure', 0) < FAILURE_COOLDOWN
+
+    def begin(self, engine):
+        def fn(state):
+            entry = state.setdefault(engine.name, {})
+            entry['in_flight'] = entry.get('in_flight', 0) + 1
+            entry['updated'] = time.time()
+        self._update(fn)
+
+    def end(self, engine, text_length, elapsed, success):
+        def fn(state):
+            entry = state.setdefault(engine.name, {})
+            entry['in_flight'] = max(0, entry.get('in_flight', 0) - 1)
+            entry['updated'] = time.time()
+            if not success:
+                entry['failures'] = entry.get('failures', 0) + 1
+                entry['last_failure'] = time.time()
+                return
+            entry['failures'] = 0
+
+            # Attribute the time to the fixed and per-character parts using
+            # the current estimate of the fixed cost
+            base = entry.get('base', engine.default_base_latency)
+            per_char = entry.get('per_char', engine.default_per_char_latency)
+            if text_length > 0:
+                sample_per_char = max(0.0, elapsed - base) / text_length
+                per_char += EWMA_ALPHA * (sample_per_char - per_char)
+            sample_base = max(0.0, elapsed - per_char * text_length)
+            base += EWMA_ALPHA * (sample_base - base)
+
+            entry['base'] = base
+            entry['per_char'] = per_char
+            entry['last_latency'] = elapsed
+            entry['samples'] = entry.get('samples', 0) + 1
+        self._update(fn)
+
+
+class TTSRouter:
+    """Pick a TTS engine per request and fall back when one is missing or failing."""
+
+    def __init__(self, engines=None, stats=None,
+                 urgent_target=DEFAULT_URGENT_TARGET, normal_budget=DEFAULT_NORMAL_BUDGET):
+        if engines is None:
+            engines = [PiperEngine(), ESpeakEngine()]
+        self.engines = engines
+        self.stats = stats or LatencyStats()
+        self.urgent_target = urgent_target
+        self.normal_budget = normal_budget
+
+    def plan(self, text, language="en", urgent=False, latency_target=None):
+        """
+        Order the usable engines for a request.
+        :return: List of (engine, predicted_latency) in the order to try
+        """
+        if latency_target is None:
+            latency_target = self.urgent_target if urgent else self.normal_budget
+
+        candidates = []
+        for engine in self.engines:
+            if not engine.is_available() or not engine.supports_language(language):
+                continue
+            if self.stats.is_cooling_down(engine):
+                continue
+            candidates.append((engine, self.stats.predict(engine, len(text))))
+
+        # Engines that meet the target first, best quality among those, then
+        # the remaining engines from fastest to slowest. Urgent requests only
+        # trade quality for speed when both engines meet the target.
+        def sort_key(item):
+            engine, predicted = item
+            meets_target = predicted <= latency_target
+            if meets_target:
+                return (0, -engine.quality, predicted)
+            return (1, predicted, -engine.quality)
+
+        candidates.sort(key=sort_key)
+        return candidates
+
+    def synthesize(self, text, language="en", output_file=None, play=False,
+                   urgent=False, latency_target=None, rate=1.0, **options):
+        """
+        Synthesize text with the best engine for the request.
+        :return: Result dictionary with routing metadata added
+        """
+        if not text.strip():
+            return {
+                "success": False,
+                "error": "Empty text provided"
+            }
+
+        plan = self.plan(text, language, urgent, latency_target)
+        if not plan:
+            return {
+                "success": False,
+                "error": f"No TTS engine available for language '{language}'",
+                "engines": [engine.name for engine in self.engines]
+            }
+
+        attempts = []
+        for engine, predicted in plan:
+            self.stats.begin(engine)
+            start = time.perf_counter()
+            success = False
+            try:
+                result = engine.synthesize(
+                    text, language, output_file, play, rate, **options)
+                success = bool(result.get('success'))
+            except Exception as e:
+                result = {
+                    "success": False,
+                    "error": f"{engine.name} failed: {str(e)}"
+                }
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats.end(engine, len(text), elapsed, success)
+
+            attempts.append({
+                "engine": engine.name,
+                "predicted_latency": round(predicted, 4),
+                "latency": round(elapsed, 4),
+                "success": success,
+                "error": None if success else result.get('error')
+            })
+
+            if success:
+                result["routing"] = {
+                    "engine": engine.name,
+                    "tier": result.get("tier"),
+                    "urgent": urgent,
+                    "attempts": attempts
+                }
+                return result
+
+        return {
+            "success": False,
+            "error": "All TTS engines failed",
+            "routing": {
+                "urgent": urgent,
+                "attempts": attempts
+            }
+        }
+
+
+def main():
+    """Command line interface, argument-compatible with piper_tts.py."""
+    parser = argparse.ArgumentParser(
+        description='Route TTS requests between Piper and eSpeak-NG')
+
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('text', nargs='?', help='Text to convert to speech')
+    group.add_argument('--file', '-f',
+                       help="File containing text to convert, '-' for stdin, 'fd:N' or 'shm:NAME'")
+
+    parser.add_argument('--language', '-l', default='en',
+                        help='Language code (en, ar, es, fr, etc.)')
+    parser.add_argument('--output', '-o', help='Output WAV file path')
+    parser.add_argument('--length-scale', type=float, default=1.0,
+                        help='Length scale for speech rate (default 1.0)')
+    parser.add_argument('--noise-scale', type=float, default=0.667,
+                        help='Noise scale for Piper voice variation (default 0.667)')
+    parser.add_argument('--speaker',
+                        help='Speaker name or ID for multi-speaker Piper voices')
+    parser.add_argument('--play', action='store_true',
+                        help='Play directly instead of saving to file')
+    parser.add_argument('--urgent', action='store_true',
+                        help='Route for latency (e.g. OBD alerts)')
+    parser.add_argument('--latency-target', type=float,
+                        help='Latency target in seconds (overrides the urgent/normal default)')
+    parser.add_argument('--engine', choices=['piper', 'espeak'],
+                        help='Force a specific engine')
+    parser.add_argument('--format', choices=['json', 'text'], default='json',
+                        help='Output format')
+    add_resource_arguments(parser)
+
+    args = parser.parse_args()
+    profile = apply_profile(args.resource_profile)
+
+    if args.file:
+        try:
+            text = read_text_source(args.file).strip()
+        except Exception as e:
+            print(json.dumps({
+                "success": False,
+                "error": f"Failed to read file {args.file}: {str(e)}"
+            }))
+            return 1
+    else:
+        text = args.text
+
+    if not text:
+        print(json.dumps({
+            "success": False,
+            "error": "No text provided"
+        }))
+        return 1
+
+    router = TTSRouter()
+    if args.engine:
+        router.engines = [e for e in router.engines if e.name == args.engine]
+
+    rate = 1.0 / args.length_scale if args.length_scale else 1.0
+    trace = SpeechTrace('tts', 'tts_router', {
+        "language": args.language,
+        "engine": args.engine,
+        "urgent": args.urgent,
+        "latency_target": args.latency_target,
+        "rate": rate,
+        "noise_scale": args.noise_scale,
+        "speaker": args.speaker,
+        "play": args.play
+    })
+    try:
+        # Urgent alerts never queue behind other speech jobs
+        with profile.job(wait=not args.urgent) as usage:
+            result = router.synthesize(
+                text, args.language, args.output, args.play,
+                urgent=args.urgent, latency_target=args.latency_target,
+                rate=rate, noise_scale=args.noise_scale, speaker=args.speaker)
+        result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e)}
+    trace.record(result, text=text)
+
+    if args.format == 'json':
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        if result['success']:
+            print(f"Engine: {result['routing']['engine']}")
+        else:
+            print(f"Error: {result['error']}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+# Function for NestJS integration
+def synthesize_speech(text, language="en", output_file=None, play_directly=False,
+                      urgent=False, **kwargs):
+    """
+    Function to be called by NestJS backend.
+    :param text: Text to synthesize
+    :param language: Language code
+    :param output_file: Output file path (optional)
+    :param play_directly: Play directly without saving
+    :param urgent: Route for latency rather than quality
+    :return: Result dictionary
+    """
+    trace = SpeechTrace('tts', 'synthesize_speech', dict(
+        {"language": language, "urgent": urgent, "play": play_directly},
+        **{k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool))}))
+    result = TTSRouter().synthesize(
+        text, language, output_file, play_directly, urgent=urgent, **kwargs)
+    trace.record(result, text=text)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,88 @@
 import os
 import sys
 import json
-import wave
+import math
+import time
 import argparse
-from vosk import Model, KaldiRecognizer
+import threading
+from array import array
+from collections import deque
+
+from resource_profile import prime_thread_environment
+# Thread limits have to be in the environment before vosk loads its BLAS
+prime_thread_environment()
+from vosk import Model, KaldiRecognizer  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # Import the required libraries for Arabic text representation
 import arabic_reshaper
 from bidi.algorithm import get_display
 
+from speech_metrics import SpeechMetrics, add_instrumentation_arguments, run_with_profile
+from speech_io import (InputBuffer, PCMStream, describe_source, open_audio_source,
+                       open_audio_stream, pcm_buffer)
+from audio_spool import atomic_output, get_spool
+from quality_tiers import (STT_TIERS, DEFAULT_REDECODE_CONFIDENCE, load_tier_config,
+                           stt_model_names, stt_policy, track_job)
+from resource_profile import active_profile, add_resource_arguments, apply_profile
+from stt_cluster import STTCluster, STTWorkerServer, configured_nodes, parse_node_list
+from intent_matcher import INTENT_ALTERNATIVES, INTENT_MAX_DURATION_S, get_matcher
+from speech_trace import SpeechTrace
+
+
+def _vosk_model_dirs():
+    """Directories searched for VOSK models, in order of preference."""
+    return [
+        # Current directory
+        os.getcwd(),
+        # Script directory
+        os.path.dirname(os.path.abspath(__file__)),
+        # User home directory
+        os.path.expanduser("~/vosk-models"),
+        # System-wide installation (Linux)
+        "/usr/share/vosk-models",
+        "/usr/local/share/vosk-models",
+        # Windows common paths
+        os.path.join(os.environ.get('APPDATA', ''), 'vosk-models'),
+        # macOS common paths
+        os.path.expanduser("~/Library/Application Support/vosk-models"),
+    ]
+
 
-def find_vosk_model_path(language="en"):
+def installed_vosk_models(language="en"):
+    """
+    Find the installed VOSK model for each quality tier of a language.
+    :param language: 'en' for English, 'ar' for Arabic
+    :return: Dictionary of tier ('small', 'large') -> model directory
+    """
+    installed = {}
+    for tier, names in stt_model_names(language, load_tier_config()).items():
+        for name in names:
+            for base in _vosk_model_dirs():
+                path = os.path.join(base, name)
+                if os.path.isdir(path):
+                    installed[tier] = path
+                    break
+            if tier in installed:
+                break
+    return installed
+
+
+def find_vosk_model_path(language="en", tier=None):
     """
     Find the VOSK model path for the given language.
     :param language: 'en' for English, 'ar' for Arabic
+    :param tier: Model tier ('small' or 'large'); defaults to the configured
+                 default tier, or any installed tier
     :return: Path to the VOSK model directory
     """
     models = {
@@ -25,47 +94,42 @@ def find_vosk_model_path(language="en"):
     if not model_name:
         raise ValueError(f"Unsupported language: {language}")
 
-    # Common model paths on different systems
-    possible_paths = [
-        # Current directory
-        os.path.join(os.getcwd(), model_name),
-        # Script directory
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), model_name),
-        # User home directory
-        os.path.expanduser(f"~/vosk-models/{model_name}"),
-        # System-wide installation (Linux)
-        f"/usr/share/vosk-models/{model_name}",
-        f"/usr/local/share/vosk-models/{model_name}",
-        # Windows common paths
-        os.path.join(os.environ.get('APPDATA', ''), 'vosk-models', model_name),
-        # macOS common paths
-        os.path.expanduser(
-            f"~/Library/Application Support/vosk-models/{model_name}"),
-    ]
-
-    for path in possible_paths:
-        if os.path.exists(path) and os.path.isdir(path):
-            return path
+    installed = installed_vosk_models(language)
+    if tier is None:
+        tier = stt_policy().default_tier
+        if tier not in installed and installed:
+            tier = next(iter(installed))
+    if tier in installed:
+        return installed[tier]
 
     # If no model found, return the model name for VOSK to try its default resolution
     return model_name
 
 
-def load_vosk_model(language="en"):
+# Models stay loaded for the life of the process (STT workers decode many jobs)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_vosk_model(language="en", tier=None):
     """
     Load the VOSK model based on the selected language.
     :param language: 'en' for English, 'ar' for Arabic
+    :param tier: Model tier ('small' or 'large'), see find_vosk_model_path
     :return: VOSK model object
     """
     try:
-        model_path = find_vosk_model_path(language)
+        model_path = find_vosk_model_path(language, tier)
 
-        # Try to load the model
-        if os.path.exists(model_path) and os.path.isdir(model_path):
-            return Model(model_path)
-        else:
-            # Fallback to VOSK's default model resolution
-            return Model(lang=model_path)
+        with _models_lock:
+            if model_path not in _models:
+                # Try to load the model
+                if os.path.exists(model_path) and os.path.isdir(model_path):
+                    _models[model_path] = Model(model_path)
+                else:
+                    # Fallback to VOSK's default model resolution
+                    _models[model_path] = Model(lang=model_path)
+            return _models[model_path]
 
     except Exception as e:
         raise Exception(
@@ -88,46 +152,179 @@ def check_ffmpeg_availability():
         return False
 
 
-def process_audio_file(file_path, language="en"):
+def _posteriors(alternatives):
+    """Turn the scores of a segment's n-best alternatives into posteriors, best first."""
+    if not alternatives:
+        return []
+    top = max(a.get("confidence", 0.0) for a in alternatives)
+    weights = [math.exp(a.get("confidence", 0.0) - top) for a in alternatives]
+    total = sum(weights)
+    ranked = sorted(zip(alternatives, weights), key=lambda aw: aw[1], reverse=True)
+    return [{"text": a.get("text", ""), "posterior": w / total} for a, w in ranked]
+
+
+def _utterance_hypotheses(segments, limit):
+    """
+    Combine per-segment n-best lists into n-best hypotheses of the whole
+    utterance: the best path, plus paths that swap one segment for one of
+    its alternatives.
+    """
+    if not segments:
+        return []
+    best = [segment[0] for segment in segments]
+    best_posterior = math.prod(alt["posterior"] for alt in best)
+    scores = {" ".join(alt["text"] for alt in best): best_posterior}
+    for index, segment in enumerate(segments):
+        for alt in segment[1:]:
+            texts = [b["text"] for b in best]
+            texts[index] = alt["text"]
+            text = " ".join(t for t in texts if t)
+            posterior = best_posterior / best[index]["posterior"] * alt["posterior"]
+            scores[text] = scores.get(text, 0.0) + posterior
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"text": text, "posterior": round(posterior, 4)} for text, posterior in ranked]
+
+
+def decode_audio(model, audio):
+    """
+    Decode an AudioBuffer with a fresh recognizer.
+    :return: (text, mean word confidence or None when no words were recognized)
+    """
+    recognizer = KaldiRecognizer(model, 16000)
+    recognizer.SetWords(True)
+    texts = []
+    confidences = []
+
+    def collect(result):
+        text = result.get("text", "")
+        if text:
+            texts.append(text)
+        confidences.extend(w["conf"] for w in result.get("result", []) if "conf" in w)
+
+    # Process audio in chunks of 4000 frames
+    for chunk in audio.chunks(4000):
+        if recognizer.AcceptWaveform(bytes(chunk)):
+            collect(json.loads(recognizer.Result()))
+
+    # Get final result
+    collect(json.loads(recognizer.FinalResult()))
+
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return " ".join(texts).strip(), confidence
+
+
+def decode_alternatives(model, audio, alternatives):
+    """
+    Decode the n-best hypotheses of an AudioBuffer for intent matching.
+    Vosk reports no word confidences with alternatives, so this is a pass of
+    its own after decode_audio, whose confidence stays the word confidence.
+    :return: List of {"text", "posterior"} hypotheses, best first
+    """
+    recognizer = KaldiRecognizer(model, 16000)
+    recognizer.SetMaxAlternatives(alternatives)
+    segments = []
+
+    def collect(result):
+        segment = _posteriors(result.get("alternatives", []))
+        if segment and segment[0]["text"]:
+            segments.append(segment)
+
+    for chunk in audio.chunks(4000):
+        if recognizer.AcceptWaveform(bytes(chunk)):
+            collect(json.loads(recognizer.Result()))
+    collect(json.loads(recognizer.FinalResult()))
+    return _utterance_hypotheses(segments, alternatives)
+
+
+def process_audio_file(file_path, language="en", metrics=None, audio=None,
+                       tier=None, redecode=True, intents=False,
+                       alternatives=INTENT_ALTERNATIVES, long_lived=False):
     """
     Process audio file and extract text using VOSK.
-    :param file_path: Path to the audio file (WAV format)
+    :param file_path: Path to the audio file (WAV format), or '-', 'fd:N' or
+                      'shm:NAME' to read WAV or raw 16 kHz PCM from stdin, a
+                      file descriptor or a shared-memory segment
     :param language: 'en' for English, 'ar' for Arabic
+    :param metrics: Optional SpeechMetrics collecting stage timings
+    :param audio: Optional already opened AudioBuffer; file_path is then
+                  only reported in the result
+    :param tier: Force a model tier ('small' or 'large'); chosen from the
+                 current load when omitted
+    :param redecode: Re-decode low-confidence results with a larger model
+                     when the load allows it
+    :param intents: Match the transcript and, for recordings up to
+                    INTENT_MAX_DURATION_S, its n-best alternatives against
+                    the voice command table (intent_matcher.py)
+    :param alternatives: n-best hypotheses decoded for intent matching
+    :param long_lived: Called from a process that keeps models loaded; only
+                       then may an idle load pick or re-decode with a tier
+                       above the default (see stt_policy)
     :return: Dictionary with transcribed text and language
     """
+    if metrics is None:
+        metrics = SpeechMetrics('voice_to_text')
+
     try:
+        # Pick the model tier for the current load
+        policy = stt_policy(forced=tier, long_lived=long_lived)
+        installed = installed_vosk_models(language)
+        if installed:
+            selection = policy.choose(installed)
+        else:
+            selection = {"tier": None, "reason": "untiered"}
+
         # Load VOSK model
-        model = load_vosk_model(language)
-        recognizer = KaldiRecognizer(model, 16000)
+        with metrics.stage('model_load'):
+            model = load_vosk_model(language, selection["tier"])
+
+        # Map the audio in place instead of reading it into memory
+        if audio is None:
+            audio = open_audio_source(file_path)
 
-        # Open and read the audio file
-        with wave.open(file_path, 'rb') as wf:
+        with audio:
+            duration = audio.duration
             # Check if the audio file has the correct format
-            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() != 16000:
+            if audio.channels != 1 or audio.sample_width != 2 or audio.sample_rate != 16000:
                 print(
-                    f"Warning: Audio file should be mono, 16-bit, 16kHz. Current: {wf.getnchannels()} channels, {wf.getsampwidth()*8}-bit, {wf.getframerate()}Hz")
-
-            # Process audio in chunks
-            full_text = ""
-            while True:
-                data = wf.readframes(4000)  # Read 4000 frames at a time
-                if len(data) == 0:
-                    break
+                    f"Warning: Audio file should be mono, 16-bit, 16kHz. Current: {audio.channels} channels, {audio.sample_width*8}-bit, {audio.sample_rate}Hz",
+                    file=sys.stderr)
 
-                if recognizer.AcceptWaveform(data):
-                    result = json.loads(recognizer.Result())
-                    text = result.get("text", "")
-                    if text:
-                        full_text += text + " "
+            with metrics.stage('decode'), track_job('stt'):
+                full_text, confidence = decode_audio(model, audio)
 
-            # Get final result
-            final_result = json.loads(recognizer.FinalResult())
-            final_text = final_result.get("text", "")
-            if final_text:
-                full_text += final_text
+            served_tier = selection["tier"]
+            redecoded = None
+            larger = [t for t in selection.get("available", [])
+                      if served_tier and STT_TIERS.index(t) > STT_TIERS.index(served_tier)]
+            threshold = float(load_tier_config().get('stt', {}).get(
+                'redecode_confidence', DEFAULT_REDECODE_CONFIDENCE))
+            if (redecode and larger and selection["reason"] != "forced"
+                    and confidence is not None and confidence < threshold
+                    and policy.allows_upgrade()):
+                retry_model = load_vosk_model(language, larger[-1])
+                with metrics.stage('redecode'), track_job('stt'):
+                    retry_text, retry_confidence = decode_audio(retry_model, audio)
+                redecoded = {
+                    "from_tier": served_tier,
+                    "from_confidence": round(confidence, 3),
+                    "to_tier": larger[-1],
+                    "to_confidence": round(retry_confidence, 3) if retry_confidence is not None else None
+                }
+                if retry_confidence is not None and retry_confidence >= confidence:
+                    full_text, confidence, served_tier = retry_text, retry_confidence, larger[-1]
+                    model = retry_model
 
-        # Clean up the text
-        full_text = full_text.strip()
+            intent = None
+            if intents and full_text:
+                hypotheses = []
+                if alternatives and duration <= INTENT_MAX_DURATION_S:
+                    with metrics.stage('alternatives'), track_job('stt'):
+                        hypotheses = decode_alternatives(model, audio, alternatives)
+                with metrics.stage('intent'):
+                    # n-best posteriors already carry the recognizer's confidence
+                    intent = get_matcher(language).match(
+                        hypotheses or [{"text": full_text, "posterior": 1.0}],
+                        None if hypotheses else confidence)
 
         # Process Arabic text for proper display if needed
         display_text = full_text
@@ -135,42 +332,120 @@ def process_audio_file(file_path, language="en"):
             reshaped_text = arabic_reshaper.reshape(full_text)
             display_text = get_display(reshaped_text)
 
-        return {
+        return metrics.attach({
             "success": True,
             "text": full_text,
             "display_text": display_text,
             "language": language,
-            "file_path": file_path
-        }
+            "file_path": file_path,
+            "duration_s": round(duration, 3),
+            "tier": served_tier,
+            "confidence": round(confidence, 3) if confidence is not None else None,
+            "tier_selection": selection,
+            "redecoded": redecoded,
+            "intent": intent
+        })
 
     except FileNotFoundError:
-        return {
+        return metrics.attach({
             "success": False,
             "error": f"Audio file not found: {file_path}",
             "text": "",
             "language": language
-        }
+        })
     except Exception as e:
-        return {
+        return metrics.attach({
             "success": False,
             "error": f"Error processing audio file: {str(e)}",
             "text": "",
             "language": language
-        }
+        })
+
+
+def convert_audio_to_pcm(source, metrics=None):
+    """
+    Convert audio to 16 kHz mono 16-bit PCM in memory using ffmpeg, without
+    writing an intermediate WAV file.
+    :param source: Input path, or '-', 'fd:N' or 'shm:NAME'
+    :param metrics: Optional SpeechMetrics collecting stage timings
+    :return: AudioBuffer with the converted PCM
+    """
+    import subprocess
+
+    if metrics is None:
+        metrics = SpeechMetrics('voice_to_text')
+
+    with metrics.stage('probe'):
+        ffmpeg_available = check_ffmpeg_availability()
+    if not ffmpeg_available:
+        raise Exception(
+            "ffmpeg not found. Please install ffmpeg or provide a WAV file.")
 
+    kind, value = describe_source(source)
+    stdin = None
+    input_data = None
+    input_spec = source
+    shm_source = None
+    if kind == 'stdin':
+        # ffmpeg reads our stdin directly
+        input_spec = 'pipe:0'
+    elif kind == 'fd':
+        input_spec = 'pipe:0'
+        stdin = value
+    elif kind == 'shm':
+        input_spec = 'pipe:0'
+        shm_source = InputBuffer(source)
+        input_data = shm_source.view
+
+    threads = active_profile().ffmpeg_arguments()
+    cmd = [
+        'ffmpeg', *threads, '-i', input_spec,
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ar', '16000',
+        '-ac', '1',
+        *threads,
+        'pipe:1'
+    ]
 
-def convert_audio_to_wav(input_file, output_file=None):
+    try:
+        with metrics.stage('convert'):
+            if input_data is not None:
+                result = subprocess.run(cmd, input=input_data, capture_output=True)
+            else:
+                result = subprocess.run(cmd, stdin=stdin, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+    finally:
+        if shm_source is not None:
+            shm_source.close()
+        if kind == 'fd':
+            os.close(value)
+
+    if result.returncode != 0:
+        error_msg = result.stderr.decode('utf-8', 'replace') if result.stderr else ''
+        raise Exception(f"Failed to convert audio file: {error_msg}")
+
+    return pcm_buffer(result.stdout)
+
+
+def convert_audio_to_wav(input_file, output_file=None, metrics=None):
     """
     Convert audio file to WAV format using ffmpeg (if available).
     :param input_file: Path to input audio file
     :param output_file: Path to output WAV file (optional)
+    :param metrics: Optional SpeechMetrics collecting stage timings
     :return: Path to converted WAV file
     """
+    if metrics is None:
+        metrics = SpeechMetrics('voice_to_text')
+
     try:
         import subprocess
 
         # Check if ffmpeg is available
-        if not check_ffmpeg_availability():
+        with metrics.stage('probe'):
+            ffmpeg_available = check_ffmpeg_availability()
+        if not ffmpeg_available:
             raise Exception(
                 "ffmpeg not found. Please install ffmpeg:\n"
                 "  Ubuntu/Debian: sudo apt-get install ffmpeg\n"
@@ -179,23 +454,28 @@ def convert_audio_to_wav(input_file, output_file=None):
                 "  Or provide a WAV file directly."
             )
 
+        # Unnamed conversions go to the managed spool instead of next to the input
         if output_file is None:
-            base_name = os.path.splitext(input_file)[0]
-            output_file = f"{base_name}_converted.wav"
-
-        # Use ffmpeg to convert to the required format
-        cmd = [
-            'ffmpeg', '-i', input_file,
-            '-acodec', 'pcm_s16le',
-            '-ar', '16000',
-            '-ac', '1',
-            '-y',  # Overwrite output file
-            output_file
-        ]
-
-        result = subprocess.run(
-            cmd, check=True, capture_output=True, text=True)
-        return output_file
+            output = get_spool().output('converted')
+        else:
+            output = atomic_output(output_file)
+
+        with output:
+            # Use ffmpeg to convert to the required format
+            threads = active_profile().ffmpeg_arguments()
+            cmd = [
+                'ffmpeg', *threads, '-i', input_file,
+                '-acodec', 'pcm_s16le',
+                '-ar', '16000',
+                '-ac', '1',
+                *threads,
+                '-y',  # Overwrite output file
+                output.temp_path
+            ]
+
+            with metrics.stage('convert'):
+                subprocess.run(cmd, check=True, capture_output=True, text=True)
+            return output.commit()
 
     except subprocess.CalledProcessError as e:
         error_msg = e.stderr if e.stderr else str(e)
@@ -205,6 +485,502 @@ def convert_audio_to_wav(input_file, output_file=None):
             "ffmpeg not found. Please install ffmpeg or provide a WAV file.")
 
 
+# Keyword listener: 20 ms frames of 16 kHz mono s16le PCM, read 100 ms at a time
+LISTEN_SAMPLE_RATE = 16000
+LISTEN_FRAME_SAMPLES = 320
+LISTEN_FRAME_BYTES = LISTEN_FRAME_SAMPLES * 2
+LISTEN_FRAME_SECONDS = LISTEN_FRAME_SAMPLES / float(LISTEN_SAMPLE_RATE)
+LISTEN_READ_FRAMES = 5
+
+DEFAULT_KEYWORDS = ["hey car"]
+
+
+def frame_energies(block):
+    """
+    RMS energy of each complete 20 ms frame in a block of s16le PCM.
+    Vectorized with NumPy when available.
+    """
+    usable = len(block) - len(block) % LISTEN_FRAME_BYTES
+    if usable == 0:
+        return []
+    if np is not None:
+        frames = np.frombuffer(block, dtype='<i2', count=usable // 2)
+        frames = frames.reshape(-1, LISTEN_FRAME_SAMPLES).astype(np.float32)
+        return np.sqrt(np.mean(frames * frames, axis=1)).tolist()
+
+    samples = array('h')
+    samples.frombytes(bytes(block[:usable]))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    energies = []
+    for start in range(0, len(samples), LISTEN_FRAME_SAMPLES):
+        frame = samples[start:start + LISTEN_FRAME_SAMPLES]
+        energies.append(math.sqrt(sum(s * s for s in frame) / LISTEN_FRAME_SAMPLES))
+    return energies
+
+
+class EnergyGate:
+    """
+    Cheap voice activity gate over frame energies.
+
+    The noise floor is tracked while idle; a segment starts after a few
+    frames above floor * start_ratio and ends after a run of quiet frames
+    or when it reaches max_frames. A short pre-roll is kept so onsets are
+    not clipped.
+    """
+
+    def __init__(self, max_frames, start_ratio=3.0, min_energy=300.0,
+                 start_frames=3, hangover_frames=20, preroll_frames=15):
+        self.max_frames = max_frames
+        self.start_ratio = start_ratio
+        self.min_energy = min_energy
+        self.start_frames = start_frames
+        self.hangover_frames = hangover_frames
+        self.preroll = deque(maxlen=preroll_frames)
+        self.noise_floor = min_energy / start_ratio
+        self.active = False
+        self._onset = 0
+        self._quiet = 0
+        self._segment = bytearray()
+        self._frames = 0
+
+    def feed(self, frame, energy):
+        """
+        Feed one frame.
+        :return: Completed segment as bytes, or None
+        """
+        threshold = max(self.min_energy, self.noise_floor * self.start_ratio)
+        loud = energy >= threshold
+
+        if not self.active:
+            if not loud:
+                self.noise_floor += 0.05 * (energy - self.noise_floor)
+            self.preroll.append(frame)
+            self._onset = self._onset + 1 if loud else 0
+            if self._onset >= self.start_frames:
+                self.active = True
+                self._segment = bytearray(b''.join(self.preroll))
+                self._frames = len(self.preroll)
+                self._quiet = 0
+                self.preroll.clear()
+            return None
+
+        self._segment.extend(frame)
+        self._frames += 1
+        self._quiet = 0 if loud else self._quiet + 1
+        if self._quiet >= self.hangover_frames or self._frames >= self.max_frames:
+            segment = bytes(self._segment)
+            self.active = False
+            self._onset = 0
+            self._segment = bytearray()
+            return segment
+        return None
+
+
+class KeywordListener:
+    """
+    Always-on wake phrase listener.
+
+    Idle audio only goes through the energy gate. Candidate segments are
+    checked by a recognizer restricted to the keyword grammar, and only
+    after a hit is the following utterance decoded with the full
+    open-vocabulary recognizer. Events are written as NDJSON.
+    """
+
+    def __init__(self, language="en", keywords=None, out=None,
+                 keyword_max_seconds=2.5, command_max_seconds=10.0,
+                 command_timeout=5.0, intents=False):
+        self.language = language
+        self.keywords = [k.lower().strip() for k in (keywords or DEFAULT_KEYWORDS)]
+        self.out = out or sys.stdout
+        self.keyword_max_frames = int(keyword_max_seconds / LISTEN_FRAME_SECONDS)
+        self.command_max_frames = int(command_max_seconds / LISTEN_FRAME_SECONDS)
+        self.command_timeout = command_timeout
+
+        self.model = load_vosk_model(language)
+        self._grammar = json.dumps(self.keywords + ["[unk]"])
+        self._full_recognizer = None
+        self.matcher = get_matcher(language) if intents else None
+
+        self.gate = EnergyGate(self.keyword_max_frames)
+        self.stats = {"frames": 0, "candidates": 0, "keyword_hits": 0, "commands": 0}
+        self._awaiting_command_since = None
+
+    def _emit(self, event, **fields):
+        fields["event"] = event
+        self.out.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+    def _stream_time(self):
+        return round(self.stats["frames"] * LISTEN_FRAME_SECONDS, 3)
+
+    def _spot(self, segment):
+        """
+        Run the grammar-restricted recognizer on a candidate segment.
+        :return: (keyword or None, audio following the keyword)
+        """
+        # A fresh recognizer per segment: Vosk word times count from the first
+        # audio a recognizer was fed, and the offset below is into this segment
+        spotter = KaldiRecognizer(self.model, LISTEN_SAMPLE_RATE, self._grammar)
+        spotter.SetWords(True)
+        spotter.AcceptWaveform(segment)
+        result = json.loads(spotter.FinalResult())
+        words = [w for w in result.get("result", []) if w.get("word") != "[unk]"]
+        spoken = [w["word"].lower() for w in words]
+
+        for keyword in self.keywords:
+            parts = keyword.split()
+            for i in range(len(spoken) - len(parts) + 1):
+                if spoken[i:i + len(parts)] == parts:
+                    end = words[i + len(parts) - 1].get("end", 0.0)
+                    offset = int(end * LISTEN_SAMPLE_RATE) * 2
+                    return keyword, segment[offset:]
+
+        # Models without word timings still report the text
+        text = result.get("text", "").lower()
+        for keyword in self.keywords:
+            if keyword in text:
+                return keyword, b''
+        return None, b''
+
+    def _transcribe(self, audio):
+        """Decode a command with the full recognizer."""
+        if self._full_recognizer is None:
+            self._full_recognizer = KaldiRecognizer(self.model, LISTEN_SAMPLE_RATE)
+        recognizer = self._full_recognizer
+        text = ""
+        if recognizer.AcceptWaveform(audio):
+            text = json.loads(recognizer.Result()).get("text", "")
+        final = json.loads(recognizer.FinalResult()).get("text", "")
+        return " ".join(t for t in (text, final) if t).strip()
+
+    def _handle_command(self, audio):
+        text = self._transcribe(audio)
+        self.stats["commands"] += 1
+        display_text = text
+        if self.language == "ar" and text:
+            display_text = get_display(arabic_reshaper.reshape(text))
+        fields = {}
+        if self.matcher is not None:
+            fields["intent"] = self.matcher.match(
+                [{"text": text, "posterior": 1.0}]) if text else None
+        self._emit("transcript", time=self._stream_time(), text=text,
+                   display_text=display_text, language=self.language, **fields)
+
+    def _wait_for_keyword(self):
+        self._awaiting_command_since = None
+        self.gate.max_frames = self.keyword_max_frames
+
+    def _on_segment(self, segment):
+        if self._awaiting_command_since is not None:
+            self._wait_for_keyword()
+            self._handle_command(segment)
+            return
+
+        self.stats["candidates"] += 1
+        keyword, remainder = self._spot(segment)
+        if keyword is None:
+            return
+
+        self.stats["keyword_hits"] += 1
+        self._emit("wake", time=self._stream_time(), keyword=keyword)
+
+        # Command spoken in the same breath as the wake phrase
+        if len(remainder) >= int(0.5 * LISTEN_SAMPLE_RATE) * 2:
+            self._handle_command(remainder)
+            return
+
+        self._awaiting_command_since = self.stats["frames"]
+        self.gate.max_frames = self.command_max_frames
+
+    def feed(self, block):
+        """Feed a block of PCM (a multiple of 20 ms frames)."""
+        for index, energy in enumerate(frame_energies(block)):
+            self.stats["frames"] += 1
+            frame = block[index * LISTEN_FRAME_BYTES:(index + 1) * LISTEN_FRAME_BYTES]
+            segment = self.gate.feed(frame, energy)
+            if segment is not None:
+                self._on_segment(segment)
+            elif (self._awaiting_command_since is not None and not self.gate.active and
+                  (self.stats["frames"] - self._awaiting_command_since) * LISTEN_FRAME_SECONDS
+                    > self.command_timeout):
+                self._emit("timeout", time=self._stream_time())
+                self._wait_for_keyword()
+
+    def run(self, stream):
+        """
+        Listen until EOF on a binary stream of 16 kHz mono s16le PCM.
+        :return: Stats dictionary (also emitted as the final event)
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        self._emit("listening", keywords=self.keywords, language=self.language)
+
+        read_size = LISTEN_FRAME_BYTES * LISTEN_READ_FRAMES
+        pending = b''
+        while True:
+            data = stream.read(read_size)
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % LISTEN_FRAME_BYTES
+            if usable:
+                self.feed(pending[:usable])
+                pending = pending[usable:]
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        audio_seconds = self.stats["frames"] * LISTEN_FRAME_SECONDS
+        stats = dict(self.stats)
+        stats.update({
+            "audio_s": self._stream_time(),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            # Average share of one core when the stream arrives in real time
+            "cpu_per_audio_second": round(cpu / audio_seconds, 5) if audio_seconds else 0.0
+        })
+        self._emit("stats", **stats)
+        return stats
+
+
+def open_pcm_stream(spec):
+    """Open '-' (stdin), 'fd:N' or a path/FIFO as an unbuffered binary stream."""
+    kind, value = describe_source(spec)
+    if kind == 'stdin':
+        return sys.stdin.buffer
+    if kind == 'fd':
+        return os.fdopen(value, 'rb')
+    if kind == 'path':
+        return open(value, 'rb')
+    raise ValueError("Listener mode needs a continuous stream (stdin, fd or FIFO)")
+
+
+class _ConvertedStream(PCMStream):
+    """PCMStream over the output pipe of an ffmpeg conversion."""
+
+    def __init__(self, process):
+        super().__init__(process.stdout)
+        self.process = process
+        self._errors = deque(maxlen=20)
+        self._stderr_reader = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_reader.start()
+
+    def _drain_stderr(self):
+        # Keep only the tail, however much ffmpeg complains over an hour of audio
+        for line in self.process.stderr:
+            self._errors.append(line.decode('utf-8', 'replace').rstrip())
+
+    def read(self, size):
+        data = super().read(size)
+        if not data and self.process.wait() != 0:
+            self._stderr_reader.join()
+            raise Exception(f"Failed to convert audio file: {' '.join(self._errors)}")
+        return data
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        super().close()
+        self.process.wait()
+
+
+def open_converted_stream(source, start=0.0):
+    """
+    Convert audio to 16 kHz mono 16-bit PCM with ffmpeg and read it straight
+    from the pipe, so neither the recording nor the converted PCM is held in
+    memory or written to disk.
+    :param source: Input path, '-' or 'fd:N'
+    :param start: Seconds into the input to start from (resuming)
+    :return: PCMStream
+    """
+    import subprocess
+
+    if not check_ffmpeg_availability():
+        raise Exception("ffmpeg not found. Please install ffmpeg or provide a WAV file.")
+
+    kind, value = describe_source(source)
+    if kind == 'shm':
+        raise ValueError("Shared memory input is already in memory; stream a file or pipe")
+    stdin = value if kind == 'fd' else None
+    input_spec = 'pipe:0' if kind in ('stdin', 'fd') else source
+
+    threads = active_profile().ffmpeg_arguments()
+    seek = ['-ss', f"{start:.6f}"] if start > 0 else []
+    cmd = [
+        'ffmpeg', '-loglevel', 'error', *threads, *seek, '-i', input_spec,
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ar', '16000',
+        '-ac', '1',
+        *threads,
+        'pipe:1'
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    finally:
+        if kind == 'fd':
+            os.close(value)
+    return _ConvertedStream(process)
+
+
+# Long-form transcription decodes this many frames per read
+LONG_FORM_READ_FRAMES = 4000
+CHECKPOINT_VERSION = 1
+# ffmpeg conversions produce 16 kHz mono 16-bit PCM
+CONVERTED_BYTES_PER_SECOND = 16000 * 2
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+class LongFormTranscriber:
+    """
+    Transcribe recordings of any length (whole trips) with flat memory.
+
+    Audio is read and decoded a block at a time and each segment is written
+    as an NDJSON event as soon as the recognizer finalizes it, with word
+    timestamps and confidences; nothing is kept once it is written. Vosk
+    finalizes a segment at the end of the block that completed it, so the
+    PCM byte offset consumed so far is an utterance boundary: it is saved to
+    the checkpoint after every segment, and an interrupted run resumes there
+    with a fresh recognizer.
+    """
+
+    def __init__(self, model, language="en", out=None, checkpoint=None, text_output=False,
+                 source=None):
+        """
+        :param checkpoint: Path of the checkpoint file, or None for no checkpoints
+        :param text_output: Print one line of display text per segment instead of NDJSON
+        :param source: Dictionary identifying the input, saved in the checkpoint
+        """
+        self.model = model
+        self.language = language
+        self.out = out or sys.stdout
+        self.checkpoint = checkpoint
+        self.text_output = text_output
+        self.source = source or {}
+        self.stats = {"segments": 0, "words": 0}
+
+    def emit(self, event, **fields):
+        if self.text_output:
+            if event == "segment":
+                self.out.write(fields["display_text"] + "\n")
+                self.out.flush()
+            return
+        fields["event"] = event
+        self.out.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+    def _save_checkpoint(self, offset, bytes_per_second, done=False):
+        if not self.checkpoint:
+            return
+        state = dict(self.source)
+        state.update({
+            "v": CHECKPOINT_VERSION,
+            "language": self.language,
+            "offset": offset,
+            "time": round(offset / float(bytes_per_second), 3),
+            "segments": self.stats["segments"],
+            "words": self.stats["words"],
+            "done": done
+        })
+        with atomic_output(self.checkpoint) as output:
+            with open(output.temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            output.commit()
+
+    def _segment(self, result, start_offset, end_offset, base_time, bytes_per_second):
+        text = result.get("text", "")
+        if not text:
+            return
+        words = [{
+            "word": w["word"],
+            "start": round(base_time + w["start"], 3),
+            "end": round(base_time + w["end"], 3),
+            "conf": round(w["conf"], 3)
+        } for w in result.get("result", []) if "start" in w]
+        confidences = [w["conf"] for w in words]
+        display_text = text
+        if self.language == "ar":
+            display_text = get_display(arabic_reshaper.reshape(text))
+        self.emit("segment",
+                  index=self.stats["segments"],
+                  start=round(start_offset / float(bytes_per_second), 3),
+                  end=round(end_offset / float(bytes_per_second), 3),
+                  offset=end_offset,
+                  text=text,
+                  display_text=display_text,
+                  confidence=round(sum(confidences) / len(confidences), 3) if confidences else None,
+                  words=words)
+        self.stats["segments"] += 1
+        self.stats["words"] += len(words) or len(text.split())
+
+    def run(self, stream, start_offset=0, resumed=None):
+        """
+        Decode a PCMStream to its end.
+        :param start_offset: PCM byte offset of the stream's current position
+                             in the recording (the resumed checkpoint's)
+        :param resumed: Checkpoint dictionary being resumed, if any
+        :return: Stats dictionary for the final event
+        """
+        if stream.channels != 1 or stream.sample_width != 2:
+            raise ValueError(
+                f"Long-form input must be mono 16-bit PCM (got {stream.channels} channels, "
+                f"{stream.sample_width * 8}-bit); use --convert")
+        if resumed:
+            self.stats["segments"] = resumed.get("segments", 0)
+            self.stats["words"] = resumed.get("words", 0)
+
+        bytes_per_second = stream.bytes_per_second
+        base_time = start_offset / float(bytes_per_second)
+        recognizer = KaldiRecognizer(self.model, stream.sample_rate)
+        recognizer.SetWords(True)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        self.emit("start", language=self.language, offset=start_offset,
+                  time=round(base_time, 3), resumed=bool(resumed),
+                  sample_rate=stream.sample_rate)
+
+        offset = segment_start = start_offset
+        read_size = LONG_FORM_READ_FRAMES * stream.sample_width
+        while True:
+            block = stream.read(read_size)
+            if not block:
+                break
+            offset += len(block)
+            if recognizer.AcceptWaveform(block):
+                self._segment(json.loads(recognizer.Result()), segment_start, offset,
+                              base_time, bytes_per_second)
+                segment_start = offset
+                self._save_checkpoint(offset, bytes_per_second)
+
+        self._segment(json.loads(recognizer.FinalResult()), segment_start, offset,
+                      base_time, bytes_per_second)
+        self._save_checkpoint(offset, bytes_per_second, done=True)
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        audio_seconds = (offset - start_offset) / float(bytes_per_second)
+        stats = dict(self.stats)
+        stats.update({
+            "offset": offset,
+            "audio_s": round(offset / float(bytes_per_second), 3),
+            "decoded_s": round(audio_seconds, 3),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "realtime_factor": round(audio_seconds / wall, 2) if wall > 0 else None,
+            "max_rss_mb": _max_rss_mb()
+        })
+        return stats
+
+
 def get_installation_instructions():
     """
     Get installation instructions for different operating systems.
@@ -248,6 +1024,11 @@ Installation Instructions:
      unzip vosk-model-ar-mgb2-0.4.zip
      mv vosk-model-ar-mgb2-0.4 ar
    
+   Optional large models (used when the system is idle and to re-decode
+   low-confidence results; keep the folder names as downloaded):
+     https://alphacephei.com/vosk/models/vosk-model-en-us-0.22.zip
+     https://alphacephei.com/vosk/models/vosk-model-ar-0.22-linto-1.1.0.zip
+   
    Place the model folders in one of these locations:
    - Current directory (where the script is run)
    - Script directory
@@ -263,7 +1044,9 @@ def main():
     """
     parser = argparse.ArgumentParser(
         description='Convert voice file to text using VOSK')
-    parser.add_argument('file_path', help='Path to the audio file')
+    parser.add_argument('file_path', nargs='*',
+                        help="Path to the audio file, '-' for stdin, 'fd:N' or 'shm:NAME'; "
+                             "several files are transcribed as a batch")
     parser.add_argument('--language', '-l', choices=['en', 'ar'], default='en',
                         help='Language for speech recognition (en for English, ar for Arabic)')
     parser.add_argument('--convert', '-c', action='store_true',
@@ -272,33 +1055,129 @@ def main():
                         help='Output format (json or text)')
     parser.add_argument('--install-help', action='store_true',
                         help='Show installation instructions')
+    parser.add_argument('--tier', choices=['auto'] + list(STT_TIERS), default='auto',
+                        help='Model quality tier (default: chosen from current load)')
+    parser.add_argument('--no-redecode', action='store_true',
+                        help='Never re-decode low-confidence results with a larger model')
+    parser.add_argument('--listen', action='store_true',
+                        help='Listen for a wake phrase on a continuous 16 kHz mono PCM '
+                             'stream (stdin or FIFO) and emit NDJSON events')
+    parser.add_argument('--keyword', action='append',
+                        help='Wake phrase for --listen (repeatable, default "hey car")')
+    parser.add_argument('--command-timeout', type=float, default=5.0,
+                        help='Seconds to wait for a command after the wake phrase')
+    parser.add_argument('--intents', action='store_true',
+                        help='Match the transcript against simple voice commands (sensor '
+                             'readings, trouble codes) and report the intent')
+    parser.add_argument('--alternatives', type=int, default=INTENT_ALTERNATIVES,
+                        help=f'n-best hypotheses matched with --intents (default '
+                             f'{INTENT_ALTERNATIVES}, 0 for the best transcript only)')
+    parser.add_argument('--long-form', action='store_true',
+                        help='Transcribe one long recording (e.g. a whole trip) with flat '
+                             'memory, emitting NDJSON segments with word timestamps as they '
+                             'are decoded')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='Save the --long-form position after every segment')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue a --long-form run from its --checkpoint')
+    parser.add_argument('--workers',
+                        help='Dispatch to remote STT workers: host:port list or a file with '
+                             'one per line (default: SPEECH_STT_WORKERS)')
+    parser.add_argument('--local', action='store_true',
+                        help='Decode locally even when SPEECH_STT_WORKERS is set')
+    parser.add_argument('--serve', metavar='HOST:PORT',
+                        help='Run as an STT worker for other nodes (port 0 picks a free one)')
+    parser.add_argument('--slots', type=int, default=1,
+                        help='Jobs an STT worker decodes at once (default 1)')
+    add_instrumentation_arguments(parser)
+    add_resource_arguments(parser)
 
     args = parser.parse_args()
 
     if args.install_help:
         print(get_installation_instructions())
         return 0
+    if not args.file_path and not args.serve:
+        parser.error('file_path is required')
+    if args.long_form and len(args.file_path) != 1:
+        parser.error('--long-form takes exactly one recording')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs --checkpoint')
+
+    return run_with_profile(lambda: run(args), args.profile)
+
 
-    file_path = args.file_path
+def run(args):
+    """Run a transcription for parsed command line arguments."""
+    metrics = SpeechMetrics(
+        'voice_to_text', enabled=(args.timings or bool(args.metrics_file)) or None)
+    profile = apply_profile(args.resource_profile)
+    if args.serve:
+        return serve_worker(args, profile)
 
-    # Convert file if needed
-    if args.convert:
+    file_path = args.file_path[0]
+    audio = None
+
+    if args.listen:
         try:
-            file_path = convert_audio_to_wav(args.file_path)
-            print(f"Converted audio file to: {file_path}", file=sys.stderr)
+            stream = open_pcm_stream(file_path)
+            listener = KeywordListener(args.language, args.keyword,
+                                       command_timeout=args.command_timeout,
+                                       intents=args.intents)
+            listener.run(stream)
+        except KeyboardInterrupt:
+            pass
         except Exception as e:
-            print(f"Conversion error: {e}", file=sys.stderr)
-            print(
-                "\nFor installation help, run: python voice_to_text.py --install-help", file=sys.stderr)
+            print(f"Listener error: {e}", file=sys.stderr)
             return 1
+        return 0
+
+    if args.long_form:
+        return run_long_form(args, metrics, profile)
 
-    # Process the audio file
+    workers = [] if args.local else (
+        parse_node_list(args.workers) if args.workers else configured_nodes())
+    if workers or len(args.file_path) > 1:
+        return run_batch(args, metrics, profile, workers)
+
+    trace = SpeechTrace('stt', 'voice_to_text', {
+        "language": args.language,
+        "convert": args.convert,
+        "tier": None if args.tier == 'auto' else args.tier,
+        "redecode": not args.no_redecode,
+        "intents": args.intents,
+        "alternatives": args.alternatives
+    })
     try:
-        result = process_audio_file(file_path, args.language)
-    except Exception as e:
-        print(f"Error: {e}", file=sys.stderr)
-        print("\nFor installation help, run: python voice_to_text.py --install-help", file=sys.stderr)
-        return 1
+        with profile.job() as usage:
+            # Convert file if needed (in memory, no intermediate WAV on disk)
+            if args.convert:
+                try:
+                    audio = convert_audio_to_pcm(file_path, metrics)
+                except Exception as e:
+                    print(f"Conversion error: {e}", file=sys.stderr)
+                    print(
+                        "\nFor installation help, run: python voice_to_text.py --install-help",
+                        file=sys.stderr)
+                    return 1
+
+            # Process the audio file
+            try:
+                result = process_audio_file(
+                    file_path, args.language, metrics, audio,
+                    None if args.tier == 'auto' else args.tier, not args.no_redecode,
+                    args.intents, args.alternatives)
+            except Exception as e:
+                print(f"Error: {e}", file=sys.stderr)
+                print("\nFor installation help, run: python voice_to_text.py --install-help",
+                      file=sys.stderr)
+                return 1
+        result["resources"] = usage
+    except TimeoutError as e:
+        result = {"success": False, "error": str(e), "text": "", "language": args.language}
+
+    trace.record(result, audio=file_path)
+    metrics.dump_prometheus(args.metrics_file)
 
     # Output the result
     if args.output == 'json':
@@ -312,17 +1191,201 @@ def main():
 
     return 0
 
+def run_long_form(args, metrics, profile):
+    """
+    Transcribe one recording as a stream of segments (--long-form), resuming
+    from the checkpoint with --resume.
+    """
+    file_path = args.file_path[0]
+    tier = None if args.tier == 'auto' else args.tier
+    kind, _ = describe_source(file_path)
+    try:
+        source = {
+            "source": file_path,
+            "source_bytes": os.path.getsize(file_path) if kind == 'path' else None,
+            "convert": args.convert
+        }
+    except OSError:
+        print(f"Error: Audio file not found: {file_path}", file=sys.stderr)
+        return 1
+
+    resumed = None
+    if args.resume and os.path.exists(args.checkpoint):
+        with open(args.checkpoint, 'r', encoding='utf-8') as f:
+            resumed = json.load(f)
+        saved = {key: resumed.get(key) for key in source}
+        if saved != source or resumed.get("language") != args.language:
+            print(f"Error: checkpoint {args.checkpoint} was written for another recording "
+                  f"or other options", file=sys.stderr)
+            return 1
+        # Finish with the model the first part was decoded with
+        tier = resumed.get("tier") or tier
+    start_offset = resumed["offset"] if resumed else 0
+
+    try:
+        with profile.job() as usage:
+            policy = stt_policy(forced=tier)
+            installed = installed_vosk_models(args.language)
+            selection = policy.choose(installed) if installed else {
+                "tier": None, "reason": "untiered"}
+            with metrics.stage('model_load'):
+                model = load_vosk_model(args.language, selection["tier"])
+            source["tier"] = selection["tier"]
+
+            if args.convert:
+                stream = open_converted_stream(
+                    file_path, start_offset / float(CONVERTED_BYTES_PER_SECOND))
+            else:
+                stream = open_audio_stream(file_path)
+                stream.skip(start_offset)
+            transcriber = LongFormTranscriber(
+                model, args.language, checkpoint=args.checkpoint,
+                text_output=args.output == 'text', source=source)
+            with stream, metrics.stage('decode'), track_job('stt'):
+                stats = transcriber.run(stream, start_offset, resumed)
+        stats["tier"] = selection["tier"]
+        stats["resources"] = usage
+    except KeyboardInterrupt:
+        # The checkpoint already holds the last finished segment
+        return 1
+    except Exception as e:
+        print(f"Long-form error: {e}", file=sys.stderr)
+        return 1
+
+    metrics.dump_prometheus(args.metrics_file)
+    transcriber.emit("end", **metrics.attach(stats))
+    return 0
+
+
+def run_batch(args, metrics, profile, workers):
+    """
+    Transcribe the given files as one batch, dispatched to remote STT
+    workers when there are any, decoding locally otherwise or when they fail.
+    """
+    tier = None if args.tier == 'auto' else args.tier
+
+    def open_audio(path):
+        if args.convert:
+            return lambda: convert_audio_to_pcm(path)
+        return lambda: open_audio_source(path)
+
+    def decode_locally(job, audio):
+        if audio is None and args.convert:
+            return {
+                "success": False,
+                "error": f"Conversion error: {job['open_error']}",
+                "text": "",
+                "language": args.language
+            }
+        try:
+            with profile.job() as usage:
+                result = process_audio_file(job["name"], args.language, metrics, audio,
+                                            tier, not args.no_redecode,
+                                            args.intents, args.alternatives)
+            result["resources"] = usage
+        except TimeoutError as e:
+            result = {"success": False, "error": str(e), "text": "", "language": args.language}
+        return result
+
+    jobs = [{
+        "name": path,
+        "language": args.language,
+        "tier": tier,
+        "redecode": not args.no_redecode,
+        "intents": args.intents,
+        "alternatives": args.alternatives,
+        "open": open_audio(path)
+    } for path in args.file_path]
+    # One trace record per file, timed from the start of the batch
+    traces = [SpeechTrace('stt', 'voice_to_text', {
+        "language": args.language,
+        "convert": args.convert,
+        "tier": tier,
+        "redecode": not args.no_redecode,
+        "intents": args.intents,
+        "alternatives": args.alternatives,
+        "batch": len(jobs),
+        "workers": len(workers)
+    }) for _ in jobs]
+    cluster = STTCluster(workers, decode_locally)
+    results = cluster.run(jobs)
+    for trace, path, result in zip(traces, args.file_path, results):
+        trace.record(result, audio=path)
+    metrics.dump_prometheus(args.metrics_file)
+
+    if len(results) == 1:
+        output = dict(results[0], cluster=cluster.stats())
+    else:
+        output = {
+            "success": all(result['success'] for result in results),
+            "results": results,
+            "cluster": cluster.stats()
+        }
+
+    if args.output == 'json':
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            if result['success']:
+                print(result['display_text'])
+            else:
+                print(f"Error: {result['file_path']}: {result['error']}", file=sys.stderr)
+        if not all(result['success'] for result in results):
+            return 1
+
+    return 0
+
+
+def serve_worker(args, profile):
+    """Decode jobs dispatched by other nodes (--serve) until interrupted."""
+    host, port = parse_node_list(args.serve)[0]
+
+    def decode(header, pcm):
+        audio = pcm_buffer(pcm, header["sample_rate"], header["channels"])
+        with profile.job() as usage:
+            result = process_audio_file(header["name"], header["language"], None, audio,
+                                        header.get("tier"), header.get("redecode", True),
+                                        header.get("intents", False),
+                                        header.get("alternatives", INTENT_ALTERNATIVES),
+                                        long_lived=True)
+        result["resources"] = usage
+        return result
+
+    server = STTWorkerServer(decode, (host, port), args.slots)
+    bound_host, bound_port = server.server_address[:2]
+    print(json.dumps({
+        "event": "listening",
+        "address": f"{bound_host}:{bound_port}",
+        "name": server.name,
+        "slots": server.slots
+    }), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
 # Function specifically for NestJS backend integration
 
 
-def transcribe_voice_file(file_path, language="en"):
+def transcribe_voice_file(file_path, language="en", intents=False):
     """
     Function to be called by NestJS backend.
     :param file_path: Path to the voice file
     :param language: Language code ('en' or 'ar')
+    :param intents: Also report the voice command intent, if any
     :return: Dictionary with transcription results
     """
-    return process_audio_file(file_path, language)
+    trace = SpeechTrace('stt', 'transcribe_voice_file', {
+        "language": language,
+        "convert": False,
+        "intents": intents
+    })
+    result = process_audio_file(file_path, language, intents=intents)
+    trace.record(result, audio=file_path)
+    return result
 
 
 if __name__ == "__main__":
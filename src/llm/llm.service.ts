@@ -14,7 +14,11 @@ import { AskDto } from './dto/ask.dto';
 import { llmQuery, llmResponse } from './llm.types';
 import { ObdService } from 'src/obd/obd.service';
 import { UpdateChatTitleDto } from './dto/update-chat-title.dto';
-import type { SupportedLanguage } from 'src/speech/speech.service';
+import type {
+  SpeechStream,
+  SupportedLanguage,
+  VoiceIntent,
+} from 'src/speech/speech.service';
 
 // Add type definitions for stream data
 interface StreamChunk {
@@ -24,6 +28,36 @@ interface StreamChunk {
   error?: string;
 }
 
+// Answer to a voice command given from live data instead of the LLM
+interface LocalAnswer {
+  text: string;
+  readout?: { sensor: string; value: number }; // Spoken with the readout bank
+}
+
+// Time the driver has to confirm clearing the trouble codes
+const CLEAR_CONFIRM_WINDOW_MS = 30000;
+
+// Arabic names of the sensors the Arabic voice commands can ask for; other
+// sensors are left to the LLM when the chat is in Arabic
+const ARABIC_SENSOR_TITLES: Record<string, string> = {
+  VEHICLE_SPEED: 'سرعة السيارة',
+  ENGINE_RPM: 'دوران المحرك',
+  FUEL_TANK_LEVEL_INPUT: 'مستوى الوقود',
+  CONTROL_MODULE_VOLTAGE: 'جهد البطارية',
+  ENGINE_COOLANT_TEMPERATURE: 'درجة حرارة المحرك',
+  ENGINE_OIL_TEMP: 'حرارة الزيت',
+};
+
+const ARABIC_UNITS: Record<string, string> = {
+  'km/h': 'كم/ساعة',
+  mph: 'ميل/ساعة',
+  RPM: 'دورة في الدقيقة',
+  '%': '%',
+  V: 'فولت',
+  '°C': 'درجة مئوية',
+  '°F': 'درجة فهرنهايت',
+};
+
 @Injectable()
 export class LlmService {
   constructor(
@@ -35,6 +69,9 @@ export class LlmService {
     private readonly obdService: ObdService,
   ) {}
 
+  // Chats asked to confirm clearing the trouble codes, with the deadline
+  private readonly pendingClears = new Map<string, number>();
+
   async getChats(): Promise<ChatSession[]> {
     return await this.chatSessionRepository.find({
       where: {},
@@ -169,16 +206,26 @@ export class LlmService {
     llmQuery.query = content;
     llmQuery.sensor_data = this.obdService.getCurrentData();
 
+    let localAnswer: LocalAnswer | null = null;
     if (containsSpeech && voiceFile) {
       const result = await this.speechService.transcribeVoiceFile(voiceFile);
       if (result.success) {
         llmQuery.voice_text = result.text;
+        if (!content && result.intent?.fast_path) {
+          localAnswer = this.answerVoiceCommand(
+            chatId,
+            result.intent,
+            language,
+          );
+        }
       } else {
         throw new Error('Failed to transcribe voice file');
       }
     }
 
-    const llmResponse = await this.queryLlm(llmQuery);
+    const llmResponse: llmResponse = localAnswer
+      ? { response: localAnswer.text, sensor_data_used: true }
+      : await this.queryLlm(llmQuery);
 
     const userMessage = this.chatMessageRepository.create({
       session: { id: chatId },
@@ -204,11 +251,18 @@ export class LlmService {
       autoPlay === 'always' ||
       (autoPlay === 'long' && llmResponse.response.length > 200)
     ) {
-      const ttsResult = await this.speechService.synthesizeSpeech(
-        llmResponse.response,
-        language as SupportedLanguage,
-        { playDirectly: true },
-      );
+      const ttsResult = localAnswer?.readout
+        ? await this.speechService.synthesizeSensorReadout(
+            localAnswer.readout.sensor,
+            localAnswer.readout.value,
+            language as SupportedLanguage,
+            { playDirectly: true },
+          )
+        : await this.speechService.synthesizeSpeech(
+            llmResponse.response,
+            language as SupportedLanguage,
+            { playDirectly: true },
+          );
       console.log(ttsResult);
     }
 
@@ -220,6 +274,121 @@ export class LlmService {
     };
   }
 
+  /**
+   * Answer a simple voice command (sensor reading, trouble codes) from live
+   * data. Returns null when the command cannot be answered locally, in which
+   * case the question goes to the LLM as usual.
+   *
+   * Clearing the trouble codes also resets the readiness monitors, so a
+   * clear command only asks for confirmation. The codes are cleared when the
+   * next command answered here confirms it within CLEAR_CONFIRM_WINDOW_MS.
+   */
+  private answerVoiceCommand(
+    chatId: string,
+    intent: VoiceIntent,
+    language: string,
+  ): LocalAnswer | null {
+    const arabic = language === 'ar';
+    // A confirmation only counts for the command right after the question
+    const deadline = this.pendingClears.get(chatId);
+    this.pendingClears.delete(chatId);
+    const clearPending = deadline !== undefined && Date.now() <= deadline;
+    switch (intent.name) {
+      case 'read_sensor': {
+        const key = intent.slots.sensor;
+        const sensor = this.obdService
+          .getConfig()
+          .sensorConfigs.find((config) => config.key === key);
+        const currentData = this.obdService.getCurrentData() as Record<
+          string,
+          number | string | null | undefined
+        >;
+        const value = key ? currentData[key] : undefined;
+        if (!key || !sensor || value === undefined || value === null) {
+          return null;
+        }
+        if (arabic) {
+          // The readout bank is English only, so Arabic answers are synthesized as text
+          const title = ARABIC_SENSOR_TITLES[key];
+          const unit = ARABIC_UNITS[sensor.unit];
+          return title && unit ? { text: `${title}: ${value} ${unit}` } : null;
+        }
+        return {
+          text: `${sensor.title}: ${value} ${sensor.unit}`,
+          readout:
+            typeof value === 'number' ? { sensor: key, value } : undefined,
+        };
+      }
+      case 'read_dtcs': {
+        const pending = intent.slots.kind === 'pending';
+        const codes = pending
+          ? this.obdService.getPendingDTCs()
+          : this.obdService.getActiveDTCs();
+        const list = codes
+          .map((dtc) => `${dtc.code} (${dtc.description})`)
+          .join(', ');
+        if (arabic) {
+          return {
+            text: codes.length
+              ? `رموز الأعطال: ${list}`
+              : 'لا توجد رموز أعطال.',
+          };
+        }
+        const kind = pending ? 'pending' : 'active';
+        return {
+          text: codes.length
+            ? `${codes.length} ${kind} trouble code${codes.length === 1 ? '' : 's'}: ${list}`
+            : `No ${kind} trouble codes.`,
+        };
+      }
+      case 'clear_dtcs': {
+        const count =
+          this.obdService.getActiveDTCs().length +
+          this.obdService.getPendingDTCs().length;
+        if (count === 0) {
+          return {
+            text: arabic
+              ? 'لا توجد رموز أعطال لمسحها.'
+              : 'There are no trouble codes to clear.',
+          };
+        }
+        this.pendingClears.set(chatId, Date.now() + CLEAR_CONFIRM_WINDOW_MS);
+        return {
+          text: arabic
+            ? `هل تريد مسح ${count} من رموز الأعطال؟ سيتم أيضاً إعادة ضبط مؤشرات الجاهزية. قل نعم للتأكيد.`
+            : `Clear ${count} trouble code${count === 1 ? '' : 's'}? This also resets the readiness monitors. Say yes to confirm.`,
+        };
+      }
+      case 'confirm': {
+        if (!clearPending) {
+          return null;
+        }
+        if (!this.obdService.clearFaults().success) {
+          return {
+            text: arabic
+              ? 'تعذر مسح رموز الأعطال.'
+              : 'The trouble codes could not be cleared.',
+          };
+        }
+        return {
+          text: arabic ? 'تم مسح رموز الأعطال.' : 'Trouble codes cleared.',
+        };
+      }
+      case 'cancel': {
+        if (!clearPending) {
+          return null;
+        }
+        return {
+          text: arabic
+            ? 'حسناً، لم يتم مسح رموز الأعطال.'
+            : 'Okay, the trouble codes were not cleared.',
+        };
+      }
+      default:
+        return null;
+    }
+  }
+
   async queryLlm(llmQuery: llmQuery): Promise<llmResponse> {
     console.log(llmQuery);
     const response = await fetch('http://localhost:5000/diagnose', {
@@ -384,15 +553,69 @@ export class LlmService {
     llmQuery.sensor_data = this.obdService.getCurrentData();
 
     // Handle voice transcription
+    let localAnswer: LocalAnswer | null = null;
     if (containsSpeech && voiceFile) {
       const result = await this.speechService.transcribeVoiceFile(voiceFile);
       if (result.success) {
         llmQuery.voice_text = result.text;
+        if (!content && result.intent?.fast_path) {
+          localAnswer = this.answerVoiceCommand(
+            chatId,
+            result.intent,
+            language,
+          );
+        }
       } else {
         throw new Error('Failed to transcribe voice file');
       }
     }
 
+    // Simple voice commands are answered from live data, skipping the LLM
+    if (localAnswer) {
+      const userMessage = this.chatMessageRepository.create({
+        session: { id: chatId },
+        content: `Transcribed message: ${llmQuery.voice_text}`,
+        role: 'user',
+      });
+      await this.chatMessageRepository.save(userMessage);
+      const assistantMessage = this.chatMessageRepository.create({
+        session: { id: chatId },
+        content: localAnswer.text,
+        role: 'assistant',
+      });
+      await this.chatMessageRepository.save(assistantMessage);
+      await this.chatSessionRepository.update(chatId, {
+        lastMessageDate: assistantMessage.timestamp,
+        lastMessage: localAnswer.text,
+      });
+
+      if (onChunk) {
+        onChunk({ response_chunk: localAnswer.text });
+        onChunk({ status: 'complete', final_response: localAnswer.text });
+      }
+
+      if (autoPlay === 'always') {
+        try {
+          const ttsResult = localAnswer.readout
+            ? await this.speechService.synthesizeSensorReadout(
+                localAnswer.readout.sensor,
+                localAnswer.readout.value,
+                language as SupportedLanguage,
+                { playDirectly: true },
+              )
+            : await this.speechService.synthesizeSpeech(
+                localAnswer.text,
+                language as SupportedLanguage,
+                { playDirectly: true },
+              );
+          console.log(ttsResult);
+        } catch (ttsError) {
+          console.error('TTS Error:', ttsError);
+        }
+      }
+      return;
+    }
+
     // Get the stream from Flask
     const stream = await this.queryLlmStream(llmQuery);
     const reader = stream.getReader();
@@ -403,6 +626,13 @@ export class LlmService {
     let userMessage: ChatMessage;
     let assistantMessage: ChatMessage;
 
+    // Speak the answer while it streams in. For 'long' the stream opens once
+    // the answer passes the length threshold, starting with the text so far.
+    let speechStream: SpeechStream | undefined;
+    const shouldSpeak = () =>
+      autoPlay === 'always' ||
+      (autoPlay === 'long' && fullResponse.length > 200);
+
     try {
       // Create and save user message immediately
       userMessage = this.chatMessageRepository.create({
@@ -453,6 +683,15 @@ export class LlmService {
                   // Accumulate response chunks
                   fullResponse += parsedData.response_chunk;
 
+                  if (speechStream) {
+                    speechStream.write(parsedData.response_chunk);
+                  } else if (shouldSpeak()) {
+                    speechStream = this.speechService.openSpeechStream(
+                      language as SupportedLanguage,
+                    );
+                    speechStream.write(fullResponse);
+                  }
+
                   // Update the assistant message in real-time
                   await this.chatMessageRepository.update(assistantMessage.id, {
                     content: fullResponse,
@@ -475,11 +714,19 @@ export class LlmService {
                     lastMessage: fullResponse,
                   });
 
-                  // Handle TTS if needed
-                  if (
-                    autoPlay === 'always' ||
-                    (autoPlay === 'long' && fullResponse.length > 200)
-                  ) {
+                  // Finish the spoken answer; fall back to whole-answer
+                  // synthesis only if the stream played nothing, so sentences
+                  // already heard are not repeated
+                  let spoken = false;
+                  if (speechStream) {
+                    const streamResult = await speechStream.end();
+                    speechStream = undefined;
+                    console.log(streamResult);
+                    spoken =
+                      streamResult.success ||
+                      (streamResult.stream?.output_bytes ?? 0) > 0;
+                  }
+                  if (!spoken && shouldSpeak()) {
                     try {
                       const ttsResult =
                         await this.speechService.synthesizeSpeech(
@@ -510,6 +757,10 @@ export class LlmService {
       }
     } finally {
       reader.releaseLock();
+      if (speechStream) {
+        // Stream ended without a completion message; speak what arrived
+        void speechStream.end();
+      }
     }
   }
 }
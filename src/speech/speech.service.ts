@@ -1,8 +1,33 @@
-import { Injectable, Logger } from '@nestjs/common';
-import { spawn } from 'child_process';
+import { Injectable, Logger, OnModuleDestroy } from '@nestjs/common';
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
 import * as path from 'path';
 import * as fs from 'fs';
-import * as os from 'os';
+import * as readline from 'readline';
+
+// CPU budget and usage of one speech job (scripts/resource_profile.py)
+export interface SpeechResourceUsage {
+  profile: string;
+  threads?: number;
+  cpus?: number[];
+  nice?: number;
+  ionice?: string;
+  max_jobs?: number;
+  slot_wait_s: number;
+  wall_s: number;
+  cpu_s: number;
+  cpu_utilization: number | null;
+}
+
+// Simple voice command recognized in a transcript (scripts/intent_matcher.py)
+export interface VoiceIntent {
+  name: 'read_sensor' | 'read_dtcs' | 'clear_dtcs' | 'confirm' | 'cancel';
+  slots: { sensor?: string; kind?: 'active' | 'pending' };
+  confidence: number;
+  fast_path: boolean; // Confident enough to answer without the LLM
+  matched: string; // Words the command pattern covered
+  hypothesis: string; // Transcript hypothesis the intent came from
+  hypotheses: number; // n-best hypotheses considered
+}
 
 export interface TranscriptionResult {
   success: boolean;
@@ -11,6 +36,16 @@ export interface TranscriptionResult {
   language: string;
   file_path?: string;
   error?: string;
+  tier?: string | null; // Vosk model tier that produced the text
+  confidence?: number | null; // Mean word confidence
+  redecoded?: {
+    from_tier: string;
+    from_confidence: number;
+    to_tier: string;
+    to_confidence: number | null;
+  } | null;
+  intent?: VoiceIntent | null;
+  resources?: SpeechResourceUsage;
 }
 
 export interface TTSResult {
@@ -20,11 +55,75 @@ export interface TTSResult {
   file_path?: string;
   file_size?: number;
   error?: string;
+  tier?: string | null; // Piper voice tier (x_low, low, medium, high)
+  voice_variant?: 'fp32' | 'opt' | 'int8'; // Optimized Piper model in use
+  speaker?: { id: number; name: string } | null; // Multi-speaker voices only
+  phonemes?: {
+    input: 'phoneme_ids' | 'text';
+    piper_reads_phoneme_ids?: boolean | null; // null while the probe is pending
+    note?: string; // Why the phoneme cache saves no work on this path
+    clauses?: number;
+    hits?: number;
+    misses?: number;
+    hit_rate: number | null;
+  };
+  inference?: {
+    mode: 'in_process';
+    utterances: number;
+    batch_sizes: number[];
+  };
+  resources?: SpeechResourceUsage;
+  readout?: {
+    sensor: string;
+    value: number;
+    unit: string;
+    mode: 'spliced' | 'synthesized'; // Pre-rendered units or full synthesis
+    units?: number;
+    missing_units?: string[] | null;
+    elapsed_s: number; // Inside the readout process
+    startup_s?: number; // Script start before the readout (one-shot runs)
+    latency_s?: number; // Request to result, as seen by the caller
+  };
   settings?: {
     speed?: number;
     pitch?: number;
     amplitude?: number;
   };
+  routing?: {
+    engine?: string;
+    tier?: string | null;
+    urgent: boolean;
+    attempts: {
+      engine: string;
+      predicted_latency: number;
+      latency: number;
+      success: boolean;
+      error?: string | null;
+    }[];
+  };
+}
+
+export interface TTSStreamResult extends TTSResult {
+  played?: boolean;
+  stream?: {
+    sentences: number;
+    sample_rate: number;
+    audio_bytes: number;
+    output_bytes: number; // Audio delivered to the player (also on failure)
+    audio_duration_s: number;
+    first_sentence_s: number | null;
+    first_audio_s: number | null;
+    first_audio_latency_s: number | null;
+  };
+}
+
+/**
+ * Text sink for incremental synthesis: each sentence is spoken as soon as
+ * it is complete, while the rest of the text is still being written.
+ */
+export interface SpeechStream {
+  write(fragment: string): void;
+  end(): Promise<TTSStreamResult>;
 }
 
 export interface TTSOptions {
@@ -34,15 +133,36 @@ export interface TTSOptions {
   outputFile?: string;
   playDirectly?: boolean;
   voice?: string;
+  speaker?: string | number; // Speaker name or ID of a multi-speaker Piper voice
+  urgent?: boolean; // Route for latency (OBD alerts) instead of quality
+  latencyTarget?: number; // Seconds
+}
+
+export interface SensorReadoutOptions {
+  imperial?: boolean; // The value is already in imperial units
+  decimals?: number;
+  speaker?: string | number;
+  outputFile?: string;
+  playDirectly?: boolean;
 }
 
 export type SupportedLanguage = 'en' | 'ar' | 'es' | 'fr' | 'de';
 
+// Long-lived `sensor_readout.py --serve` process and the callers waiting
+// for its answers, which arrive one JSON line per request in order
+interface ReadoutServer {
+  process: ChildProcessWithoutNullStreams;
+  waiting: ((result: TTSResult) => void)[];
+}
+
 @Injectable()
-export class SpeechService {
+export class SpeechService implements OnModuleDestroy {
   private readonly logger = new Logger(SpeechService.name);
   private readonly sttPythonScriptPath: string;
   private readonly ttsPythonScriptPath: string;
+  private readonly piperPythonScriptPath: string;
+  private readonly readoutPythonScriptPath: string;
+  private readoutServer: ReadoutServer | null = null;
 
   constructor() {
     this.sttPythonScriptPath = path.join(
@@ -51,10 +171,26 @@ export class SpeechService {
       'voice_to_text.py',
     );
     this.ttsPythonScriptPath = path.join(
+      process.cwd(),
+      'scripts',
+      'tts_router.py',
+    );
+    this.piperPythonScriptPath = path.join(
       process.cwd(),
       'scripts',
       'piper_tts.py',
     );
+    this.readoutPythonScriptPath = path.join(
+      process.cwd(),
+      'scripts',
+      'sensor_readout.py',
+    );
+  }
+
+  onModuleDestroy() {
+    // Closing stdin lets the readout server finish its requests and exit
+    this.readoutServer?.process.stdin.end();
+    this.readoutServer = null;
   }
 
   private validateText(text: string, language: SupportedLanguage): string {
@@ -64,9 +200,9 @@ export class SpeechService {
 
     text = text.trim().replace(/\s+/g, ' ');
 
+    // Mixed-script text is kept as is: the TTS scripts read English part
+    // names, DTC codes and units inside Arabic answers with an English voice
     if (language === 'ar') {
-      text = text.replace(/[^\u0600-\u06FF\s.,!?؟،]/g, '');
-
       text = text.normalize('NFKC');
     }
 
@@ -121,6 +257,7 @@ export class SpeechService {
         '--language',
         language,
         '--convert',
+        '--intents',
         '--output',
         'json',
       ]);
@@ -206,58 +343,260 @@ export class SpeechService {
     }
   }
 
-  private async executeTTSScript(
-    text: string,
+  /**
+   * Speak a live sensor value ("Coolant Temperature, ninety-two degrees
+   * Celsius"). Readouts are spliced from units pre-rendered per voice by a
+   * readout process that stays running with the units loaded, so a value
+   * takes milliseconds instead of a Python start; values the units do not
+   * cover are synthesized.
+   */
+  async synthesizeSensorReadout(
+    sensorKey: string,
+    value: number,
     language: SupportedLanguage = 'en',
-    options: TTSOptions,
+    options: SensorReadoutOptions = {},
   ): Promise<TTSResult> {
-    return new Promise((resolve, reject) => {
-      let processedText: string;
-      let useFileInput = false;
-      let tempFilePath: string | null = null;
-
-      // Handle Arabic text encoding properly
-      if (language === 'ar' || this.containsArabicText(text)) {
-        // For Arabic text, use file-based approach to avoid encoding issues
-        useFileInput = true;
-        tempFilePath = this.createTempFile(text);
-        processedText = tempFilePath;
-      } else {
-        // For non-Arabic text, ensure proper UTF-8 encoding
-        const textBuffer = Buffer.from(text, 'utf8');
-        processedText = textBuffer.toString('utf8');
+    const request = {
+      sensor: sensorKey,
+      value,
+      language,
+      imperial: options.imperial ?? false,
+      decimals: options.decimals,
+      speaker: options.speaker,
+      output: options.outputFile,
+      play: options.playDirectly ?? false,
+    };
+
+    try {
+      const started = Date.now();
+      const result = await this.requestReadout(request);
+      if (result.readout) {
+        result.readout.latency_s = (Date.now() - started) / 1000;
       }
+      if (!result.success) {
+        this.logger.error(`Sensor readout failed: ${result.error}`);
+      }
+      return result;
+    } catch (error: unknown) {
+      const errorMessage =
+        error instanceof Error ? error.message : 'Unknown error occurred';
+      this.logger.error(`Sensor readout failed: ${errorMessage}`);
+      return {
+        success: false,
+        error: errorMessage,
+      };
+    }
+  }
 
-      const args = [this.ttsPythonScriptPath];
+  private requestReadout(request: object): Promise<TTSResult> {
+    return new Promise((resolve) => {
+      const server = this.readoutServer ?? this.startReadoutServer();
+      server.waiting.push(resolve);
+      server.process.stdin.write(`${JSON.stringify(request)}\n`, 'utf8');
+    });
+  }
 
-      // Add text parameter based on method
-      if (useFileInput) {
-        args.push('--file', processedText);
-      } else {
-        args.push(processedText);
+  private startReadoutServer(): ReadoutServer {
+    const pythonProcess = spawn(
+      'python',
+      [this.readoutPythonScriptPath, '--serve'],
+      {
+        stdio: ['pipe', 'pipe', 'pipe'],
+        env: {
+          ...process.env,
+          PYTHONIOENCODING: 'utf-8',
+          LC_ALL: 'en_US.UTF-8',
+        },
+      },
+    );
+    const server: ReadoutServer = { process: pythonProcess, waiting: [] };
+
+    let stderr = '';
+    readline
+      .createInterface({ input: pythonProcess.stdout })
+      .on('line', (line: string) => {
+        const resolve = server.waiting.shift();
+        if (!resolve) return;
+        try {
+          resolve(JSON.parse(line) as TTSResult);
+        } catch {
+          resolve({
+            success: false,
+            error: `Failed to parse sensor readout output: ${line}`,
+          });
+        }
+      });
+    pythonProcess.stderr.on('data', (data: Buffer) => {
+      // Keep the tail only: the process lives as long as the service
+      stderr = (stderr + data.toString('utf8')).slice(-4096);
+    });
+    pythonProcess.stdin.on('error', (error: Error) => {
+      this.logger.warn(`Failed to write readout request: ${error.message}`);
+    });
+
+    // The next readout starts a new process
+    const stop = (error: string) => {
+      if (this.readoutServer === server) this.readoutServer = null;
+      for (const resolve of server.waiting.splice(0)) {
+        resolve({ success: false, error });
       }
+    };
+    pythonProcess.on('close', (code: number) => {
+      stop(`Sensor readout process exited with code ${code}: ${stderr}`);
+    });
+    pythonProcess.on('error', (error: Error) => {
+      stop(`Failed to start sensor readout process: ${error.message}`);
+    });
 
-      args.push('--language', language, '--format', 'json');
+    this.readoutServer = server;
+    this.logger.log('Started sensor readout process');
+    return server;
+  }
 
-      // Add Piper-specific parameters
-      if (options.speed) {
-        // Convert speed to length_scale (Piper's speed control)
-        const lengthScale = 1.0 / options.speed;
-        args.push('--length-scale', lengthScale.toString());
-      }
+  /**
+   * Start speaking text that is still being produced (e.g. a streamed LLM
+   * answer). Fragments are piped to Piper, which synthesizes and plays each
+   * sentence once it closes; end() resolves when playback has finished.
+   */
+  openSpeechStream(
+    language: SupportedLanguage = 'en',
+    options: TTSOptions = {},
+  ): SpeechStream {
+    const args = [
+      this.piperPythonScriptPath,
+      '--stream-text',
+      '--file',
+      '-',
+      '--play',
+      '--language',
+      language,
+      '--format',
+      'json',
+    ];
+    if (options.speed) args.push('--speed', options.speed.toString());
+    if (options.pitch) {
+      args.push('--noise-scale', (options.pitch / 99.0).toString());
+    }
+    if (options.speaker !== undefined) {
+      args.push('--speaker', options.speaker.toString());
+    }
 
-      // Piper uses noise_scale instead of pitch
-      if (options.pitch) {
-        // Convert pitch (0-99) to noise_scale (0.0-1.0)
-        const noiseScale = options.pitch / 99.0;
-        args.push('--noise-scale', noiseScale.toString());
-      }
+    const pythonProcess = spawn('python', args, {
+      stdio: ['pipe', 'pipe', 'pipe'],
+      env: {
+        ...process.env,
+        PYTHONIOENCODING: 'utf-8',
+        LC_ALL: 'en_US.UTF-8',
+      },
+    });
+
+    let stdout = '';
+    let stderr = '';
+    pythonProcess.stdout.on('data', (data: Buffer) => {
+      stdout += data.toString('utf8');
+    });
+    pythonProcess.stderr.on('data', (data: Buffer) => {
+      stderr += data.toString('utf8');
+    });
+    pythonProcess.stdin.on('error', (error: Error) => {
+      this.logger.warn(`Failed to write TTS stream input: ${error.message}`);
+    });
+
+    const finished = new Promise<TTSStreamResult>((resolve) => {
+      pythonProcess.on('close', () => {
+        try {
+          resolve(JSON.parse(stdout) as TTSStreamResult);
+        } catch {
+          resolve({
+            success: false,
+            error: `TTS stream failed: ${stderr || 'no result'}`,
+          });
+        }
+      });
+      pythonProcess.on('error', (error: Error) => {
+        resolve({
+          success: false,
+          error: `Failed to start TTS stream: ${error.message}`,
+        });
+      });
+    });
 
-      // Note: Piper doesn't have amplitude control - it's handled by the system
+    this.logger.log(`Started speech stream (Language: ${language})`);
 
-      if (options.outputFile) args.push('--output', options.outputFile);
-      if (options.playDirectly) args.push('--play');
+    return {
+      write: (fragment: string) => {
+        if (fragment && pythonProcess.stdin.writable) {
+          pythonProcess.stdin.write(fragment, 'utf8');
+        }
+      },
+      end: async () => {
+        if (pythonProcess.stdin.writable) pythonProcess.stdin.end();
+        const result = await finished;
+        if (result.success) {
+          this.logger.log(
+            `Speech stream finished: ${result.stream?.sentences} sentences, ` +
+              `first audio after ${result.stream?.first_audio_latency_s}s`,
+          );
+        } else {
+          this.logger.error(`Speech stream failed: ${result.error}`);
+        }
+        return result;
+      },
+    };
+  }
 
+  private async executeTTSScript(
+    text: string,
+    language: SupportedLanguage = 'en',
+    options: TTSOptions,
+  ): Promise<TTSResult> {
+    // Text is written to the script's stdin as UTF-8, which avoids both
+    // argument encoding issues and a temp file for Arabic text
+    const args = [
+      this.ttsPythonScriptPath,
+      '--file',
+      '-',
+      '--language',
+      language,
+      '--format',
+      'json',
+    ];
+
+    // Add Piper-specific parameters
+    if (options.speed) {
+      // Convert speed to length_scale (Piper's speed control)
+      const lengthScale = 1.0 / options.speed;
+      args.push('--length-scale', lengthScale.toString());
+    }
+
+    // Piper uses noise_scale instead of pitch
+    if (options.pitch) {
+      // Convert pitch (0-99) to noise_scale (0.0-1.0)
+      const noiseScale = options.pitch / 99.0;
+      args.push('--noise-scale', noiseScale.toString());
+    }
+
+    // Note: Piper doesn't have amplitude control - it's handled by the system
+
+    if (options.speaker !== undefined) {
+      args.push('--speaker', options.speaker.toString());
+    }
+
+    if (options.outputFile) args.push('--output', options.outputFile);
+    if (options.playDirectly) args.push('--play');
+    if (options.urgent) args.push('--urgent');
+    if (options.latencyTarget) {
+      args.push('--latency-target', options.latencyTarget.toString());
+    }
+
+    return this.runTTSProcess(args, text);
+  }
+
+  private async runTTSProcess(
+    args: string[],
+    input: string,
+  ): Promise<TTSResult> {
+    return new Promise((resolve, reject) => {
       // Set proper encoding for the spawn process
       const pythonProcess = spawn('python', args, {
         stdio: ['pipe', 'pipe', 'pipe'],
@@ -279,12 +618,12 @@ export class SpeechService {
         stderr += data.toString('utf8');
       });
 
-      pythonProcess.on('close', (code: number) => {
-        // Clean up temp file if created
-        if (tempFilePath) {
-          this.cleanupTempFile(tempFilePath);
-        }
+      pythonProcess.stdin.on('error', (error: Error) => {
+        this.logger.warn(`Failed to write TTS input: ${error.message}`);
+      });
+      pythonProcess.stdin.end(input, 'utf8');
 
+      pythonProcess.on('close', (code: number) => {
         if (code === 0) {
           try {
             const result = JSON.parse(stdout) as TTSResult;
@@ -304,41 +643,8 @@ export class SpeechService {
       });
 
       pythonProcess.on('error', (error: Error) => {
-        // Clean up temp file if created
-        if (tempFilePath) {
-          this.cleanupTempFile(tempFilePath);
-        }
         reject(new Error(`Failed to start TTS process: ${error.message}`));
       });
     });
   }
-
-  private containsArabicText(text: string): boolean {
-    const arabicRegex = /[\u0600-\u06FF]/;
-    return arabicRegex.test(text);
-  }
-
-  private createTempFile(text: string): string {
-    const tempDir = os.tmpdir();
-    const fileName = `tts_arabic_${Date.now()}_${Math.random().toString(36).substr(2, 9)}.txt`;
-    const filePath = path.join(tempDir, fileName);
-
-    try {
-      const utf8BOM = '\uFEFF';
-      fs.writeFileSync(filePath, utf8BOM + text, { encoding: 'utf8' });
-      return filePath;
-    } catch (error) {
-      throw new Error(`Failed to create temporary file: ${error.message}`);
-    }
-  }
-
-  private cleanupTempFile(filePath: string): void {
-    try {
-      if (fs.existsSync(filePath)) {
-        fs.unlinkSync(filePath);
-      }
-    } catch (error) {
-      console.warn(`Failed to cleanup temp file ${filePath}:`, error.message);
-    }
-  }
 }